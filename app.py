@@ -1,74 +1,60 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from ipos.db import init_db, db
-from model import Category, Product, Customer, Sale, SaleItem
-from datetime import datetime, timedelta
-from sqlalchemy import func, or_
-from sqlalchemy.orm import joinedload
+from ipos.checkout import checkout, checkout_batch, find_by_client_key, rejection, CheckoutError
+from model import Category, Product, Customer, Sale, phone_digits
+from ipos import rollups, export, inventory, bulk
+from ipos.inventory import InventoryError
+from ipos.pagination import keyset_query, parse_limit, CursorError
+from ipos.reports import ReportFilter, build_report, report_json
+from ipos.catalog_cache import catalog
+from ipos.metrics import metrics
+from ipos import search, migrations, images, serialize, sales_search, receipts, archive, analytics
+from ipos import replicas, live, jobs, customer_stats
+from ipos.customer_stats import CustomerFilter
+from ipos.jobs import JobError
+from ipos.sales_search import SalesFilter
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+import click
 import os
-from werkzeug.utils import secure_filename
-import io
-import xlsxwriter
+import time
 
 app = Flask(__name__)
+app.json = serialize.FastJSONProvider(app)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 init_db(app)
-
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+catalog.init_app(app)
+metrics.init_app(app)
+replicas.init_app(app)
+jobs.init_app(app)
 
 
 # ========================================
 # DASHBOARD
 # ========================================
 @app.route('/')
+@replicas.read_only
 def index():
-    total_sales = db.session.query(func.sum(Sale.total)).scalar() or 0
-    total_customers = Customer.query.count()
-    products_sold = db.session.query(func.sum(SaleItem.quantity)).scalar() or 0
-
-    this_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    revenue_month = db.session.query(func.sum(Sale.total))\
-        .filter(Sale.date >= this_month).scalar() or 0
-
-    qty_sum = func.coalesce(func.sum(SaleItem.quantity), 0).label('qty')
-    top_product = db.session.query(Product.name, qty_sum)\
-        .join(SaleItem, isouter=True)\
-        .group_by(Product.id)\
-        .order_by(qty_sum.desc())\
-        .first()
-    top_product_name = top_product.name if top_product else "N/A"
-
-    today = datetime.now()
-    this_week_start = today - timedelta(days=today.weekday())
-    last_week_start = this_week_start - timedelta(days=7)
-    last_week_end = this_week_start - timedelta(seconds=1)
-
-    sales_last_week = db.session.query(func.sum(Sale.total))\
-        .filter(Sale.date >= last_week_start, Sale.date <= last_week_end).scalar() or 0
-    sales_this_week = db.session.query(func.sum(Sale.total))\
-        .filter(Sale.date >= this_week_start).scalar() or 0
-
-    growth = 0
-    if sales_last_week > 0:
-        growth = round(((sales_this_week - sales_last_week) / sales_last_week) * 100, 1)
-
-    new_customers = db.session.query(Customer.id).join(Sale)\
-        .filter(Sale.date >= this_week_start).distinct().count()
-
-    return render_template('index.html',
-        total_sales=total_sales,
-        total_customers=total_customers,
-        products_sold=products_sold,
-        revenue_month=revenue_month,
-        top_product_name=top_product_name,
-        growth=growth,
-        new_customers=new_customers
-    )
+    return render_template('index.html', **live.figures())
+
+
+@app.route('/api/dashboard/stream')
+@replicas.read_only
+def api_dashboard_stream():
+    # Server-sent events: the figures, then a delta per sale (ipos/live.py).
+    # Each open stream holds one of this worker's threads; past the limit a
+    # viewer polls for snapshots instead.
+    if len(live.hub) >= live.max_streams():
+        frames = live.snapshot_once(live.poll_interval())
+    else:
+        frames = live.stream(live.resync_interval(), live.poll_interval())
+    resp = Response(stream_with_context(frames), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # nginx must not buffer the stream
+    return resp
 
 
 # ========================================
@@ -94,10 +80,12 @@ def api_category(id):
     if request.method == 'PUT':
         cat.name = request.json.get('name', cat.name)
         db.session.commit()
+        catalog.products.invalidate()  # category_name is part of each product
         return jsonify(cat.to_dict())
     elif request.method == 'DELETE':
         db.session.delete(cat)
         db.session.commit()
+        catalog.products.invalidate()
         return jsonify({"message": "Deleted"})
     return jsonify(cat.to_dict())
 
@@ -116,68 +104,148 @@ def api_products():
         file = request.files.get('image')
 
         image_filename = None
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_name = f"product_{int(datetime.utcnow().timestamp())}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-            file.save(file_path)
-            image_filename = unique_name
+        if file and file.filename and images.allowed_file(file.filename):
+            image_filename = images.store_upload(file, app.config['UPLOAD_FOLDER'])
 
         prod = Product(
             name=data['name'],
+            barcode=data.get('barcode') or None,
             price=float(data['price']),
-            stock=int(data.get('stock', 0)),
             description=data.get('description', ''),
             image=image_filename,
             category_id=data.get('category_id') or None
         )
         db.session.add(prod)
-        db.session.commit()
+        try:
+            db.session.flush()
+            inventory.open_stock({prod.id: int(data.get('stock') or 0)},
+                                 {prod.id: int(data.get('reorder_level') or 0)})
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"error": "Barcode already in use"}), 400
+        catalog.products.invalidate()
         return jsonify(prod.to_dict()), 201
 
-    return jsonify([p.to_dict() for p in Product.query.all()])
+    if request.args.get('stream'):
+        # Large catalogs: rows straight from the DB, never held in memory at once
+        return serialize.stream_array(serialize.products(chunk_size=serialize.STREAM_CHUNK))
+    return catalog.products.response()
+
+@app.route('/api/products/search')
+def api_product_search():
+    products = search.search_products(request.args.get('q'),
+                                      search.parse_limit(request.args.get('limit')))
+    return jsonify([p.to_dict() for p in products])
+
+@app.route('/api/products/barcode/<code>')
+def api_product_barcode(code):
+    prod = search.find_by_barcode(code)
+    if not prod:
+        return jsonify({"error": "Unknown barcode"}), 404
+    return jsonify(prod.to_dict())
 
 @app.route('/api/products/<int:id>', methods=['GET', 'PUT', 'DELETE'])
 def api_product(id):
+    if request.method == 'GET':
+        return catalog.products.response(id)
     prod = Product.query.get_or_404(id)
     if request.method == 'PUT':
         data = request.form.to_dict()
         file = request.files.get('image')
 
-        if file and file.filename and allowed_file(file.filename):
-            if prod.image:
-                old_path = os.path.join(app.config['UPLOAD_FOLDER'], prod.image)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-            filename = secure_filename(file.filename)
-            unique_name = f"product_{int(datetime.utcnow().timestamp())}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-            file.save(file_path)
-            prod.image = unique_name
+        old_image = prod.image
+        if file and file.filename and images.allowed_file(file.filename):
+            prod.image = images.store_upload(file, app.config['UPLOAD_FOLDER'])
         elif 'clear_image' in data:
-            if prod.image:
-                old_path = os.path.join(app.config['UPLOAD_FOLDER'], prod.image)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
             prod.image = None
 
         prod.name = data.get('name', prod.name)
+        prod.barcode = data.get('barcode', prod.barcode) or None
         prod.price = float(data.get('price', prod.price))
-        prod.stock = int(data.get('stock', prod.stock))
         prod.description = data.get('description', prod.description)
         prod.category_id = data.get('category_id', prod.category_id) or None
-        db.session.commit()
+        try:
+            # A stock figure from the form is a count: the ledger records
+            # the difference as an adjustment
+            if data.get('stock') not in (None, ''):
+                inventory.set_level(prod.id, data['stock'])
+            if data.get('reorder_level') not in (None, ''):
+                inventory.set_reorder_level(prod.id, data['reorder_level'])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"error": "Barcode already in use"}), 400
+        except (InventoryError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        catalog.products.invalidate()
+        if old_image != prod.image:
+            release_image(old_image)
         return jsonify(prod.to_dict())
 
     elif request.method == 'DELETE':
-        if prod.image:
-            img_path = os.path.join(app.config['UPLOAD_FOLDER'], prod.image)
-            if os.path.exists(img_path):
-                os.remove(img_path)
+        image = prod.image
         db.session.delete(prod)
+        inventory.forget(id)
         db.session.commit()
+        catalog.products.invalidate()
+        release_image(image)
         return jsonify({"message": "Deleted"})
-    return jsonify(prod.to_dict())
+
+def release_image(name):
+    # Uploads are content-addressed, so another product may share the file
+    if name:
+        images.release(name, app.config['UPLOAD_FOLDER'],
+                       Product.query.filter_by(image=name).count() > 0)
+
+@app.route('/media/<name>')
+def media(name):
+    return images.serve_original(name)
+
+@app.route('/media/thumbs/<name>')
+def media_thumb(name):
+    return images.serve_thumb(name)
+
+
+# ========================================
+# INVENTORY
+# ========================================
+@app.route('/api/inventory/movements', methods=['POST'])
+def api_stock_movement():
+    data = request.json or {}
+    try:
+        inventory.record(data.get('product_id'), data.get('kind'), data.get('quantity'),
+                         data.get('note'), data.get('sale_id'))
+        db.session.commit()
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"product_id": data['product_id'],
+                    "stock": inventory.level(data['product_id'])}), 201
+
+@app.route('/api/products/<int:id>/movements')
+def api_product_movements(id):
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = inventory.movements(id, request.args.get('before', type=int), limit)
+    return jsonify([m.to_dict() for m in rows])
+
+@app.route('/api/inventory/reorder')
+def api_reorder():
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify([{
+        "product_id": r.id,
+        "name": r.name,
+        "stock": r.quantity,
+        "reorder_level": r.reorder_level,
+        "shortfall": r.shortfall
+    } for r in inventory.low_stock(limit)])
 
 
 # ========================================
@@ -191,27 +259,97 @@ def customers():
 def api_customers():
     if request.method == 'POST':
         data = request.json
-        cust = Customer(name=data['name'], email=data.get('email'), phone=data.get('phone'))
+        cust = Customer(name=data['name'], email=data.get('email'), phone=data.get('phone'),
+                        phone_digits=phone_digits(data.get('phone')))
         db.session.add(cust)
         db.session.commit()
+        catalog.customers.invalidate()
         return jsonify(cust.to_dict()), 201
-    return jsonify([c.to_dict() for c in Customer.query.all()])
+    if request.args.get('stream'):
+        return serialize.stream_array(serialize.customers(chunk_size=serialize.STREAM_CHUNK))
+    return catalog.customers.response()
 
 @app.route('/api/customers/<int:id>', methods=['GET', 'PUT', 'DELETE'])
 def api_customer(id):
+    if request.method == 'GET':
+        return catalog.customers.response(id)
     cust = Customer.query.get_or_404(id)
     if request.method == 'PUT':
         data = request.json
         cust.name = data.get('name', cust.name)
         cust.email = data.get('email', cust.email)
         cust.phone = data.get('phone', cust.phone)
+        cust.phone_digits = phone_digits(cust.phone)
         db.session.commit()
+        catalog.customers.invalidate()
         return jsonify(cust.to_dict())
     elif request.method == 'DELETE':
+        customer_stats.forget(id)
         db.session.delete(cust)
         db.session.commit()
+        catalog.customers.invalidate()
         return jsonify({"message": "Deleted"})
-    return jsonify(cust.to_dict())
+
+@app.route('/api/customers/stats')
+@replicas.read_only
+def api_customers_stats():
+    # Customers who have bought anything, by lifetime value, order count or
+    # last purchase, through the customer_stats indexes
+    try:
+        f = CustomerFilter.from_args(request.args)
+        rows, next_cursor = customer_stats.ranked(
+            f, request.args.get('sort', 'total_spent'), request.args.get('order', 'desc') != 'asc',
+            request.args.get('cursor'), parse_limit(request.args.get('limit')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"customers": rows, "next_cursor": next_cursor})
+
+@app.route('/api/customers/<int:id>/stats')
+def api_customer_stats(id):
+    stats = customer_stats.stats(id)
+    if stats is None:
+        return jsonify({"error": "Customer not found"}), 404
+    return jsonify(stats)
+
+@app.route('/api/customers/<int:id>/sales')
+def api_customer_sales(id):
+    try:
+        sales, next_cursor = customer_stats.sales(id, request.args.get('cursor'),
+                                                  parse_limit(request.args.get('limit')))
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"sales": sales, "next_cursor": next_cursor})
+
+
+# ========================================
+# CATALOG IMPORT / EXPORT
+# ========================================
+CATALOG_CACHES = {"products": catalog.products, "customers": catalog.customers}
+
+@app.route('/api/<any(products, customers):kind>/import', methods=['POST'])
+def api_catalog_import(kind):
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or (
+        bulk.guess_format(upload.filename, upload.mimetype) if upload
+        else bulk.guess_format(mimetype=request.mimetype))
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    stream = bulk.text_stream(upload.stream if upload else request.stream)
+    result = bulk.import_rows(kind, stream, fmt)
+    CATALOG_CACHES[kind].invalidate()
+    return jsonify(result.to_dict())
+
+@app.route('/api/<any(products, customers):kind>/export')
+@replicas.read_only
+def api_catalog_export(kind):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    return Response(
+        stream_with_context(bulk.iter_export(kind, fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'application/jsonl',
+        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+    )
 
 
 # ========================================
@@ -225,66 +363,63 @@ def billing():
 def api_sales():
     if request.method == 'POST':
         data = request.json
-        customer_id = data.get('customer_id')
-        items = data.get('items', [])
-        if not items:
-            return jsonify({"error": "No items"}), 400
-
-        total = 0
-        for item in items:
-            product = Product.query.get(item['product_id'])
-            if not product:
-                return jsonify({"error": "Product not found"}), 400
-            if product.stock < item['quantity']:
-                return jsonify({"error": f"Only {product.stock} {product.name} in stock"}), 400
-            total += product.price * item['quantity']
-            product.stock -= item['quantity']  # DEDUCT STOCK
-
-        sale = Sale(
-            customer_id=customer_id,
-            total=total,
-            date=datetime.utcnow()
-        )
-        db.session.add(sale)
-        db.session.flush()
-
-        for item in items:
-            sale_item = SaleItem(
-                sale_id=sale.id,
-                product_id=item['product_id'],
-                quantity=item['quantity'],
-                price=item['price']
-            )
-            db.session.add(sale_item)
+        # A till retrying after a timeout resends the same key
+        existing = find_by_client_key(data.get('client_key'))
+        if existing:
+            return jsonify({"id": existing.id, "total": existing.total})
+        try:
+            sale = checkout(data.get('customer_id'), data.get('items', []),
+                            data.get('client_key'), data.get('date'))
+        except CheckoutError as e:
+            return jsonify({"error": str(e)}), 400
+        except IntegrityError as e:
+            # A concurrent retry committed the same key first, or a bad
+            # reference such as an unknown customer_id
+            sale = find_by_client_key(data.get('client_key'))
+            if not sale:
+                return jsonify({"error": rejection(e)}), 400
+        else:
+            receipts.store_after_checkout([sale.id])
+        return jsonify({"id": sale.id, "total": sale.total}), 201
+
+    # GET: one newest-first page, optionally narrowed to a customer/date
+    # range, continuing into archived months (those come without items)
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        query = serialize.sale_query()
+        customer_id = request.args.get('customer_id', type=int)
+        if customer_id is not None:
+            query = query.filter(Sale.customer_id == customer_id)
+        start, end = archive.date_bounds(request.args.get('from_date'), request.args.get('to_date'))
+        if start:
+            query = query.filter(Sale.date >= start)
+        if end:
+            query = query.filter(Sale.date <= end)
+        rows = keyset_query(query, Sale.date, Sale.id, cursor, limit).all()
+        archived = archive.sales_page(archive.archive_dir(), start, end, cursor, limit,
+                                      customer_id=customer_id)
+        sales, next_cursor = archive.merged_page(rows, archived, limit)
+    except (ValueError, CursorError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        app.logger.exception("Could not load sales page")
+        return jsonify([]), 500
 
-        db.session.commit()
-        return jsonify({"id": sale.id, "total": total}), 201
+    response = jsonify(serialize.sale_rows(sales))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
-    # GET: return all sales
+@app.route('/api/sales/batch', methods=['POST'])
+def api_sales_batch():
+    sales = (request.json or {}).get('sales', [])
     try:
-        sales = Sale.query.options(
-            joinedload(Sale.customer),
-            joinedload(Sale.items).joinedload(SaleItem.product)
-        ).order_by(Sale.date.desc()).all()
-
-        return jsonify([{
-            "id": s.id,
-            "date": s.date.strftime("%Y-%m-%d %H:%M:%S"),
-            "total": float(s.total),
-            "customer_id": s.customer.id if s.customer else None,
-            "customer_name": s.customer.name if s.customer else "Walk-in",
-            "items": [{
-                "product_name": item.product.name,
-                "quantity": item.quantity,
-                "price": float(item.price)
-            } for item in s.items]
-        } for s in sales])
-    
-    except Exception as e:
-        print("API SALES ERROR:", e)
-        import traceback
-        traceback.print_exc()
-        return jsonify([]), 500
+        results = checkout_batch(sales)
+    except CheckoutError as e:
+        return jsonify({"error": str(e)}), 400
+    receipts.store_after_checkout([r['id'] for r in results if r['status'] == 'created'])
+    return jsonify({"results": results})
 
 @app.route('/api/sales/<int:id>')
 def api_sale(id):
@@ -293,206 +428,281 @@ def api_sale(id):
 
 @app.route('/sales')
 def sales():
-    query = Sale.query.options(
-        joinedload(Sale.items).joinedload(SaleItem.product),
-        joinedload(Sale.customer)
-    )
-
-    search = request.args.get('q')
-    if search:
-        search = search.strip()
-        try:
-            order_id = int(search)
-            query = query.filter(Sale.id == order_id)
-        except ValueError:
-            query = query.join(Sale.customer).filter(
-                Customer.name.ilike(f'%{search}%')
-            )
-
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    if start_date:
-        query = query.filter(Sale.date >= start_date)
-    if end_date:
-        query = query.filter(Sale.date <= end_date + " 23:59:59")
-
-    sales = query.order_by(Sale.date.desc()).all()
-    sales_list = [s.to_dict() for s in sales]
-    total_income = sum(s.get('total', 0) for s in sales_list)
+    try:
+        f = SalesFilter.from_args(request.args)
+        rows, next_cursor = sales_search.search_page(f, request.args.get('cursor'))
+    except (ValueError, CursorError):
+        return "Invalid search", 400
+    summary = sales_search.totals(f)
 
     return render_template(
         'sales.html',
-        sales=sales_list,
-        total_income=total_income,
-        start_date=start_date or '',
-        end_date=end_date or '',
-        search_query=search or ''
+        sales=[sales_search.sale_row(s) for s in rows],
+        sale_count=summary['sale_count'],
+        total_income=summary['total_income'],
+        next_cursor=next_cursor,
+        start_date=f.start_date or '',
+        end_date=f.end_date or '',
+        search_query=f.q or '',
+        product_query=f.product or '',
+        min_total=request.args.get('min_total', ''),
+        max_total=request.args.get('max_total', '')
     )
 
+@app.route('/api/sales/search')
+def api_sales_search():
+    try:
+        f = SalesFilter.from_args(request.args)
+        rows, next_cursor = sales_search.search_page(f, request.args.get('cursor'),
+                                                     parse_limit(request.args.get('limit')))
+    except (ValueError, CursorError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"sales": [sales_search.sale_row(s) for s in rows],
+                    "next_cursor": next_cursor, **sales_search.totals(f)})
+
 @app.route('/sale/<int:id>')
 def sale_detail(id):
-    sale = Sale.query.get_or_404(id)
+    sale = receipts.load(id)
+    if sale is None:
+        return "Sale not found", 404
     return render_template('sale_detail.html', sale=sale)
 
 @app.route('/receipt/<int:sid>')
 def receipt(sid):
-    sale = Sale.query.options(
-        db.joinedload(Sale.items).joinedload(SaleItem.product),
-        db.joinedload(Sale.customer)
-    ).get_or_404(sid)
-    return render_template('receipt.html', sale=sale)
+    return receipts.serve(sid, 'html')
+
+@app.route('/receipt/<int:sid>/<any(txt, escpos, pdf):fmt>')
+def receipt_file(sid, fmt):
+    return receipts.serve(sid, fmt)
 
 
 # ========================================
 # REPORTS & EXPORT
 # ========================================
 @app.route('/reports')
+@replicas.read_only
 def reports():
-    from_date = request.args.get('from_date')
-    to_date = request.args.get('to_date')
-    product_id = request.args.get('product_id')
-
-    query = Sale.query.options(db.joinedload(Sale.items).joinedload(SaleItem.product))
-    if from_date:
-        query = query.filter(Sale.date >= from_date)
-    if to_date:
-        query = query.filter(Sale.date <= to_date + " 23:59:59")
-    sales = query.order_by(Sale.date.desc()).all()
-    sales_list = [s.to_dict() for s in sales]
-    total_income = sum(sale.get('total', 0) for sale in sales_list)
-
-    prod_query = db.session.query(
-        Product.name,
-        func.sum(SaleItem.quantity).label('total_qty'),
-        func.sum(SaleItem.quantity * SaleItem.price).label('total_sales')
-    ).join(SaleItem).join(Sale)
-
-    if from_date:
-        prod_query = prod_query.filter(Sale.date >= from_date)
-    if to_date:
-        prod_query = prod_query.filter(Sale.date <= to_date + " 23:59:59")
-    if product_id:
-        prod_query = prod_query.filter(Product.id == product_id)
-
-    product_sales = prod_query.group_by(Product.id).all()
+    try:
+        f = ReportFilter.from_args(request.args)
+        report = build_report(f, request.args.get('cursor'),
+                              parse_limit(request.args.get('limit')))
+    except (ValueError, CursorError):
+        return "Invalid report filter", 400
 
     return render_template(
         'reports.html',
-        sales=sales_list,
-        total_income=total_income,
-        product_sales=product_sales,
-        products=Product.query.all(),
-        from_date=from_date,
-        to_date=to_date,
-        selected_product=product_id
+        sales=report['sales'],
+        total_income=report['total_income'],
+        product_sales=report['product_sales'],
+        products=report['products'],
+        daily=report['daily'],
+        next_cursor=report['next_cursor'],
+        from_date=f.from_date,
+        to_date=f.to_date,
+        selected_product=f.product_id
     )
 
 @app.route('/api/reports')
+@replicas.read_only
 def api_reports():
-    from_date = request.args.get('from_date')
-    to_date = request.args.get('to_date')
-    product_id = request.args.get('product_id')
+    try:
+        f = ReportFilter.from_args(request.args)
+        report = build_report(f, request.args.get('cursor'),
+                              parse_limit(request.args.get('limit')))
+    except (ValueError, CursorError) as e:
+        return jsonify({"error": str(e)}), 400
 
-    # === SALES QUERY ===
-    sales_query = Sale.query.options(
-        joinedload(Sale.customer),
-        joinedload(Sale.items).joinedload(SaleItem.product)
-    )
-    if from_date:
-        sales_query = sales_query.filter(Sale.date >= from_date)
-    if to_date:
-        sales_query = sales_query.filter(Sale.date <= to_date + " 23:59:59")
-    sales = sales_query.order_by(Sale.date.desc()).all()
-
-    # === PRODUCT BREAKDOWN ===
-    prod_query = db.session.query(
-        Product.name,
-        func.coalesce(func.sum(SaleItem.quantity), 0).label('qty'),
-        func.coalesce(func.sum(SaleItem.quantity * SaleItem.price), 0).label('revenue')
-    ).join(SaleItem).join(Sale)
-    if from_date:
-        prod_query = prod_query.filter(Sale.date >= from_date)
-    if to_date:
-        prod_query = prod_query.filter(Sale.date <= to_date + " 23:59:59")
-    if product_id:
-        prod_query = prod_query.filter(Product.id == int(product_id))
-    product_sales = prod_query.group_by(Product.id).all()
-
-    # === ALL PRODUCTS FOR FILTER ===
-    products = Product.query.all()
-
-    return jsonify({
-        "sales": [{
-            "id": s.id,
-            "date": s.date.strftime("%Y-%m-%d") if s.date else "No Date",
-            "customer_name": s.customer.name if s.customer else "Walk-in",
-            "total": float(s.total),
-            "customer_id": s.customer.id if s.customer else None
-        } for s in sales],
-        "product_sales": [
-            [ps.name, int(ps.qty), round(float(ps.revenue), 2)]
-            for ps in product_sales
-        ],
-        "products": [{"id": p.id, "name": p.name} for p in products]
-    })
+    return jsonify(report_json(report))
+
+@app.route('/api/analytics/<any("category-weekly", hourly, baskets, cohorts):name>')
+@replicas.read_only
+def api_analytics(name):
+    try:
+        result = analytics.report(name, request.args.get('from_date'), request.args.get('to_date'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(result)
 
 @app.route('/export_excel')
+@replicas.read_only
 def export_excel():
     from_date = request.args.get('from_date')
     to_date = request.args.get('to_date')
     product_id = request.args.get('product_id')
+    rows = export.export_rows(from_date, to_date, product_id)
+    stamp = datetime.now().strftime('%Y%m%d')
+
+    if request.args.get('format') == 'csv':
+        return Response(
+            stream_with_context(export.iter_csv(rows)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=sales_report_{stamp}.csv'}
+        )
 
-    query = Sale.query.options(db.joinedload(Sale.items).joinedload(SaleItem.product))
-    if from_date:
-        query = query.filter(Sale.date >= from_date)
-    if to_date:
-        query = query.filter(Sale.date <= to_date + " 23:59:59")
-    if product_id:
-        query = query.filter(Sale.items.any(SaleItem.product_id == int(product_id)))
-    sales = query.order_by(Sale.date.desc()).all()
-
-    rows = []
-    for sale in sales:
-        for item in sale.items:
-            rows.append({
-                'date': sale.date.strftime('%Y-%m-%d'),
-                'product': item.product.name,
-                'customer': sale.customer.name if sale.customer else 'Walk-in',
-                'quantity': item.quantity,
-                'total': item.quantity * item.price
-            })
-
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-    worksheet = workbook.add_worksheet('Sales Report')
-
-    bold = workbook.add_format({'bold': True, 'bg_color': '#E0F7FA'})
-    money = workbook.add_format({'num_format': '$#,##0.00'})
-
-    headers = ['Date', 'Product', 'Customer', 'Quantity', 'Total']
-    for col, h in enumerate(headers):
-        worksheet.write(0, col, h, bold)
-
-    for r, row in enumerate(rows, start=1):
-        worksheet.write(r, 0, row['date'])
-        worksheet.write(r, 1, row['product'])
-        worksheet.write(r, 2, row['customer'])
-        worksheet.write(r, 3, row['quantity'])
-        worksheet.write(r, 4, row['total'], money)
-
-    total_income = sum(row['total'] for row in rows)
-    worksheet.write(r + 2, 3, 'Total Income:', bold)
-    worksheet.write(r + 2, 4, total_income, money)
-
-    workbook.close()
-    output.seek(0)
-
-    return send_file(
-        output,
+    path = export.write_xlsx(rows)
+    response = send_file(
+        path,
         as_attachment=True,
-        download_name=f"sales_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+        download_name=f"sales_report_{stamp}.xlsx",
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
+    response.call_on_close(lambda: os.remove(path))
+    return response
+
+@app.route('/api/jobs/<any(report, export):kind>', methods=['POST'])
+def api_jobs_submit(kind):
+    # Same filters as /api/reports and /export_excel, as JSON or query args;
+    # an identical job already in flight is returned instead of a new one
+    try:
+        job = jobs.submit(kind, request.get_json(silent=True) or request.args)
+    except JobError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(job), 202, {'Location': f"/api/jobs/{job['id']}"}
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] == 'done':
+        job['result_url'] = f"/api/jobs/{job_id}/result"
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    found = jobs.artifact(job_id)
+    if found is None:
+        job = jobs.status(job_id)
+        if job is not None and job['status'] in ('queued', 'running'):
+            return jsonify(job), 202, {'Retry-After': '1'}
+        return jsonify({"error": "Result not found or expired"}), 404
+    path, filename, mimetype = found
+    return send_file(path, as_attachment=True, download_name=filename, mimetype=mimetype)
+
+
+# ========================================
+# CLI
+# ========================================
+@app.cli.command('db-upgrade')
+def db_upgrade():
+    """Apply pending schema migrations."""
+    applied = migrations.upgrade(db.engine)
+    print(f"Schema at version {migrations.head()}" + ("" if applied else " (nothing to do)"))
+
+@app.cli.command('db-version')
+def db_version():
+    """Show the applied and the expected schema version."""
+    with db.engine.connect() as conn:
+        print(f"database: {migrations.current_version(conn)}  code: {migrations.head()}")
+
+@app.cli.command('build-thumbnails')
+def build_thumbnails():
+    """Generate missing thumbnail/WebP variants for existing product images."""
+    names = [name for (name,) in db.session.query(Product.image)
+             .filter(Product.image.isnot(None)).distinct()]
+    count = images.backfill(app.config['UPLOAD_FOLDER'], names)
+    print(f"Processed {count} product images")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Rebuild dashboard rollup and customer stats tables from existing sales."""
+    days, products = rollups.rebuild()
+    customers = customer_stats.rebuild()
+    print(f"Rebuilt {days} daily, {products} product and {customers} customer summaries")
+
+@app.cli.command('stock-snapshot')
+def stock_snapshot():
+    """Snapshot stock levels from the inventory ledger."""
+    print(f"Snapshotted {inventory.snapshot()} stock levels")
+
+@app.cli.command('stock-check')
+@click.option('--fix', is_flag=True, help='Reset drifted levels to the ledger.')
+def stock_check(fix):
+    """Compare stock levels with the inventory ledger."""
+    drift = inventory.check(fix)
+    for product_id, level, ledger in drift:
+        print(f"product {product_id}: level {level}, ledger {ledger}")
+    print(f"{len(drift)} products out of step" + (" (fixed)" if fix and drift else ""))
+
+@app.cli.command('import-catalog')
+@click.argument('kind', type=click.Choice(['products', 'customers']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS),
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', type=int, default=bulk.BATCH_SIZE, show_default=True)
+def import_catalog(kind, path, fmt, batch_size):
+    """Bulk insert or update products or customers from CSV or JSON lines."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        result = bulk.import_rows(kind, f, fmt or bulk.guess_format(path), batch_size)
+    CATALOG_CACHES[kind].invalidate()
+    for error in result.errors:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"{result.rows} rows: {result.inserted} inserted, {result.updated} updated, "
+          f"{result.rejected} rejected")
+
+@app.cli.command('export-catalog')
+@click.argument('kind', type=click.Choice(['products', 'customers']))
+@click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), default='csv', show_default=True)
+def export_catalog(kind, output, fmt):
+    """Write every product or customer as CSV or JSON lines."""
+    for chunk in bulk.iter_export(kind, fmt):
+        output.write(chunk)
+
+@app.cli.command('replica-status')
+def replica_status():
+    """Show how far behind the primary each read replica is."""
+    for url, lag in replicas.status():
+        print(f"{url}: " + (f"{lag:.1f}s behind" if lag is not None else "unavailable"))
+    print(f"Reports read from replicas up to {replicas.max_lag():g}s behind")
+
+@app.cli.command('replica-sync')
+@click.option('--every', type=float, default=None, help='Keep copying, every N seconds.')
+def replica_sync(every):
+    """Copy a SQLite primary into SQLite replicas (local replica testing)."""
+    while True:
+        try:
+            copied = replicas.sync_sqlite()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f"Copied the primary to {copied} replicas")
+        if not every:
+            break
+        time.sleep(every)
+
+@app.cli.command('jobs-worker')
+@click.option('--workers', type=int, default=jobs.DEFAULT_WORKERS, help='Worker threads.')
+def jobs_worker(workers):
+    """Run report and export jobs in this process until interrupted."""
+    jobs.start(app, workers)
+    print(f"Running {workers} job workers; Ctrl+C to stop")
+    while True:
+        time.sleep(3600)
+
+@app.cli.command('jobs-sweep')
+def jobs_sweep():
+    """Requeue jobs whose worker died and delete expired results."""
+    print(f"Deleted {jobs.sweep()} expired jobs")
+
+@app.cli.command('archive-sales')
+@click.option('--keep-months', type=int, default=None,
+              help='Closed months to keep in the live tables (default ARCHIVE_KEEP_MONTHS).')
+def archive_sales(keep_months):
+    """Move closed months of sales into the Parquet archive."""
+    if keep_months is None:
+        keep_months = app.config.get('ARCHIVE_KEEP_MONTHS', archive.KEEP_MONTHS)
+    moved = archive.archive_closed_months(keep_months)
+    catalog.invalidate('sales')
+    print(f"Archived {moved} sales; live tables keep the last {keep_months} closed months")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create and refill the product search index."""
+    search.rebuild_index()
+    print("Product search index rebuilt")
 
 
 if __name__ == '__main__':
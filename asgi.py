@@ -0,0 +1,18 @@
+# asgi.py
+#
+# ASGI entry point. GET /api/products, GET /api/reports and the dashboard
+# stream are served by ipos/aio.py on an async database driver; every other
+# route runs in the Flask app on a pool of THREADS threads per worker.
+#
+#   pip install uvicorn a2wsgi aiosqlite      # aiomysql for MySQL
+#   POS_PROFILE=production uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+#
+# Start one uvicorn worker per WORKERS of the profile; the thread count is
+# read here.
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app
+from ipos.aio import AsyncAPI
+from ipos.config import server_sizing
+
+_, threads = server_sizing()
+app = AsyncAPI(flask_app, WSGIMiddleware(flask_app, workers=threads))
@@ -0,0 +1,71 @@
+# bench/analytics.py
+#
+# Time of each /api/analytics report over a synthetic store: loading the
+# line items into Arrow, each vectorized report on top, and, for
+# comparison, the category x week report as a row-at-a-time ORM scan.
+#
+#   python -m bench.storebench generate --scale medium --db /tmp/medium.db
+#   python bench/analytics.py --uri sqlite:////tmp/medium.db
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import joinedload
+from bench.storebench import synthetic
+from ipos.db import db
+from ipos import analytics
+from model import Product, SaleItem
+
+
+def orm_category_weekly():
+    cells = defaultdict(float)
+    query = SaleItem.query.options(joinedload(SaleItem.sale),
+                                   joinedload(SaleItem.product).joinedload(Product.category))
+    for item in query.yield_per(5000):
+        week = (item.sale.date - timedelta(days=item.sale.date.weekday())).date()
+        name = item.product.category.name if item.product.category else "Uncategorized"
+        cells[name, week] += item.quantity * item.price
+    return len(cells)
+
+
+def timed(fn):
+    db.session.remove()
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", help="existing synthetic store to use instead of seeding")
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--skip-orm", action="store_true", help="skip the slow ORM baseline")
+    args = parser.parse_args()
+
+    uri = args.uri
+    if not uri:
+        uri = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "analytics.db")
+        print(f"seeding {uri}")
+        synthetic.generate(uri, categories=50, products=20000, customers=200000,
+                           items=args.items, echo=lambda *a: None)
+
+    app = synthetic.make_app(uri)
+    with app.app_context():
+        items, load = timed(analytics.line_items)
+        print(f"{'load':<16}{items.num_rows:>10} line items {load:>8.2f}s")
+        for name, report in analytics.REPORTS.items():
+            _, elapsed = timed(lambda: report(items))
+            print(f"{name:<16}{'':>21}{elapsed:>8.2f}s")
+        if not args.skip_orm:
+            _, elapsed = timed(orm_category_weekly)
+            print(f"{'orm scan':<16}{'category-weekly':>21}{elapsed:>8.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# bench/async_reports.py
+#
+# Checkout latency with and without heavy reports running at the same time,
+# served by gunicorn (wsgi.py, all routes on worker threads) and by uvicorn
+# (asgi.py, reports on the async engine). Both get the same workers/threads.
+#
+#   python -m bench.storebench generate --scale small --db /tmp/store.db
+#   python bench/async_reports.py --db /tmp/store.db --report-clients 16
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.storebench.load import Dataset, scenario, percentile, working_copy, _free_port, _request
+
+SERVERS = {
+    "wsgi": lambda port: ["gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+                          "--log-level", "warning", "wsgi:app"],
+    "asgi": lambda port: ["uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"],
+}
+
+
+def start(mode, uri, threads):
+    port = _free_port()
+    env = dict(os.environ, POS_DATABASE_URL=uri, POS_WORKERS="1", POS_THREADS=str(threads))
+    env.setdefault("POS_PROFILE", "local" if uri.startswith("sqlite") else "production")
+    proc = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=env)
+    for _ in range(300):
+        try:
+            _request(port, "GET", "/metrics", None, timeout=5)
+            return proc, port
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"{mode} server did not start")
+
+
+def measure(port, data, checkout_clients, report_clients, duration):
+    latencies, reports = [], []
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def client(name, n, out):
+        rnd = random.Random(n)
+        while not stop.is_set():
+            method, path, body = scenario(name, data, rnd)
+            if name == "reports":
+                # The whole history: the heaviest report a manager can ask for
+                path = f"/api/reports?from_date={data.first}&to_date={data.last}"
+            start = time.perf_counter()
+            status, _ = _request(port, method, path, body)
+            with lock:
+                out.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=("checkout", n, latencies))
+               for n in range(checkout_clients)]
+    threads += [threading.Thread(target=client, args=("reports", 100 + n, reports))
+                for n in range(report_clients)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return latencies, reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="synthetic store from bench.storebench")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--checkout-clients", type=int, default=4)
+    parser.add_argument("--report-clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    args = parser.parse_args()
+
+    uri = args.db if "://" in args.db else "sqlite:///" + os.path.abspath(args.db)
+    data = Dataset(uri)
+    print(f"{'server':<6}{'reports':>9}{'checkouts':>11}{'p50 ms':>9}{'p99 ms':>9}{'reports/s':>11}")
+    for mode in SERVERS:
+        for report_clients in (0, args.report_clients):
+            copy, tmp = working_copy(uri)
+            proc, port = start(mode, copy, args.threads)
+            try:
+                lat, reps = measure(port, data, args.checkout_clients, report_clients, args.duration)
+            finally:
+                proc.terminate()
+                proc.wait()
+                if tmp:
+                    shutil.rmtree(tmp, ignore_errors=True)
+            print(f"{mode:<6}{report_clients:>9}{len(lat):>11}{percentile(lat, 50):>9.1f}"
+                  f"{percentile(lat, 99):>9.1f}{len(reps) / args.duration:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
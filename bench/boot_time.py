@@ -0,0 +1,62 @@
+# bench/boot_time.py
+#
+# Compares the schema work a worker does on boot: the old db.create_all()
+# (one existence check per table) against migrations.verify() (a single
+# SELECT MAX(version)). Each round uses a fresh engine, as a new worker
+# process would.
+#
+#   POS_DATABASE_URL=mysql+pymysql://... python bench/boot_time.py
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import create_engine
+from ipos import migrations
+import model
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    uri = os.environ.get("POS_DATABASE_URL") or \
+        "sqlite:///" + os.path.join(tempfile.mkdtemp(), "boot.db")
+    migrations.upgrade(create_engine(uri), echo=lambda msg: None)
+
+    app = Flask(__name__)
+    app.logger.setLevel(logging.ERROR)
+
+    def old_boot():
+        engine = create_engine(uri)
+        model.db.metadata.create_all(engine)  # every table the models define
+        engine.dispose()
+
+    def new_boot():
+        engine = create_engine(uri)
+        migrations.verify(app, engine)
+        engine.dispose()
+
+    for name, fn in (("create_all", old_boot), ("verify", new_boot)):
+        median, worst = timed(fn, args.rounds)
+        print(f"{name:>10}: median={median:.2f}ms  max={worst:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# bench/catalog_import.py
+#
+# Time of a bulk catalog import: a supplier file of --products SKUs loaded
+# with ipos.bulk (batched upserts), loaded again (every row an update), and
+# exported back. For comparison, a sample is created the old way, one
+# product and one commit per row as POST /api/products does, and
+# extrapolated to the full file.
+#
+#   python bench/catalog_import.py --products 50000
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.storebench import synthetic
+from ipos.db import db
+from ipos import bulk, inventory, migrations
+from model import Product
+
+
+def supplier_csv(products, categories=50, seed=42):
+    rnd = random.Random(seed)
+    buf = io.StringIO()
+    buf.write("barcode,name,price,stock,reorder_level,category,description\n")
+    for i in range(1, products + 1):
+        buf.write(f"{4000000000000 + i},Item {i},{rnd.uniform(1, 200):.2f},{rnd.randint(0, 500)},"
+                  f"{rnd.randint(0, 20)},Range {rnd.randint(1, categories)},Supplier SKU {i}\n")
+    return buf.getvalue()
+
+
+def one_by_one(data, limit):
+    rows = data.splitlines()[1:limit + 1]
+    start = time.perf_counter()
+    for line in rows:
+        barcode, name, price, stock, reorder, _, description = line.split(',')
+        prod = Product(name=name, barcode=f"x{barcode}", price=float(price), description=description)
+        db.session.add(prod)
+        db.session.flush()
+        inventory.open_stock({prod.id: int(stock)}, {prod.id: int(reorder)})
+        db.session.commit()
+    return (time.perf_counter() - start) / len(rows)
+
+
+def timed(fn):
+    db.session.remove()
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=bulk.BATCH_SIZE)
+    parser.add_argument("--sample", type=int, default=1000, help="rows for the one-by-one baseline")
+    args = parser.parse_args()
+
+    uri = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "catalog.db")
+    app = synthetic.make_app(uri)
+    data = supplier_csv(args.products)
+    with app.app_context():
+        migrations.upgrade(db.engine, echo=lambda *a: None)
+
+        for label in ("import", "re-import"):
+            result, elapsed = timed(lambda: bulk.import_rows(
+                'products', io.StringIO(data), 'csv', args.batch_size))
+            print(f"{label:<12}{result.inserted:>8} inserted {result.updated:>8} updated "
+                  f"{result.rejected:>4} rejected {elapsed:>8.2f}s")
+
+        size, elapsed = timed(lambda: sum(len(c) for c in bulk.iter_export('products', 'csv')))
+        print(f"{'export':<12}{size / 1e6:>8.1f} MB {'':>26}{elapsed:>8.2f}s")
+
+        per_row = one_by_one(data, args.sample)
+        print(f"{'one by one':<12}{args.sample:>8} rows, {per_row * 1000:.2f} ms/row "
+              f"-> {per_row * args.products:.1f}s for {args.products}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# bench/checkout_concurrency.py
+#
+# Runs many parallel checkouts against one SKU and checks that stock never
+# goes negative and that sold units match successful sales. The old
+# read-modify-write path is run alongside for comparison.
+#
+#   python bench/checkout_concurrency.py --tills 16 --sales 2000 --stock 1000 --cart 5
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+from ipos.db import db
+from ipos import inventory
+from ipos.checkout import checkout, CheckoutError
+from model import Product, Sale, SaleItem, StockLevel
+
+
+def legacy_checkout(customer_id, items):
+    # The pre-engine api_sales() POST body, kept here as the baseline
+    total = 0
+    for item in items:
+        product = db.session.get(Product, item['product_id'])
+        level = db.session.get(StockLevel, item['product_id'])
+        if level.quantity < item['quantity']:
+            raise CheckoutError(f"Only {level.quantity} {product.name} in stock")
+        total += product.price * item['quantity']
+        level.quantity -= item['quantity']
+    sale = Sale(customer_id=customer_id, total=total)
+    db.session.add(sale)
+    db.session.flush()
+    for item in items:
+        db.session.add(SaleItem(sale_id=sale.id, product_id=item['product_id'],
+                                quantity=item['quantity'], price=item['price']))
+    db.session.commit()
+    return sale
+
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}} \
+        if uri.startswith("sqlite") else {}
+    db.init_app(app)
+    return app
+
+
+def run(app, fn, tills, sales, stock, cart_size):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        prod = Product(name="Hot SKU", price=9.99)
+        others = [Product(name=f"SKU {i}", price=1.5) for i in range(cart_size - 1)]
+        db.session.add(prod)
+        db.session.add_all(others)
+        db.session.flush()
+        inventory.open_stock(dict([(prod.id, stock)] + [(p.id, sales * 10) for p in others]))
+        db.session.commit()
+        product_id = prod.id
+        cart = [{"product_id": p.id, "quantity": 1, "price": p.price}
+                for p in [prod] + others]
+
+    ok = rejected = errors = 0
+    lock = threading.Lock()
+
+    def one_sale(_):
+        nonlocal ok, rejected, errors
+        with app.app_context():
+            try:
+                fn(None, cart)
+                outcome = 'ok'
+            except CheckoutError:
+                db.session.rollback()
+                outcome = 'rejected'
+            except Exception:
+                db.session.rollback()
+                outcome = 'error'
+        with lock:
+            if outcome == 'ok':
+                ok += 1
+            elif outcome == 'rejected':
+                rejected += 1
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=tills) as pool:
+        list(pool.map(one_sale, range(sales)))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        left = db.session.get(Product, product_id).stock
+        sold = db.session.query(func.coalesce(func.sum(SaleItem.quantity), 0))\
+            .filter(SaleItem.product_id == product_id).scalar()
+    return {
+        "ok": ok, "rejected": rejected, "errors": errors,
+        "stock_left": left, "units_sold": sold,
+        "oversold": max(0, sold - stock),
+        "consistent": left >= 0 and left + sold == stock,
+        "checkouts_per_sec": round(sales / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tills", type=int, default=16)
+    parser.add_argument("--sales", type=int, default=2000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--cart", type=int, default=5, help="lines per sale")
+    parser.add_argument("--uri", help="database URI (default: temp SQLite file)")
+    args = parser.parse_args()
+
+    uri = args.uri or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = make_app(uri)
+
+    for name, fn in (("legacy", legacy_checkout), ("engine", checkout)):
+        result = run(app, fn, args.tills, args.sales, args.stock, args.cart)
+        print(f"{name:>7}: " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == '__main__':
+    main()
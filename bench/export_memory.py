@@ -0,0 +1,96 @@
+# bench/export_memory.py
+#
+# Seeds a SQLite database with N sale items and measures peak RSS of the
+# streaming xlsx and CSV exports, each in a fresh subprocess so the numbers
+# are not polluted by seeding.
+#
+#   python bench/export_memory.py --items 1000000
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from ipos.db import db
+from model import Product, Customer, Sale, SaleItem
+
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    db.init_app(app)
+    return app
+
+
+def seed(app, items, per_sale=4, batch=20000):
+    rnd = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(Product), [
+            {"name": f"Product {i}", "price": round(rnd.uniform(1, 500), 2)}
+            for i in range(1, 1001)])
+        db.session.execute(insert(Customer), [
+            {"name": f"Customer {i}", "email": f"c{i}@example.com"} for i in range(1, 5001)])
+        sales, lines = [], []
+        for sale_id in range(1, items // per_sale + 1):
+            sales.append({"id": sale_id, "customer_id": rnd.choice([None, rnd.randint(1, 5000)]),
+                          "date": start + timedelta(seconds=sale_id * 30), "total": 0})
+            for _ in range(per_sale):
+                lines.append({"sale_id": sale_id, "product_id": rnd.randint(1, 1000),
+                              "quantity": rnd.randint(1, 5), "price": 9.99})
+            if len(lines) >= batch:
+                db.session.execute(insert(Sale), sales)
+                db.session.execute(insert(SaleItem), lines)
+                sales, lines = [], []
+        if sales:
+            db.session.execute(insert(Sale), sales)
+            db.session.execute(insert(SaleItem), lines)
+        db.session.commit()
+
+
+def run_export(uri, fmt):
+    from ipos import export
+    app = make_app(uri)
+    start = time.perf_counter()
+    with app.app_context():
+        rows = export.export_rows()
+        if fmt == 'xlsx':
+            path = export.write_xlsx(rows)
+            size = os.path.getsize(path)
+            os.remove(path)
+        else:
+            size = sum(len(chunk) for chunk in export.iter_csv(rows))
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{fmt:>5}: peak_rss={peak_mb:.0f}MB  seconds={elapsed:.1f}  bytes={size}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--uri")
+    parser.add_argument("--run", choices=["xlsx", "csv"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_export(args.uri, args.run)
+
+    uri = args.uri or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "export.db")
+    print(f"seeding {args.items} sale items into {uri}")
+    seed(make_app(uri), args.items)
+    for fmt in ("xlsx", "csv"):
+        subprocess.run([sys.executable, __file__, "--uri", uri, "--run", fmt], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# bench/live_dashboard.py
+#
+# What open dashboards cost a busy store. --sales checkouts run once with
+# nobody watching and once with --viewers subscribed to the live hub
+# (ipos/live.py); each viewer drains its queue on its own thread, as a
+# streaming request would. For comparison, the time one full dashboard
+# reload (live.figures()) takes, times the viewers, is what refreshing every
+# viewer once per sale would cost instead.
+#
+#   python -m bench.storebench generate --scale small --db /tmp/small.db
+#   python bench/live_dashboard.py --db /tmp/small.db --viewers 50
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from bench.storebench import synthetic
+from ipos.db import db
+from ipos import live
+from ipos.checkout import checkout, CheckoutError
+from model import StockLevel
+
+
+def viewer(subscriber, stop, counts):
+    while not stop.is_set():
+        if subscriber.get(0.1) is not None:
+            counts.append(1)
+
+
+def run_sales(count, product_ids, seed=7):
+    rnd = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(count):
+        cart = [{"product_id": pid, "quantity": 1} for pid in rnd.sample(product_ids, 3)]
+        try:
+            checkout(None, cart)
+        except CheckoutError:
+            db.session.rollback()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="synthetic store to copy (never modified)")
+    parser.add_argument("--sales", type=int, default=500)
+    parser.add_argument("--viewers", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "store.db")
+    shutil.copy(args.db, path)
+    app = synthetic.make_app("sqlite:///" + path)
+    with app.app_context():
+        product_ids = db.session.execute(
+            select(StockLevel.product_id).where(StockLevel.quantity > 100)).scalars().all()
+
+        idle = run_sales(args.sales, product_ids)
+        print(f"{'no viewers':<22}{idle * 1000:>8.2f} ms/checkout")
+
+        stop, counts = threading.Event(), []
+        subscribers = [live.hub.subscribe(live.Subscriber()) for _ in range(args.viewers)]
+        threads = [threading.Thread(target=viewer, args=(s, stop, counts)) for s in subscribers]
+        for t in threads:
+            t.start()
+        live.figures()  # what a stream does first: load the figures, learn the top seller
+        watched = run_sales(args.sales, product_ids, seed=8)
+        time.sleep(0.5)
+        stop.set()
+        for t in threads:
+            t.join()
+        for s in subscribers:
+            live.hub.unsubscribe(s)
+        print(f"{f'{args.viewers} viewers, live':<22}{watched * 1000:>8.2f} ms/checkout "
+              f"({len(counts)} frames delivered)")
+
+        start = time.perf_counter()
+        for _ in range(5):
+            live.figures()
+        reload = (time.perf_counter() - start) / 5
+        print(f"{f'{args.viewers} viewers, reload':<22}{reload * args.viewers * 1000:>8.2f} ms/sale "
+              f"({reload * 1000:.2f} ms per dashboard load)")
+
+
+if __name__ == '__main__':
+    main()
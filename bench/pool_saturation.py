@@ -0,0 +1,91 @@
+# bench/pool_saturation.py
+#
+# Drives a connection pool with more concurrent requests than it has
+# connections and reports how long requests wait for a connection, how many
+# time out, and the resulting throughput. Each simulated request holds its
+# connection for --hold-ms while running a trivial query, like a checkout
+# or a report would.
+#
+#   POS_PROFILE=production POS_DATABASE_URL=mysql+pymysql://... \
+#       python bench/pool_saturation.py --threads 64 --requests 5000
+#   POS_PROFILE=local python bench/pool_saturation.py
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from ipos.config import load_config, configure_engine
+from ipos.db import db
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    parser.add_argument("--pool-size", type=int, help="override the profile's POOL_SIZE")
+    args = parser.parse_args()
+
+    os.environ.setdefault("POS_PROFILE", "local")
+    if os.environ["POS_PROFILE"] == "local":
+        os.environ.setdefault("POS_DATABASE_URL",
+                              "sqlite:///" + os.path.join(tempfile.mkdtemp(), "pool.db"))
+    if args.pool_size:
+        os.environ["POS_POOL_SIZE"] = str(args.pool_size)
+
+    app = Flask(__name__)
+    load_config(app)
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+        configure_engine(engine)
+
+    waits, timeouts = [], 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal timeouts
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                waited = time.perf_counter() - start
+                conn.execute(text("SELECT 1")).scalar()
+                time.sleep(args.hold_ms / 1000)
+        except PoolTimeout:
+            with lock:
+                timeouts += 1
+            return
+        with lock:
+            waits.append(waited * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(one_request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"profile={app.config.get('PROFILE', 'development')} "
+          f"pool_size={app.config['POOL_SIZE']} max_overflow={app.config['MAX_OVERFLOW']} "
+          f"threads={args.threads}")
+    print(f"requests/s={args.requests / elapsed:.0f}  timeouts={timeouts}  "
+          f"wait_ms p50={statistics.median(waits) if waits else 0:.2f} "
+          f"p99={percentile(waits, 99):.2f} max={max(waits, default=0):.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# bench/replica_routing.py
+#
+# Checkout latency while month-end reporting runs. Tills check out on the
+# primary while --reporters processes loop over the full-range report and
+# CSV export: first with no reporting, then with reporting on the primary,
+# then with reporting routed to a replica by ipos.replicas. Primary and
+# replica are two SQLite files, the replica copied from the primary at start.
+# Besides latency, the primary's WAL growth shows reports holding back its
+# checkpoints. On a single machine the reporters still share CPU and disk
+# with the tills, so the gap is smaller than with a replica on its own host.
+#
+#   python -m bench.storebench generate --scale small --db /tmp/small.db
+#   python bench/replica_routing.py --db /tmp/small.db --seconds 20
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import select
+from ipos.config import configure_engine
+from ipos.db import db
+from ipos import replicas, export
+from ipos.catalog_cache import catalog
+from ipos.checkout import checkout, CheckoutError
+from ipos.reports import ReportFilter, build_report
+from model import Product
+
+
+def make_app(primary, replica=None):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = primary
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    app.config["ARCHIVE_DIR"] = tempfile.mkdtemp()
+    if replica:
+        app.config["REPLICA_URLS"] = [replica]
+        app.config["REPLICA_MAX_LAG"] = 3600  # the copy is never refreshed here
+        app.config["SQLALCHEMY_BINDS"] = {"replica0": {"url": replica, "connect_args": {"timeout": 30}}}
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine)
+    return app
+
+
+def reporter(primary, replica, stop_at, done):
+    app = make_app(primary, replica)
+    while time.time() < stop_at:
+        with app.app_context():
+            if replica:
+                replicas.use_replica()
+            catalog.invalidate('sales')  # a fresh report every time
+            build_report(ReportFilter.from_args({}), None, 50)
+            for _ in export.export_rows():
+                pass
+        with done.get_lock():
+            done.value += 1
+
+
+def tills(app, count, seconds, product_ids):
+    latencies, lock = [], threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def till(seed):
+        rnd = random.Random(seed)
+        with app.app_context():
+            while time.perf_counter() < stop_at:
+                cart = [{"product_id": pid, "quantity": 1, "price": 1.0}
+                        for pid in rnd.sample(product_ids, 3)]
+                start = time.perf_counter()
+                try:
+                    checkout(None, cart)
+                except CheckoutError:
+                    db.session.rollback()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                db.session.remove()
+                time.sleep(0.01)  # a till is not a tight loop
+
+    threads = [threading.Thread(target=till, args=(n,)) for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="synthetic store to copy (never modified)")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--tills", type=int, default=4)
+    parser.add_argument("--reporters", type=int, default=2)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    primary_path, replica_path = os.path.join(folder, "primary.db"), os.path.join(folder, "replica.db")
+    shutil.copy(args.db, primary_path)
+    primary, replica = "sqlite:///" + primary_path, "sqlite:///" + replica_path
+
+    app = make_app(primary, replica)
+    with app.app_context():
+        replicas.sync_sqlite()
+        product_ids = db.session.execute(select(Product.id)).scalars().all()
+
+    print(f"{'reporting':<12}{'checkouts':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'reports':>9}{'WAL MB':>9}")
+    for label, target in (("none", None), ("primary", False), ("replica", True)):
+        with app.app_context(), db.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        done = multiprocessing.Value('i', 0)
+        procs = []
+        if target is not None:
+            stop_at = time.time() + args.seconds
+            procs = [multiprocessing.Process(target=reporter, args=(
+                primary, replica if target else None, stop_at, done)) for _ in range(args.reporters)]
+            for p in procs:
+                p.start()
+            time.sleep(1)  # let the reports get going
+        latencies = tills(app, args.tills, args.seconds - 1 if procs else args.seconds, product_ids)
+        for p in procs:
+            p.join()
+        print(f"{label:<12}{len(latencies):>10}{percentile(latencies, 0.5):>9.1f}"
+              f"{percentile(latencies, 0.95):>9.1f}{percentile(latencies, 0.99):>9.1f}"
+              f"{latencies[-1] * 1000:>9.1f}{done.value:>9}"
+              f"{os.path.getsize(primary_path + '-wal') / 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# bench/serialization.py
+#
+# Rows/sec of the list endpoints' serialization: ORM instances + to_dict() +
+# stdlib json (the old path) against column tuples + serialize.dumps() (orjson
+# when installed). Seeds a synthetic store first, see bench/storebench.
+#
+#   python bench/serialization.py --products 50000 --customers 200000 --items 500000
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import joinedload, selectinload
+from bench.storebench import synthetic
+from ipos.db import db
+from ipos import serialize
+from ipos.pagination import keyset_page
+from ipos.reports import ReportFilter, build_report
+from model import Product, Customer, Sale, SaleItem
+
+PAGE = 500
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        db.session.remove()  # fresh identity map, like a new request
+        start = time.perf_counter()
+        rows = fn()
+        times.append(time.perf_counter() - start)
+    return rows, min(times)
+
+
+def legacy_products():
+    data = [p.to_dict() for p in Product.query.options(joinedload(Product.category))]
+    json.dumps(data)
+    return len(data)
+
+
+def fast_products():
+    data = list(serialize.products())
+    serialize.dumps(data)
+    return len(data)
+
+
+def legacy_customers():
+    data = [c.to_dict() for c in Customer.query.all()]
+    json.dumps(data)
+    return len(data)
+
+
+def fast_customers():
+    data = list(serialize.customers())
+    serialize.dumps(data)
+    return len(data)
+
+
+def legacy_sales(pages):
+    def run():
+        cursor, count = None, 0
+        for _ in range(pages):
+            query = Sale.query.options(joinedload(Sale.customer),
+                                       selectinload(Sale.items).joinedload(SaleItem.product))
+            sales, cursor = keyset_page(query, Sale.date, Sale.id, cursor, PAGE)
+            json.dumps([{
+                "id": s.id,
+                "date": s.date.strftime("%Y-%m-%d %H:%M:%S"),
+                "total": float(s.total),
+                "customer_id": s.customer.id if s.customer else None,
+                "customer_name": s.customer.name if s.customer else "Walk-in",
+                "items": [i.to_dict() for i in s.items]
+            } for s in sales])
+            count += len(sales)
+        return count
+    return run
+
+
+def fast_sales(pages):
+    def run():
+        cursor, count = None, 0
+        for _ in range(pages):
+            sales, cursor = keyset_page(serialize.sale_query(), Sale.date, Sale.id, cursor, PAGE)
+            serialize.dumps(serialize.sale_rows(sales))
+            count += len(sales)
+        return count
+    return run
+
+
+def report_encoder(encode):
+    report = build_report(ReportFilter())
+    payload = {"product_sales": [list(p) for p in report["product_sales"]],
+               "daily": [list(d) for d in report["daily"]],
+               "products": [{"id": p.id, "name": p.name} for p in report["products"]]}
+    rows = len(payload["product_sales"]) + len(payload["daily"]) + len(payload["products"])
+
+    def run():
+        encode(payload)
+        return rows
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--items", type=int, default=500000)
+    parser.add_argument("--pages", type=int, default=20, help="/api/sales pages of 500")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--uri", help="existing synthetic store to use instead of seeding")
+    args = parser.parse_args()
+
+    uri = args.uri
+    if not uri:
+        uri = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "serialize.db")
+        print(f"seeding {uri}")
+        synthetic.generate(uri, categories=50, products=args.products, customers=args.customers,
+                           items=args.items, echo=lambda *a: None)
+
+    app = synthetic.make_app(uri)
+    print(f"encoder: {'orjson' if serialize.orjson else 'stdlib json (install orjson)'}")
+    with app.app_context():
+        cases = [
+            ("products", legacy_products, fast_products),
+            ("customers", legacy_customers, fast_customers),
+            ("sales", legacy_sales(args.pages), fast_sales(args.pages)),
+            ("reports", report_encoder(json.dumps), report_encoder(serialize.dumps)),
+        ]
+        print(f"{'endpoint':<10}{'rows':>9}{'to_dict rows/s':>17}{'tuples rows/s':>16}{'speedup':>9}")
+        for name, legacy, fast in cases:
+            rows, slow = best_of(legacy, args.repeat)
+            _, quick = best_of(fast, args.repeat)
+            print(f"{name:<10}{rows:>9}{rows / slow:>17,.0f}{rows / quick:>16,.0f}{slow / quick:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# bench/storebench
+#
+# Store-scale benchmark: generate a synthetic store database, then drive the
+# hot routes with concurrent clients against a real server process.
+#
+#   python -m bench.storebench generate --scale small --db /tmp/store.db
+#   python -m bench.storebench run --db /tmp/store.db --threads 16 --duration 30 \
+#       --json results/$(git rev-parse --short HEAD).json
+#   python -m bench.storebench compare results/old.json results/new.json
+#
+# Scales: small (~200k sale items), medium (1M) and full (100k products,
+# 1M customers, 10M sale items). Any count can be overridden, see --help.
+# Point --db at a mysql+pymysql:// URI to use MySQL instead of SQLite.
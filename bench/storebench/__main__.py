@@ -0,0 +1,94 @@
+# bench/storebench/__main__.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from bench.storebench import synthetic, load
+
+
+def _uri(value):
+    if "://" in value:
+        return value
+    os.makedirs(os.path.dirname(os.path.abspath(value)), exist_ok=True)
+    return "sqlite:///" + os.path.abspath(value)
+
+
+def _commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--"]) != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.storebench")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="create a synthetic store database")
+    gen.add_argument("--db", required=True, help="SQLite file or database URI")
+    gen.add_argument("--scale", choices=synthetic.SCALES, default="small")
+    for key in ("categories", "products", "customers", "items"):
+        gen.add_argument(f"--{key}", type=int, help=f"override the scale's {key} count")
+    gen.add_argument("--days", type=int, default=730, help="history length, ending today")
+    gen.add_argument("--seed", type=int, default=42)
+
+    run = sub.add_parser("run", help="drive the hot routes with concurrent clients")
+    run.add_argument("--db", required=True, help="SQLite file or database URI")
+    run.add_argument("--threads", type=int, default=16)
+    run.add_argument("--duration", type=float, default=30)
+    run.add_argument("--warmup", type=float, default=5)
+    run.add_argument("--mix", help="e.g. checkout=30,sales_list=25 (default: %s)" %
+                     ",".join(f"{k}={v}" for k, v in load.DEFAULT_MIX.items()))
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--no-copy", action="store_true",
+                     help="run against the SQLite file itself instead of a copy")
+    run.add_argument("--json", help="also write the results to this file")
+
+    cmp = sub.add_parser("compare", help="compare two --json result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=10, help="percent change that fails")
+
+    srv = sub.add_parser("serve", help=argparse.SUPPRESS)
+    srv.add_argument("--port", type=int, required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        counts = dict(synthetic.SCALES[args.scale])
+        counts.update({k: getattr(args, k) for k in counts if getattr(args, k)})
+        started = datetime.now()
+        result = synthetic.generate(_uri(args.db), days=args.days, seed=args.seed, **counts)
+        print(json.dumps(result))
+        print(f"Generated in {(datetime.now() - started).total_seconds():.0f}s")
+
+    elif args.command == "run":
+        report = load.run(_uri(args.db), threads=args.threads, duration=args.duration,
+                          warmup=args.warmup, mix=load.parse_mix(args.mix),
+                          seed=args.seed, copy=not args.no_copy)
+        report["commit"] = _commit()
+        report["date"] = datetime.now().isoformat(timespec="seconds")
+        load.print_report(report)
+        if args.json:
+            os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+
+    elif args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        if load.compare(old, new, args.threshold):
+            sys.exit(1)
+
+    elif args.command == "serve":
+        load.serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
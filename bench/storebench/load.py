@@ -0,0 +1,280 @@
+# bench/storebench/load.py
+#
+# Concurrent load against a real server process: the app is started in a
+# subprocess (threaded WSGI server, POS_* settings from the environment) and
+# client threads issue a weighted mix of requests against it.
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+from sqlalchemy import create_engine, func, select
+from bench.storebench.synthetic import month_ranges
+from model import Product, Customer, Sale
+
+DEFAULT_MIX = {
+    "dashboard": 5,
+    "sales_list": 25,
+    "checkout": 30,
+    "reports": 10,
+    "export": 2,
+    "sales_search": 8,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario {name!r}; use {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Dataset:
+    """Id ranges and dates the scenarios draw their parameters from."""
+
+    def __init__(self, uri):
+        engine = create_engine(uri)
+        with engine.connect() as conn:
+            self.max_product = conn.execute(select(func.max(Product.id))).scalar() or 1
+            self.max_customer = conn.execute(select(func.max(Customer.id))).scalar() or 1
+            first, last = conn.execute(select(func.min(Sale.date), func.max(Sale.date))).one()
+            self.sales = conn.execute(select(func.max(Sale.id))).scalar() or 0
+            self.surnames = [name.split()[-1] for (name,) in conn.execute(
+                select(Customer.name).where(Customer.id <= 200))]
+        engine.dispose()
+        today = date.today()
+        self.first = first.date() if first else today
+        self.last = last.date() if last else today
+        self.months = month_ranges(self.first, self.last)
+
+    def day(self, rnd):
+        return self.first + timedelta(days=rnd.randrange((self.last - self.first).days + 1))
+
+
+def scenario(name, data, rnd):
+    """(method, path, json body) for one request of scenario ``name``."""
+    if name == "dashboard":
+        return "GET", "/", None
+    if name == "sales_list":
+        params = {"limit": 50}
+        if rnd.random() < 0.5:
+            params["customer_id"] = rnd.randint(1, data.max_customer)
+        return "GET", "/api/sales?" + urlencode(params), None
+    if name == "checkout":
+        items = [{"product_id": rnd.randint(1, data.max_product), "quantity": rnd.randint(1, 3)}
+                 for _ in range(rnd.randint(1, 5))]
+        customer = rnd.randint(1, data.max_customer) if rnd.random() < 0.6 else None
+        return "POST", "/api/sales", {"customer_id": customer, "items": items}
+    if name == "reports":
+        first, last = rnd.choice(data.months)
+        return "GET", "/api/reports?" + urlencode({"from_date": first, "to_date": last}), None
+    if name == "export":
+        day = data.day(rnd)
+        return "GET", "/export_excel?" + urlencode({"from_date": day, "to_date": day}), None
+    if name == "sales_search":
+        start = data.day(rnd)
+        return "GET", "/sales?" + urlencode({
+            "q": rnd.choice(data.surnames or ["a"]), "start_date": start,
+            "end_date": start + timedelta(days=6)}), None
+    raise ValueError(name)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(port, method, path, body, timeout=120):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        resp = conn.getresponse()
+        return resp.status, len(resp.read())
+    finally:
+        conn.close()
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process (Linux only, else None)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def serve(port):
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def start_server(uri):
+    port = _free_port()
+    env = dict(os.environ, POS_DATABASE_URL=uri)
+    env.setdefault("POS_PROFILE", "local" if uri.startswith("sqlite") else "production")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    proc = subprocess.Popen([sys.executable, "-m", "bench.storebench", "serve", "--port", str(port)],
+                            cwd=root, env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("Server exited during startup")
+        try:
+            _request(port, "GET", "/metrics", None, timeout=5)
+            return proc, port
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("Server did not start within 60s")
+
+
+def working_copy(uri):
+    """Checkouts write to the database; run against a copy of a SQLite file
+    so every run starts from the same data."""
+    if not uri.startswith("sqlite:///"):
+        return uri, None
+    path = uri[len("sqlite:///"):]
+    tmp = tempfile.mkdtemp(prefix="storebench-")
+    shutil.copy(path, os.path.join(tmp, "store.db"))
+    return "sqlite:///" + os.path.join(tmp, "store.db"), tmp
+
+
+def run(uri, threads=16, duration=30.0, warmup=5.0, mix=None, seed=1, copy=True, echo=print):
+    mix = mix or dict(DEFAULT_MIX)
+    data = Dataset(uri)
+    tmp = None
+    if copy:
+        uri, tmp = working_copy(uri)
+    proc, port = start_server(uri)
+
+    names, weights = list(mix), list(mix.values())
+    results = {name: {"latencies": [], "errors": 0, "bytes": 0} for name in names}
+    lock = threading.Lock()
+    phase = {"record": False, "stop": False}
+
+    def client(n):
+        rnd = random.Random(seed * 1000 + n)
+        while not phase["stop"]:
+            name = rnd.choices(names, weights)[0]
+            method, path, body = scenario(name, data, rnd)
+            start = time.perf_counter()
+            try:
+                status, size = _request(port, method, path, body)
+            except OSError:
+                status, size = 599, 0
+            elapsed = time.perf_counter() - start
+            if not phase["record"]:
+                continue
+            with lock:
+                r = results[name]
+                r["latencies"].append(elapsed * 1000)
+                r["bytes"] += size
+                if status >= 400:
+                    r["errors"] += 1
+
+    try:
+        workers = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(threads)]
+        for w in workers:
+            w.start()
+        echo(f"Warming up for {warmup:.0f}s, then measuring for {duration:.0f}s with {threads} clients")
+        time.sleep(warmup)
+        phase["record"] = True
+        started = time.perf_counter()
+        time.sleep(duration)
+        phase["record"] = False
+        elapsed = time.perf_counter() - started
+        phase["stop"] = True
+        for w in workers:
+            w.join(timeout=180)
+        peak = peak_rss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    summary = {}
+    for name in names:
+        lat = results[name]["latencies"]
+        summary[name] = {
+            "requests": len(lat),
+            "errors": results[name]["errors"],
+            "rps": round(len(lat) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 50), 2),
+            "p99_ms": round(percentile(lat, 99), 2),
+            "avg_kb": round(results[name]["bytes"] / len(lat) / 1024, 1) if lat else 0,
+        }
+    total = sum(s["requests"] for s in summary.values())
+    return {
+        "threads": threads,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "server_peak_rss_mb": round(peak, 1) if peak else None,
+        "dataset": {"products": data.max_product, "customers": data.max_customer,
+                    "sales": data.sales, "from": str(data.first), "to": str(data.last)},
+        "mix": mix,
+        "scenarios": summary,
+    }
+
+
+def print_report(report, echo=print):
+    echo(f"{'scenario':<14}{'requests':>10}{'errors':>8}{'req/s':>10}"
+         f"{'p50 ms':>10}{'p99 ms':>10}{'avg KB':>10}")
+    for name, s in report["scenarios"].items():
+        echo(f"{name:<14}{s['requests']:>10}{s['errors']:>8}{s['rps']:>10.1f}"
+             f"{s['p50_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['avg_kb']:>10.1f}")
+    peak = report["server_peak_rss_mb"]
+    echo(f"throughput={report['throughput_rps']:.1f} req/s  "
+         f"server peak RSS={'n/a' if peak is None else f'{peak:.0f} MB'}")
+
+
+def compare(old, new, threshold=10.0, echo=print):
+    """Print per-scenario changes; returns the names that regressed by more
+    than ``threshold`` percent in p50, p99 or throughput."""
+    regressed = []
+    echo(f"{old.get('commit', '?')} -> {new.get('commit', '?')}")
+    echo(f"{'scenario':<14}{'req/s':>18}{'p50 ms':>18}{'p99 ms':>18}")
+
+    def change(a, b):
+        return (b - a) / a * 100 if a else 0.0
+
+    for name, b in new["scenarios"].items():
+        a = old["scenarios"].get(name)
+        if not a:
+            continue
+        rps, p50, p99 = change(a["rps"], b["rps"]), change(a["p50_ms"], b["p50_ms"]), \
+            change(a["p99_ms"], b["p99_ms"])
+        flag = ""
+        if rps < -threshold or p50 > threshold or p99 > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        echo(f"{name:<14}{b['rps']:>10.1f} {rps:+6.1f}%{b['p50_ms']:>10.1f} {p50:+6.1f}%"
+             f"{b['p99_ms']:>10.1f} {p99:+6.1f}%{flag}")
+    return regressed
@@ -0,0 +1,175 @@
+# bench/storebench/synthetic.py
+#
+# Synthetic store data. Everything is drawn from one seeded RNG, so the same
+# scale and seed always produce the same database, and results from different
+# commits are measured against identical data.
+import calendar
+import random
+from datetime import date, datetime, timedelta
+from flask import Flask
+from sqlalchemy import insert, text
+from ipos.config import configure_engine
+from ipos.db import db
+from ipos import inventory, migrations, rollups, customer_stats
+from model import Category, Product, Customer, Sale, SaleItem
+
+SCALES = {
+    "small": {"categories": 20, "products": 2000, "customers": 20000, "items": 200000},
+    "medium": {"categories": 50, "products": 20000, "customers": 200000, "items": 1000000},
+    "full": {"categories": 200, "products": 100000, "customers": 1000000, "items": 10000000},
+}
+
+# Relative sales volume by month (Jan..Dec) and weekday (Mon..Sun)
+MONTH_WEIGHTS = (0.75, 0.7, 0.85, 0.9, 0.95, 0.9, 0.95, 1.0, 0.9, 1.0, 1.25, 1.7)
+WEEKDAY_WEIGHTS = (0.8, 0.85, 0.9, 0.95, 1.15, 1.45, 1.1)
+# Opening hours 9-21 with lunch and after-work peaks
+HOUR_WEIGHTS = {9: 2, 10: 4, 11: 6, 12: 9, 13: 8, 14: 5, 15: 5, 16: 6, 17: 9, 18: 10, 19: 8, 20: 4}
+ITEMS_PER_SALE = {1: 20, 2: 22, 3: 18, 4: 14, 5: 10, 6: 7, 7: 5, 8: 4}
+
+ADJECTIVES = ["Fresh", "Organic", "Classic", "Premium", "Family", "Mini", "Large", "Spicy",
+              "Sweet", "Light", "Dark", "Crunchy", "Golden", "Wild", "Smoked", "Frozen"]
+NOUNS = ["Apple", "Bread", "Cheese", "Coffee", "Tea", "Rice", "Pasta", "Yogurt", "Juice",
+         "Chocolate", "Soap", "Shampoo", "Battery", "Notebook", "Pen", "Cable", "Towel",
+         "Candle", "Honey", "Butter", "Cereal", "Water", "Chips", "Salsa"]
+FIRST_NAMES = ["Amina", "Brian", "Chen", "Daniel", "Esther", "Fatima", "Grace", "Hassan",
+               "Irene", "James", "Kofi", "Lucy", "Mohamed", "Naomi", "Otieno", "Priya",
+               "Quinn", "Rosa", "Samuel", "Tariq", "Uma", "Victor", "Wanjiru", "Yusuf"]
+LAST_NAMES = ["Achieng", "Brown", "Chebet", "Diallo", "Evans", "Garcia", "Hughes", "Ito",
+              "Kamau", "Lopez", "Mwangi", "Nguyen", "Okafor", "Patel", "Rossi", "Smith",
+              "Tanaka", "Wafula", "Young", "Zulu"]
+
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    db.init_app(app)
+    return app
+
+
+def _cumulative(weights):
+    total, out = 0, []
+    for w in weights:
+        total += w
+        out.append(total)
+    return out
+
+
+def _day_counts(sales, days, end):
+    """Split ``sales`` over ``days`` days ending at ``end`` by season and weekday."""
+    dates = [end - timedelta(days=n) for n in range(days - 1, -1, -1)]
+    weights = [MONTH_WEIGHTS[d.month - 1] * WEEKDAY_WEIGHTS[d.weekday()] for d in dates]
+    # Light year-on-year growth so the newest months are the busiest
+    weights = [w * (1 + 0.25 * i / days) for i, w in enumerate(weights)]
+    total = sum(weights)
+    return [(d, max(1, round(sales * w / total))) for d, w in zip(dates, weights)]
+
+
+def generate(uri, categories, products, customers, items, days=730, seed=42,
+             batch=50000, echo=print):
+    """Create the schema at ``uri`` and fill it; returns the row counts."""
+    rnd = random.Random(seed)
+    app = make_app(uri)
+    with app.app_context():
+        configure_engine(db.engine)
+        db.drop_all()
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+            if db.engine.dialect.name == "sqlite":
+                conn.execute(text("DROP TABLE IF EXISTS product_fts"))
+        migrations.upgrade(db.engine, echo=echo)
+
+        echo(f"categories={categories} products={products} customers={customers}")
+        db.session.execute(insert(Category), [
+            {"id": i, "name": f"{NOUNS[i % len(NOUNS)]}s {i}"} for i in range(1, categories + 1)])
+
+        prices = {}
+        rows = []
+        for i in range(1, products + 1):
+            prices[i] = round(rnd.lognormvariate(2.3, 0.9), 2)
+            rows.append({"id": i, "name": f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {i}",
+                         "barcode": str(2000000000000 + i), "price": prices[i],
+                         "category_id": rnd.randint(1, categories)})
+            if len(rows) >= batch:
+                db.session.execute(insert(Product), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Product), rows)
+        for first in range(1, products + 1, batch):
+            inventory.open_stock({i: 1000000 for i in range(first, min(first + batch, products + 1))})
+
+        rows = []
+        for i in range(1, customers + 1):
+            rows.append({"id": i, "name": f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                         "email": f"customer{i}@example.com", "phone": f"07{i:08d}", "phone_digits": f"07{i:08d}"})
+            if len(rows) >= batch:
+                db.session.execute(insert(Customer), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Customer), rows)
+        db.session.commit()
+
+        # A few best sellers and a long tail, for products and regulars alike
+        product_weights = _cumulative(1 / (rank ** 0.8) for rank in range(1, products + 1))
+        customer_weights = _cumulative(1 / (rank ** 0.6) for rank in range(1, customers + 1))
+        hours, hour_weights = list(HOUR_WEIGHTS), _cumulative(HOUR_WEIGHTS.values())
+        sizes, size_weights = list(ITEMS_PER_SALE), _cumulative(ITEMS_PER_SALE.values())
+        mean_size = sum(k * v for k, v in ITEMS_PER_SALE.items()) / sum(ITEMS_PER_SALE.values())
+
+        sale_id, item_count = 0, 0
+        sales, lines = [], []
+        end = date.today()
+        for day, count in _day_counts(int(items / mean_size), days, end):
+            times = sorted(
+                datetime(day.year, day.month, day.day, rnd.choices(hours, cum_weights=hour_weights)[0],
+                         rnd.randrange(60), rnd.randrange(60))
+                for _ in range(count))
+            for when in times:
+                sale_id += 1
+                size = rnd.choices(sizes, cum_weights=size_weights)[0]
+                picked = set(rnd.choices(range(1, products + 1), cum_weights=product_weights, k=size))
+                total = 0
+                for pid in picked:
+                    qty = rnd.choices((1, 2, 3, 4), weights=(70, 20, 7, 3))[0]
+                    total += prices[pid] * qty
+                    lines.append({"sale_id": sale_id, "product_id": pid,
+                                  "quantity": qty, "price": prices[pid]})
+                customer = None if rnd.random() < 0.4 else \
+                    rnd.choices(range(1, customers + 1), cum_weights=customer_weights)[0]
+                sales.append({"id": sale_id, "customer_id": customer,
+                              "date": when, "total": round(total, 2)})
+            if len(lines) >= batch:
+                item_count += len(lines)
+                db.session.execute(insert(Sale), sales)
+                db.session.execute(insert(SaleItem), lines)
+                db.session.commit()
+                sales, lines = [], []
+                echo(f"  {day:%Y-%m}  sales={sale_id}  items={item_count}")
+        if sales:
+            item_count += len(lines)
+            db.session.execute(insert(Sale), sales)
+            db.session.execute(insert(SaleItem), lines)
+            db.session.commit()
+
+        echo("Rebuilding rollups")
+        rollups.rebuild()
+        customer_stats.rebuild()
+        if db.engine.dialect.name == "sqlite":
+            with db.engine.connect() as conn:
+                conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+                conn.execute(text("ANALYZE"))
+        db.engine.dispose()
+
+    return {"categories": categories, "products": products, "customers": customers,
+            "sales": sale_id, "items": item_count,
+            "from": str(end - timedelta(days=days - 1)), "to": str(end)}
+
+
+def month_ranges(first, last):
+    """(first_day, last_day) of every calendar month between two dates."""
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((date(year, month, 1),
+                       date(year, month, calendar.monthrange(year, month)[1])))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
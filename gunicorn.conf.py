@@ -0,0 +1,22 @@
+# gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Workers and threads per worker come from POS_PROFILE (ipos/config.py),
+# overridable with POS_WORKERS / POS_THREADS. Threaded workers suit this
+# app: requests mostly wait on the database, and each thread holds at most
+# one pooled connection.
+import os
+from ipos.config import server_sizing
+
+workers, threads = server_sizing()
+worker_class = "gthread"
+bind = os.environ.get("POS_BIND", "0.0.0.0:8000")
+timeout = 120           # a year's xlsx export streams for a while
+graceful_timeout = 30   # let in-flight checkouts finish on restart
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = 5000
+max_requests_jitter = 500
+# No preload: every worker opens its own connection pool after the fork
+preload_app = False
@@ -0,0 +1,251 @@
+# ipos/aio.py
+#
+# Async read path for the ASGI entry point (asgi.py). GET /api/products and
+# GET /api/reports run on an async engine (aiosqlite, aiomysql or asyncpg),
+# so a slow report waits on the database without holding one of the threads
+# the Flask routes, checkouts included, run on. Every other request goes to
+# the Flask app. Responses match the Flask routes. Reports read from a
+# replica when one is within REPLICA_MAX_LAG, as the Flask route does.
+#
+# GET /api/dashboard/stream is served here too: each open dashboard waits on
+# an asyncio queue fed by the live hub (ipos/live.py) rather than holding
+# one of the Flask threads for as long as it stays open.
+import asyncio
+import time
+from urllib.parse import parse_qs
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from ipos.config import engine_options, configure_engine
+from ipos import serialize, archive, replicas, live
+from ipos.catalog_cache import catalog
+from ipos.metrics import metrics
+from ipos.pagination import parse_limit, CursorError
+from ipos.reports import ReportFilter, report_statements, assemble, report_json
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_url(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncSubscriber(live.Subscriber):
+    """A live.Subscriber whose queue belongs to the event loop; checkouts
+    publish from other threads."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(live.QUEUE_SIZE)
+        self.stale = False
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # loop closed; the stream is gone
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stale = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.stale = False
+
+
+def _json(status, data, headers=()):
+    return status, [(b"content-type", b"application/json"), *headers], serialize.dumps(data)
+
+
+class AsyncAPI:
+    """ASGI app: the async routes below, then ``fallback`` for the rest."""
+
+    def __init__(self, app, fallback):
+        self.app = app
+        self.fallback = fallback
+        self.engine = None
+        self.replicas = {}  # replica engine of the Flask app -> async engine
+        self.archive = None
+        self.routes = {
+            "/api/products": ("api_products", self.products),
+            "/api/reports": ("api_reports", self.reports),
+        }
+        self.streams = {
+            "/api/dashboard/stream": ("api_dashboard_stream", self.dashboard_stream),
+        }
+
+    def start(self):
+        uri = self.app.config["SQLALCHEMY_DATABASE_URI"]
+        self.engine = create_async_engine(async_url(uri), **engine_options(self.app.config, uri))
+        configure_engine(self.engine.sync_engine)
+        with self.app.app_context():
+            self.archive = archive.archive_dir()
+            for engine in replicas.engines():
+                url = engine.url.render_as_string(hide_password=False)
+                self.replicas[engine] = create_async_engine(
+                    async_url(url), **engine_options(self.app.config, url))
+                configure_engine(self.replicas[engine].sync_engine)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "GET" and scope.get("path") in self.streams:
+            endpoint, handler = self.streams[scope["path"]]
+            start = time.perf_counter()
+            await handler(receive, send)
+            metrics.observe(endpoint, "GET", 200, time.perf_counter() - start)
+            return
+        route = self.routes.get(scope.get("path")) \
+            if scope["type"] == "http" and scope["method"] == "GET" else None
+        if route is None:
+            return await self.fallback(scope, receive, send)
+
+        start = time.perf_counter()
+        if self.engine is None:
+            self.start()
+        endpoint, handler = route
+        args = {k: v[0] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+        headers = dict(scope["headers"])
+        result = await handler(args, headers)
+        if result is None:
+            return await self.fallback(scope, receive, send)
+        status, out_headers, body = result
+        await send({"type": "http.response.start", "status": status,
+                    "headers": out_headers + [(b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+        metrics.observe(endpoint, "GET", status, time.perf_counter() - start)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.engine is not None:
+                    await self.engine.dispose()
+                for engine in self.replicas.values():
+                    await engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _fetch(self, stmt, engine=None):
+        async with (engine or self.engine).connect() as conn:
+            return (await conn.execute(stmt)).all()
+
+    def _choose_replica(self):
+        with self.app.app_context():
+            return self.replicas.get(replicas.choose())
+
+    def _catalog_state(self):
+        # The version and watermark are database reads, so they run on a thread
+        with self.app.app_context():
+            return catalog.products.state()
+
+    async def products(self, args, headers):
+        if args.get("stream"):
+            return None
+        products = catalog.products
+        state = await asyncio.to_thread(self._catalog_state)
+        wanted = [t.strip() for t in headers.get(b"if-none-match", b"").split(b",")]
+        etag = products.etag(None, *state)
+        data = None
+        if f'"{etag}"'.encode() not in wanted:
+            data, etag = products.cached(None, state)
+            if data is None:
+                data = [serialize.product_row(r) for r in await self._fetch(serialize.product_stmt())]
+                etag = products.store(None, state, data)
+        cache_headers = [(b"etag", f'"{etag}"'.encode()), (b"cache-control", b"no-cache")]
+        if data is None or f'"{etag}"'.encode() in wanted:
+            return 304, cache_headers, b""
+        return _json(200, data, cache_headers)
+
+    async def reports(self, args, headers):
+        try:
+            f = ReportFilter.from_args(args)
+            limit = parse_limit(args.get("limit"))
+            statements = report_statements(f, args.get("cursor"), limit)
+        except (ValueError, CursorError) as e:
+            return _json(400, {"error": str(e)})
+        # The lag check may query the replicas, so it runs on a thread too
+        engine = await asyncio.to_thread(self._choose_replica) if self.replicas else None
+        # Independent queries: run them side by side on separate connections,
+        # with the archived months read from Parquet on a worker thread
+        archived, *results = await asyncio.gather(
+            asyncio.to_thread(archive.report, self.archive, f, args.get("cursor"), limit),
+            *(self._fetch(s, engine) for s in statements.values()))
+        return _json(200, report_json(assemble(dict(zip(statements, results)), limit, archived)))
+
+    def _figures(self):
+        with self.app.app_context():
+            if self.app.config.get('REPLICA_URLS'):
+                replicas.use_replica()
+            return live.figures(), live.resync_interval(), live.poll_interval()
+
+    def _newest_sale_id(self):
+        with self.app.app_context():
+            if self.app.config.get('REPLICA_URLS'):
+                replicas.use_replica()
+            return live.newest_sale_id()
+
+    async def _disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def dashboard_stream(self, receive, send):
+        """Same frames as live.stream(), sent as they arrive, until the
+        client disconnects (noticed within live.KEEPALIVE seconds)."""
+        subscriber = live.hub.subscribe(AsyncSubscriber(asyncio.get_running_loop()))
+        disconnected = asyncio.ensure_future(self._disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no")]})
+            viewer = None
+            while not disconnected.done():
+                now = time.monotonic()
+                if viewer is not None and not viewer.snapshot_due(subscriber, now) \
+                        and viewer.poll_due(now):
+                    viewer.polled(await asyncio.to_thread(self._newest_sale_id), now)
+                if viewer is None or viewer.snapshot_due(subscriber, now):
+                    subscriber.drain()
+                    data, resync, poll = await asyncio.to_thread(self._figures)
+                    viewer = viewer or live.Viewer(resync, poll)
+                    viewer.snapshot(data, now)
+                    frame = live.encode('snapshot', data)
+                else:
+                    message = await subscriber.get(viewer.timeout(now))
+                    now = time.monotonic()
+                    if message is None:
+                        if now < viewer.next_ping:
+                            continue
+                        frame = live.PING
+                    else:
+                        sale_id, frame = message
+                        if not viewer.accept(sale_id):
+                            continue
+                    viewer.sent(now)
+                await send({"type": "http.response.body", "body": frame, "more_body": True})
+        except OSError:
+            pass  # client went away
+        finally:
+            disconnected.cancel()
+            live.hub.unsubscribe(subscriber)
@@ -0,0 +1,178 @@
+# ipos/analytics.py
+#
+# Multi-dimensional sales reports for /api/analytics/*. Line items in the
+# date range are loaded once into an Arrow table: live rows are fetched in
+# chunks of column tuples and turned into record batches, and archived
+# months come straight from their Parquet files (ipos/archive.py). Every
+# report is then a vectorized group-by over that table, with no per-row
+# Python. Results are cached per report and date range. Once a sale is
+# recorded they are reloaded, but at most once per ANALYTICS_MAX_AGE seconds
+# (default 60), so a busy till does not rebuild the table on every request.
+from flask import current_app
+from sqlalchemy import select, type_coerce, String
+from ipos.db import db
+from ipos import archive
+from ipos.catalog_cache import catalog, sales_watermark
+from model import Product, Category, Sale, SaleItem
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+CHUNK_SIZE = 50000
+DEFAULT_MAX_AGE = 60  # seconds a cached report may lag new sales
+MAX_BASKET = 20  # larger baskets are counted together as "20+"
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+COLUMNS = ['sale_id', 'date', 'customer_id', 'product_id', 'quantity', 'price']
+
+
+def _schema():
+    return pa.schema([('sale_id', pa.int64()), ('date', pa.timestamp('us')),
+                      ('customer_id', pa.int64()), ('product_id', pa.int64()),
+                      ('quantity', pa.int64()), ('price', pa.float64())])
+
+
+def _live_batches(start, end, chunk_size):
+    conn = db.session.connection()
+    # SQLite stores dates as ISO strings: let Arrow parse them per chunk
+    # rather than building a datetime per row
+    raw_dates = conn.dialect.name == 'sqlite'
+    query = select(SaleItem.sale_id, type_coerce(Sale.date, String) if raw_dates else Sale.date,
+                   Sale.customer_id, SaleItem.product_id, SaleItem.quantity, SaleItem.price)\
+        .join(Sale, SaleItem.sale_id == Sale.id)
+    if start is not None:
+        query = query.where(Sale.date >= start)
+    if end is not None:
+        query = query.where(Sale.date <= end)
+    schema = _schema()
+    # Core rows, not the ORM session: no per-row entity processing
+    result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        if raw_dates:
+            columns[1] = pa.array(columns[1], pa.string()).cast(pa.timestamp('us'))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema)
+
+
+def line_items(start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Every line item in [start, end], live and archived, as an Arrow table
+    with a revenue and a category_id column."""
+    if pa is None:
+        raise RuntimeError("Analytics needs pyarrow: pip install pyarrow")
+    tables = [pa.Table.from_batches(_live_batches(start, end, chunk_size), schema=_schema())]
+    archived = archive.line_items(archive.archive_dir(), start, end)
+    if archived is not None:
+        tables.append(archived.select(COLUMNS).cast(_schema()))
+    items = pa.concat_tables(tables)
+
+    products = db.session.execute(select(Product.id, Product.category_id)).all()
+    positions = pc.index_in(items['product_id'], value_set=pa.array([p for p, _ in products], pa.int64()))
+    category = pc.take(pa.array([c for _, c in products], pa.int64()), positions)
+    return items.append_column('revenue', pc.multiply(items['quantity'], items['price']))\
+        .append_column('category_id', category)
+
+
+def _round(values):
+    return [round(v or 0, 2) for v in values]
+
+
+def category_weekly(items):
+    """Revenue and units per category per week (weeks start on Monday)."""
+    week = pc.floor_temporal(items['date'], unit='week', week_starts_monday=True)
+    grouped = pa.table({'week': week, 'category_id': items['category_id'],
+                        'revenue': items['revenue'], 'quantity': items['quantity']})\
+        .group_by(['week', 'category_id']).aggregate([('revenue', 'sum'), ('quantity', 'sum')])
+    cells = {(r['category_id'], r['week'].strftime('%Y-%m-%d')): r for r in grouped.to_pylist()}
+    weeks = sorted({week for _, week in cells})
+    names = dict(db.session.execute(select(Category.id, Category.name)).all())
+    ids = sorted({cid for cid, _ in cells}, key=lambda cid: (cid is None, names.get(cid, '')))
+    empty = {'revenue_sum': 0, 'quantity_sum': 0}
+    return {
+        "weeks": weeks,
+        "categories": [{
+            "id": cid,
+            "name": names.get(cid, "Uncategorized") if cid is not None else "Uncategorized",
+            "revenue": _round(cells.get((cid, w), empty)['revenue_sum'] for w in weeks),
+            "quantity": [cells.get((cid, w), empty)['quantity_sum'] for w in weeks]
+        } for cid in ids]
+    }
+
+
+def hourly(items):
+    """Sales and revenue by weekday and hour of day, as 7 x 24 grids."""
+    grouped = pa.table({'weekday': pc.day_of_week(items['date']), 'hour': pc.hour(items['date']),
+                        'sale_id': items['sale_id'], 'revenue': items['revenue']})\
+        .group_by(['weekday', 'hour']).aggregate([('sale_id', 'count_distinct'), ('revenue', 'sum')])
+    sales = [[0] * 24 for _ in WEEKDAYS]
+    revenue = [[0] * 24 for _ in WEEKDAYS]
+    for r in grouped.to_pylist():
+        sales[r['weekday']][r['hour']] = r['sale_id_count_distinct']
+        revenue[r['weekday']][r['hour']] = round(r['revenue_sum'], 2)
+    return {"days": WEEKDAYS, "hours": list(range(24)), "sales": sales, "revenue": revenue}
+
+
+def baskets(items):
+    """Distribution of units per sale, with the average basket."""
+    per_sale = items.group_by('sale_id').aggregate([('quantity', 'sum'), ('revenue', 'sum')])
+    size = pc.min_element_wise(per_sale['quantity_sum'], MAX_BASKET)
+    counts = pa.table({'size': size}).group_by('size').aggregate([('size', 'count')])
+    sales = per_sale.num_rows
+    return {
+        "buckets": [{"items": f"{r['size']}+" if r['size'] == MAX_BASKET else str(r['size']),
+                     "sales": r['size_count']}
+                    for r in counts.sort_by('size').to_pylist()],
+        "sales": sales,
+        "average_items": round(pc.mean(per_sale['quantity_sum']).as_py() or 0, 2),
+        "average_value": round(pc.mean(per_sale['revenue_sum']).as_py() or 0, 2)
+    }
+
+
+def cohorts(items):
+    """Customers grouped by the month of their first purchase in the range,
+    with how many of them bought again in each following month."""
+    items = items.filter(pc.is_valid(items['customer_id']))
+    month = pc.add(pc.multiply(pc.year(items['date']), 12), pc.subtract(pc.month(items['date']), 1))
+    visits = pa.table({'customer_id': items['customer_id'], 'month': month,
+                       'revenue': items['revenue']})
+    first = visits.group_by('customer_id').aggregate([('month', 'min')])
+    visits = visits.join(first, keys='customer_id')
+    visits = visits.append_column('offset', pc.subtract(visits['month'], visits['month_min']))
+    grouped = visits.group_by(['month_min', 'offset'])\
+        .aggregate([('customer_id', 'count_distinct'), ('revenue', 'sum')])
+
+    rows = {}
+    for r in grouped.to_pylist():
+        rows.setdefault(r['month_min'], {})[r['offset']] = r
+    result = []
+    for cohort in sorted(rows):
+        cells = rows[cohort]
+        span = max(cells) + 1
+        result.append({
+            "month": f"{cohort // 12:04d}-{cohort % 12 + 1:02d}",
+            "customers": cells[0]['customer_id_count_distinct'],
+            "active": [cells[n]['customer_id_count_distinct'] if n in cells else 0 for n in range(span)],
+            "revenue": _round(cells[n]['revenue_sum'] if n in cells else 0 for n in range(span))
+        })
+    return {"cohorts": result}
+
+
+REPORTS = {
+    "category-weekly": category_weekly,
+    "hourly": hourly,
+    "baskets": baskets,
+    "cohorts": cohorts,
+}
+
+
+def report(name, from_date=None, to_date=None):
+    """One of REPORTS over the date range, cached until a sale is recorded
+    and the result is ANALYTICS_MAX_AGE seconds old."""
+    start, end = archive.date_bounds(from_date, to_date)
+    max_age = float(current_app.config.get('ANALYTICS_MAX_AGE', DEFAULT_MAX_AGE))
+    return catalog.cached('sales', f"analytics:{name}:{from_date}:{to_date}",
+                          lambda: REPORTS[name](line_items(start, end)),
+                          watermark=sales_watermark(), max_age=max_age)
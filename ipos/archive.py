@@ -0,0 +1,478 @@
+# ipos/archive.py
+#
+# Closed months of sales move out of the sale and sale_item tables into
+# Parquet files, one directory per month under instance/archive (ARCHIVE_DIR):
+#
+#   2024-01/sales.parquet   id, date, total, customer_id, customer_name
+#   2024-01/items.parquet   sale_id, date, customer_name, product_id,
+#                           product_name, quantity, price
+#
+# Both files are sorted by (date, id). index.json lists the archived months
+# with their id range and totals. The live tables keep only the last
+# ARCHIVE_KEEP_MONTHS months, so their size and index depth stay bounded no
+# matter how long the store has been trading. Reports, exports, the sales
+# search, receipts, customer histories and the rollup rebuilds read archived
+# months through the functions below and merge them with live rows; the
+# daily, product and customer rollups keep covering all of history.
+#
+#   flask --app app archive-sales [--keep-months 6]
+import functools
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, date
+from flask import current_app
+from sqlalchemy import select, delete, func
+from ipos.db import db
+from ipos.pagination import decode_cursor, split_page
+from model import Product, Customer, Sale, SaleItem
+
+try:
+    import pyarrow as pa  # optional until the first month is archived
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+KEEP_MONTHS = 6
+DELETE_BATCH = 1000
+
+# Shaped like the live sale rows (serialize.sale_query, reports.sales_page_stmt)
+ArchivedSale = namedtuple('ArchivedSale', 'id date total customer_id customer_name')
+
+_index_cache = {}
+_lock = threading.Lock()
+
+
+def archive_dir():
+    return current_app.config.get('ARCHIVE_DIR') or \
+        os.path.join(current_app.instance_path, 'archive')
+
+
+def _require():
+    if pa is None:
+        raise RuntimeError("The sales archive needs pyarrow: pip install pyarrow")
+
+
+def _schemas():
+    sales = pa.schema([('id', pa.int64()), ('date', pa.timestamp('us')),
+                       ('total', pa.float64()), ('customer_id', pa.int64()),
+                       ('customer_name', pa.string())])
+    items = pa.schema([('sale_id', pa.int64()), ('date', pa.timestamp('us')),
+                       ('customer_name', pa.string()), ('product_id', pa.int64()),
+                       ('product_name', pa.string()), ('quantity', pa.int64()),
+                       ('price', pa.float64())])
+    return {'sales': sales, 'items': items}
+
+
+def date_bounds(from_date=None, to_date=None):
+    """(start, end) datetimes for inclusive YYYY-MM-DD bounds, as the SQL
+    filters apply them; raises ValueError on a malformed date."""
+    start = datetime.fromisoformat(from_date) if from_date else None
+    end = datetime.fromisoformat(to_date + " 23:59:59") if to_date else None
+    return start, end
+
+
+def month_start(month):
+    return datetime.strptime(month, '%Y-%m')
+
+
+def _add_months(d, n):
+    months = d.year * 12 + d.month - 1 + n
+    return d.replace(year=months // 12, month=months % 12 + 1, day=1)
+
+
+def index(folder):
+    """{month: info} for every archived month; re-read when index.json changes."""
+    path = os.path.join(folder, 'index.json')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _index_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = (mtime, json.load(f))
+        _index_cache[path] = cached
+    return cached[1]
+
+
+def months(folder, start=None, end=None):
+    """Archived months overlapping [start, end], newest first."""
+    found = []
+    for month in index(folder):
+        first = month_start(month)
+        if (end is None or first <= end) and (start is None or _add_months(first, 1) > start):
+            found.append(month)
+    return sorted(found, reverse=True)
+
+
+def _path(folder, month, name):
+    return os.path.join(folder, month, f"{name}.parquet")
+
+
+@functools.lru_cache(maxsize=24)
+def _read(path, mtime):
+    return pq.read_table(path)
+
+
+def _table(folder, month, name):
+    path = _path(folder, month, name)
+    return _read(path, os.stat(path).st_mtime_ns)
+
+
+def _between(table, start, end):
+    if start is not None:
+        table = table.filter(pc.greater_equal(table['date'], pa.scalar(start, pa.timestamp('us'))))
+    if end is not None:
+        table = table.filter(pc.less_equal(table['date'], pa.scalar(end, pa.timestamp('us'))))
+    return table
+
+
+def _before(table, cursor, id_col):
+    # Keyset condition (date, id) < cursor, as pagination.keyset_query()
+    when, id = decode_cursor(cursor)
+    when = pa.scalar(when, pa.timestamp('us'))
+    return table.filter(pc.or_(pc.less(table['date'], when),
+                               pc.and_(pc.equal(table['date'], when),
+                                       pc.less(table[id_col], id))))
+
+
+def _tables(folder, found, name, start, end):
+    return pa.concat_tables([_between(_table(folder, m, name), start, end) for m in found])
+
+
+def sales_page(folder, start=None, end=None, cursor=None, limit=50, found=None, customer_id=None,
+               match=None):
+    """Up to limit + 1 archived sales after ``cursor``, newest first,
+    optionally of one customer. ``match(month, sales)`` narrows each month's
+    sales table further (see sales_search.SalesFilter.archive_match)."""
+    found = months(folder, start, end) if found is None else found
+    if found:
+        _require()
+    rows = []
+    for month in found:
+        sales = _between(_table(folder, month, 'sales'), start, end)
+        if customer_id is not None:
+            sales = sales.filter(pc.equal(sales['customer_id'], customer_id))
+        if match is not None:
+            sales = match(month, sales)
+        if cursor:
+            sales = _before(sales, cursor, 'id')
+        wanted = limit + 1 - len(rows)
+        tail = sales.slice(max(0, sales.num_rows - wanted))
+        rows += [ArchivedSale(**r) for r in reversed(tail.to_pylist())]
+        if len(rows) > limit:
+            break
+    return rows
+
+
+def filter_sales(folder, month, sales, sale_id=None, customer_ids=None, customer_name=None,
+                 product_ids=None, product_name=None, min_total=None, max_total=None):
+    """One month's archived sales narrowed like sales_search.SalesFilter.apply().
+    ``sale_id``, ``customer_ids`` and ``customer_name`` are alternatives; the
+    product and amount conditions must all hold. Names match case-insensitively
+    anywhere in the name recorded at archiving time."""
+    if sale_id is not None or customer_ids is not None or customer_name:
+        keep = pc.is_in(sales['customer_id'], value_set=pa.array(customer_ids or [], pa.int64()))
+        if sale_id is not None:
+            keep = pc.or_kleene(keep, pc.equal(sales['id'], sale_id))
+        if customer_name:
+            keep = pc.or_kleene(keep, pc.match_substring(sales['customer_name'], customer_name,
+                                                         ignore_case=True))
+        sales = sales.filter(keep)
+    if product_ids is not None or product_name:
+        items = _table(folder, month, 'items')
+        keep = pc.is_in(items['product_id'], value_set=pa.array(product_ids or [], pa.int64()))
+        if product_name:
+            keep = pc.or_kleene(keep, pc.match_substring(items['product_name'], product_name,
+                                                         ignore_case=True))
+        sale_ids = pc.unique(items.filter(keep)['sale_id'])
+        sales = sales.filter(pc.is_in(sales['id'], value_set=sale_ids))
+    if min_total is not None:
+        sales = sales.filter(pc.greater_equal(sales['total'], min_total))
+    if max_total is not None:
+        sales = sales.filter(pc.less_equal(sales['total'], max_total))
+    return sales
+
+
+def sales_totals(folder, found, start=None, end=None, match=None):
+    """(count, income) of the archived sales in ``found`` months, narrowed
+    by ``match`` as in sales_page()."""
+    if found:
+        _require()
+    count, income = 0, 0
+    for month in found:
+        sales = _between(_table(folder, month, 'sales'), start, end)
+        if match is not None:
+            sales = match(month, sales)
+        count += sales.num_rows
+        income += pc.sum(sales['total']).as_py() or 0
+    return count, income
+
+
+def merged_page(rows, archived, limit):
+    """split_page() over live and archived rows of the same keyset page."""
+    rows = sorted([*rows, *archived], key=lambda r: (r.date, r.id), reverse=True)
+    return split_page(rows[:limit + 1], Sale.date, Sale.id, limit)
+
+
+def report(folder, f, cursor=None, limit=50):
+    """The archived part of a report, as rows shaped like the live statements
+    (see reports.report_statements); None when no archived month is in range."""
+    start, end = f.bounds
+    found = months(folder, start, end)
+    if not found:
+        return None
+    _require()
+    sales = _tables(folder, found, 'sales', start, end)
+    items = _tables(folder, found, 'items', start, end)
+    if f.product_id:
+        items = items.filter(pc.equal(items['product_id'], f.product_id))
+    items = items.append_column('revenue', pc.multiply(items['quantity'], items['price']))
+
+    by_product = items.group_by(['product_id', 'product_name'])\
+        .aggregate([('quantity', 'sum'), ('revenue', 'sum')])
+    by_day = pa.table({'day': pc.strftime(sales['date'], format='%Y-%m-%d'),
+                       'total': sales['total']})\
+        .group_by('day').aggregate([('total', 'count'), ('total', 'sum')])
+    return {
+        "totals": [(sales.num_rows, pc.sum(sales['total']).as_py() or 0)],
+        "sales": sales_page(folder, start, end, cursor, limit, found),
+        "product_sales": [(r['product_id'], r['product_name'], r['quantity_sum'], r['revenue_sum'])
+                          for r in by_product.to_pylist()],
+        "daily": [(r['day'], r['total_count'], r['total_sum']) for r in by_day.to_pylist()],
+    }
+
+
+def line_items(folder, start=None, end=None):
+    """Archived line items in range with their sale's customer_id, as one
+    Arrow table; None when no archived month is in range."""
+    found = months(folder, start, end)
+    if not found:
+        return None
+    _require()
+    sales = _tables(folder, found, 'sales', start, end).select(['id', 'customer_id'])
+    items = _tables(folder, found, 'items', start, end)
+    return items.join(sales, keys='sale_id', right_keys='id')
+
+
+def export_rows(folder, from_date=None, to_date=None, product_id=None, chunk_size=2000):
+    """Yield archived line items as (date, sale_id, product, customer,
+    quantity, price), newest first, ``chunk_size`` rows at a time."""
+    start, end = date_bounds(from_date, to_date)
+    found = months(folder, start, end)
+    if found:
+        _require()
+    for month in found:
+        items = _between(_table(folder, month, 'items'), start, end)
+        if product_id:
+            sale_ids = pc.unique(items.filter(pc.equal(items['product_id'], int(product_id)))['sale_id'])
+            items = items.filter(pc.is_in(items['sale_id'], value_set=sale_ids))
+        # Stable sort: lines keep their order within each sale
+        items = items.sort_by([('date', 'descending'), ('sale_id', 'descending')])
+        for offset in range(0, items.num_rows, chunk_size):
+            for r in items.slice(offset, chunk_size).to_pylist():
+                yield (r['date'], r['sale_id'], r['product_name'], r['customer_name'],
+                       r['quantity'], r['price'])
+
+
+def receipt(folder, sale_id):
+    """An archived sale shaped like receipts.receipt_data(), or None."""
+    for month, info in index(folder).items():
+        if not info['first_id'] <= sale_id <= info['last_id']:
+            continue
+        _require()
+        sales = _table(folder, month, 'sales')
+        found = sales.filter(pc.equal(sales['id'], sale_id)).to_pylist()
+        if not found:
+            continue  # a late sale filed under another month
+        sale = found[0]
+        items = _table(folder, month, 'items')
+        lines = items.filter(pc.equal(items['sale_id'], sale_id)).to_pylist()
+        return {
+            "id": sale['id'],
+            "date": sale['date'],
+            "total": sale['total'],
+            "customer_id": sale['customer_id'],
+            "customer_name": sale['customer_name'] or "Walk-in",
+            "items": [{"product_name": i['product_name'], "quantity": i['quantity'],
+                       "price": i['price'], "subtotal": round(i['quantity'] * i['price'], 2)}
+                      for i in lines]
+        }
+    return None
+
+
+def rollup_totals(folder):
+    """({day: (sales, items, revenue)}, {product_id: (quantity, revenue)})
+    over every archived month, for rollups.rebuild()."""
+    found = months(folder)
+    if not found:
+        return {}, {}
+    _require()
+    sales = _tables(folder, found, 'sales', None, None)
+    items = _tables(folder, found, 'items', None, None)
+    by_day = pa.table({'day': pc.strftime(sales['date'], format='%Y-%m-%d'), 'total': sales['total']})\
+        .group_by('day').aggregate([('total', 'count'), ('total', 'sum')])
+    items_by_day = pa.table({'day': pc.strftime(items['date'], format='%Y-%m-%d'),
+                             'quantity': items['quantity']})\
+        .group_by('day').aggregate([('quantity', 'sum')])
+    quantities = {r['day']: r['quantity_sum'] for r in items_by_day.to_pylist()}
+    days = {date.fromisoformat(r['day']): (r['total_count'], quantities.get(r['day'], 0), r['total_sum'])
+            for r in by_day.to_pylist()}
+
+    items = items.append_column('revenue', pc.multiply(items['quantity'], items['price']))
+    by_product = items.group_by('product_id').aggregate([('quantity', 'sum'), ('revenue', 'sum')])
+    products = {r['product_id']: (r['quantity_sum'], r['revenue_sum']) for r in by_product.to_pylist()}
+    return days, products
+
+
+def customer_totals(folder):
+    """({customer_id: (orders, spent, first, last)}, {(customer_id,
+    product_id): quantity}) over every archived month, for
+    customer_stats.rebuild()."""
+    found = months(folder)
+    if not found:
+        return {}, {}
+    _require()
+    sales = _tables(folder, found, 'sales', None, None)
+    sales = sales.filter(pc.is_valid(sales['customer_id']))
+    by_customer = sales.group_by('customer_id').aggregate(
+        [('total', 'count'), ('total', 'sum'), ('date', 'min'), ('date', 'max')])
+    customers = {r['customer_id']: (r['total_count'], r['total_sum'], r['date_min'], r['date_max'])
+                 for r in by_customer.to_pylist()}
+    items = line_items(folder)
+    items = items.filter(pc.is_valid(items['customer_id']))
+    by_pair = items.group_by(['customer_id', 'product_id']).aggregate([('quantity', 'sum')])
+    quantities = {(r['customer_id'], r['product_id']): r['quantity_sum'] for r in by_pair.to_pylist()}
+    return customers, quantities
+
+
+# ----------------------------------------
+# Archiving
+# ----------------------------------------
+
+def _write_table(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, path)
+
+
+def _write_index(folder, entries):
+    path = os.path.join(folder, 'index.json')
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(dict(sorted(entries.items())), f, indent=1)
+    os.replace(tmp, path)
+
+
+def _month_info(sales, items):
+    return {
+        "sales": sales.num_rows,
+        "items": items.num_rows,
+        "revenue": round(pc.sum(sales['total']).as_py() or 0, 2),
+        "first_id": pc.min(sales['id']).as_py(),
+        "last_id": pc.max(sales['id']).as_py(),
+        "archived_at": datetime.utcnow().isoformat(timespec='seconds'),
+    }
+
+
+def _live_month(first, end):
+    # The newest sale always stays live: SQLite (and MySQL before 8.0 after a
+    # restart) hands out max(id) + 1, so archiving it would let the next sale
+    # reuse an archived id
+    newest = db.session.query(func.max(Sale.id)).scalar()
+    sales = db.session.execute(
+        select(Sale.id, Sale.date, Sale.total, Sale.customer_id,
+               Customer.name.label('customer_name'))
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+        .where(Sale.date >= first, Sale.date < end, Sale.id != newest)
+        .order_by(Sale.date, Sale.id)).all()
+    items = db.session.execute(
+        select(SaleItem.sale_id, Sale.date, Customer.name.label('customer_name'),
+               SaleItem.product_id, Product.name.label('product_name'),
+               SaleItem.quantity, SaleItem.price)
+        .join(Sale, SaleItem.sale_id == Sale.id)
+        .join(Product, SaleItem.product_id == Product.id)
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+        .where(Sale.date >= first, Sale.date < end, Sale.id != newest)
+        .order_by(Sale.date, Sale.id, SaleItem.id)).all()
+    schemas = _schemas()
+    return (pa.Table.from_pylist([r._asdict() for r in sales], schema=schemas['sales']),
+            pa.Table.from_pylist([r._asdict() for r in items], schema=schemas['items']))
+
+
+def _merge(folder, month, name, live, ids, id_col):
+    # Sales dated into an already archived month (offline tills syncing
+    # late), or rows left live by an interrupted run: keep one copy of each
+    path = _path(folder, month, name)
+    if not os.path.exists(path):
+        return live
+    old = pq.read_table(path)
+    old = old.filter(pc.invert(pc.is_in(old[id_col], value_set=ids)))
+    return pa.concat_tables([old, live]).sort_by([('date', 'ascending'), (id_col, 'ascending')])
+
+
+def archive_month(folder, month):
+    """Move one month of live sales into the archive; returns its sale count."""
+    first = month_start(month)
+    sales, items = _live_month(first, _add_months(first, 1))
+    if not sales.num_rows:
+        return 0
+    ids = sales['id']
+    sales = _merge(folder, month, 'sales', sales, ids, 'id')
+    items = _merge(folder, month, 'items', items, ids, 'sale_id')
+    _write_table(sales, _path(folder, month, 'sales'))
+    _write_table(items, _path(folder, month, 'items'))
+
+    # The files are in place before the rows go, and the month is listed in
+    # the index only after they are gone, so a crash never loses a sale
+    ids = ids.to_pylist()
+    for n in range(0, len(ids), DELETE_BATCH):
+        batch = ids[n:n + DELETE_BATCH]
+        db.session.execute(delete(SaleItem).where(SaleItem.sale_id.in_(batch)))
+        db.session.execute(delete(Sale).where(Sale.id.in_(batch)))
+    db.session.commit()
+
+    entries = dict(index(folder))
+    entries[month] = _month_info(sales, items)
+    _write_index(folder, entries)
+    return len(ids)
+
+
+def _recover(folder):
+    # Months written by a run that stopped before updating the index
+    entries = dict(index(folder))
+    missing = [m for m in sorted(os.listdir(folder)) if m not in entries
+               and os.path.exists(_path(folder, m, 'sales'))
+               and os.path.exists(_path(folder, m, 'items'))]
+    for month in missing:
+        entries[month] = _month_info(pq.read_table(_path(folder, month, 'sales')),
+                                     pq.read_table(_path(folder, month, 'items')))
+    if missing:
+        _write_index(folder, entries)
+
+
+def archive_closed_months(keep_months=KEEP_MONTHS, echo=print):
+    """Archive every month older than the current one and the ``keep_months``
+    before it; returns the number of sales moved."""
+    _require()
+    folder = archive_dir()
+    os.makedirs(folder, exist_ok=True)
+    with _lock:
+        _recover(folder)
+        midnight = dict(hour=0, minute=0, second=0, microsecond=0)
+        cutoff = _add_months(datetime.utcnow().replace(day=1, **midnight), -keep_months)
+        oldest = db.session.query(func.min(Sale.date)).filter(Sale.date < cutoff).scalar()
+        current = oldest.replace(day=1, **midnight) if oldest else cutoff
+        moved = 0
+        while current < cutoff:
+            month = current.strftime('%Y-%m')
+            count = archive_month(folder, month)
+            if count:
+                echo(f"Archived {count} sales from {month}")
+            moved += count
+            current = _add_months(current, 1)
+        return moved
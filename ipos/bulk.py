@@ -0,0 +1,441 @@
+# ipos/bulk.py
+#
+# Bulk catalog import and export for products and customers, as CSV or JSON
+# lines. Input is read and validated one row at a time; valid rows are
+# written BATCH_SIZE at a time, each batch a few executemany / INSERT ... ON
+# CONFLICT statements and one commit. If a batch hits a constraint, it is
+# rolled back and retried row by row, so only the offending rows are
+# rejected. Every rejected row is reported with its line number.
+#
+# Products are matched by id when the row has one, otherwise by barcode, and
+# a row needs one of the two so re-importing a file updates rather than
+# duplicates. Customers are matched by id, then email; rows with neither are
+# added. Category names resolve through an in-memory name -> id map, and
+# unknown names create the category.
+import csv
+import io
+import json
+import math
+from itertools import groupby
+from sqlalchemy import select, insert, update, or_
+from sqlalchemy.exc import IntegrityError, DataError
+from ipos.db import db, upsert
+from ipos import inventory
+from ipos.inventory import InventoryError
+from model import Category, Product, Customer, StockLevel, phone_digits
+
+FORMATS = ('csv', 'jsonl')
+BATCH_SIZE = 5000
+MAX_ERRORS = 1000  # rejected rows listed in a result; the count is always exact
+EXPORT_CHUNK = 2000
+
+PRODUCT_FIELDS = ['id', 'barcode', 'name', 'price', 'stock', 'reorder_level',
+                  'category', 'description']
+CUSTOMER_FIELDS = ['id', 'name', 'email', 'phone']
+
+
+def guess_format(filename=None, mimetype=None):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')) or mimetype in ('application/jsonl',
+                                                             'application/x-ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line, row, error) from a text stream; ``row`` is a dict, or
+    None with ``error`` set when the line cannot be parsed."""
+    if fmt == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                yield line, None, "Invalid JSON"
+                continue
+            if isinstance(row, dict):
+                yield line, row, None
+            else:
+                yield line, None, "Expected a JSON object"
+    elif fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # line_num is the physical line the row ended on
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}, None
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+# ----------------------------------------
+# Row validation
+# ----------------------------------------
+
+def _text(row, key, size, required=False):
+    value = row.get(key)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        if required:
+            raise ValueError(f"{key} is required")
+        return None
+    if len(value) > size:
+        raise ValueError(f"{key} is longer than {size} characters")
+    return value
+
+
+def _number(row, key, cast, required=False):
+    raw = row.get(key)
+    if raw is None or str(raw).strip() == '':
+        if required:
+            raise ValueError(f"{key} is required")
+        return None
+    if isinstance(raw, bool):  # JSON true/false would pass as 1/0
+        raise ValueError(f"Invalid {key}: {raw!r}")
+    text = raw.strip() if isinstance(raw, str) else raw
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key}: {raw!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"Invalid {key}: {raw!r}")
+    if cast is int:
+        if not value.is_integer():
+            raise ValueError(f"{key} must be a whole number, not {raw!r}")
+        value = text if isinstance(text, int) else int(value)
+    if value < 0:
+        raise ValueError(f"{key} cannot be negative")
+    return value
+
+
+def _product(row):
+    values = {
+        "id": _number(row, 'id', int),
+        "name": _text(row, 'name', 100, required=True),
+        "price": _number(row, 'price', float, required=True),
+        "stock": _number(row, 'stock', int),
+        "reorder_level": _number(row, 'reorder_level', int),
+    }
+    # Optional columns only change the product when the row has them
+    if 'barcode' in row:
+        values['barcode'] = _text(row, 'barcode', 64)
+    if not values['id'] and not values.get('barcode'):
+        raise ValueError("barcode or id is required")
+    if 'description' in row:
+        values['description'] = row['description'] or ''
+    if 'category' in row:
+        values['category'] = _text(row, 'category', 100)
+    elif 'category_id' in row:
+        values['category_id'] = _number(row, 'category_id', int)
+    return values
+
+
+def _customer(row):
+    values = {
+        "id": _number(row, 'id', int),
+        "name": _text(row, 'name', 100, required=True),
+    }
+    for key, size in (('email', 120), ('phone', 20)):
+        if key in row:
+            values[key] = _text(row, key, size)
+    if 'phone' in values:
+        values['phone_digits'] = phone_digits(values['phone'])
+    return values
+
+
+# ----------------------------------------
+# Batch writers
+# ----------------------------------------
+
+class RowError(Exception):
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+
+
+def _by_columns(values):
+    """Group row dicts by their set of keys: one executemany per group."""
+    def keys(v):
+        return sorted(v)
+    return [list(group) for _, group in groupby(sorted(values, key=keys), key=keys)]
+
+
+def _last_wins(rows, key):
+    """Keep only the last row for each record a batch names more than once."""
+    rows = {key(v) or ('new', n): (line, v) for n, (line, v) in enumerate(rows)}
+    return list(rows.values())
+
+
+def _set_all(columns):
+    return lambda row, new: {c: new[c] for c in columns}
+
+
+def _write(model, by_id, by_key, key, inserts=()):
+    """Update rows matched by id, upsert rows matched by ``key``, insert the
+    rest, each as one statement per set of columns."""
+    for group in _by_columns(by_id):
+        db.session.execute(update(model), group)
+    # Inserts go straight to the connection: Core executemany, without the
+    # ORM's per-row bulk bookkeeping
+    conn = db.session.connection()
+    for group in _by_columns(by_key):
+        columns = [c for c in group[0] if c != key]
+        conn.execute(upsert(model, [key], _set_all(columns)), group)
+    for group in _by_columns(inserts):
+        conn.execute(insert(model), group)
+
+
+class Categories:
+    """Category name -> id, loaded once per import; unknown names are added.
+    Names match case-insensitively: an existing category keeps its
+    spelling, and a new one takes the first spelling the import used."""
+
+    def __init__(self):
+        self.ids = {name.casefold(): id for id, name in
+                    db.session.execute(select(Category.id, Category.name))}
+
+    def resolve(self, names):
+        missing = {}
+        for n in names:
+            if n and n.casefold() not in self.ids:
+                missing.setdefault(n.casefold(), n)
+        if missing:
+            db.session.execute(insert(Category), [{"name": n} for n in missing.values()])
+            db.session.commit()
+            self.ids.update((name.casefold(), id) for id, name in db.session.execute(
+                select(Category.id, Category.name).where(Category.name.in_(missing.values()))))
+        return self.ids
+
+
+def write_products(rows, categories):
+    """Write a batch of (line, values); returns (inserted, updated)."""
+    ids = {v['id'] for _, v in rows if v['id']}
+    barcodes = {v['barcode'] for _, v in rows if v.get('barcode')}
+
+    def current():
+        return db.session.execute(
+            select(Product.id, Product.barcode, StockLevel.quantity)
+            .outerjoin(StockLevel, StockLevel.product_id == Product.id)
+            .where(or_(Product.id.in_(ids), Product.barcode.in_(barcodes)))).all()
+
+    existing = current()
+    known = {id for id, _, _ in existing}
+    owner = {barcode: id for id, barcode, _ in existing if barcode}
+    names = categories.resolve([v['category'] for _, v in rows if v.get('category')])
+
+    by_id, by_barcode, stock, reorder = [], [], {}, {}
+    inserted = 0
+    for line, v in _last_wins(rows, lambda v: v['id'] or v.get('barcode')):
+        key, barcode = v['id'] or v['barcode'], v.get('barcode')
+        if v['id'] and v['id'] not in known:
+            raise RowError(line, f"No product with id {v['id']}")
+        if v['id'] and barcode and owner.get(barcode, v['id']) != v['id']:
+            raise RowError(line, f"Barcode {barcode} belongs to product {owner[barcode]}")
+        values = {k: v[k] for k in v if k not in ('stock', 'reorder_level', 'category')}
+        if 'category' in v:
+            values['category_id'] = names.get(v['category'].casefold()) if v['category'] else None
+        if v['id']:
+            by_id.append(values)
+        else:
+            del values['id']
+            by_barcode.append(values)
+            inserted += barcode not in owner
+        if v['stock'] is not None:
+            stock[key] = v['stock']
+        if v['reorder_level'] is not None:
+            reorder[key] = v['reorder_level']
+
+    _write(Product, by_id, by_barcode, 'barcode')
+
+    # New products open their stock in the ledger; for existing ones the
+    # imported figure is recorded as a stock count
+    opening, counts, levels = {}, {}, {}
+    for id, barcode, quantity in current():
+        key = id if id in ids else barcode
+        if quantity is None:
+            opening[id] = stock.get(key, 0)
+        elif key in stock:
+            counts[id] = stock[key]
+        if key in reorder:
+            levels[id] = reorder[key]
+    if opening:
+        inventory.open_stock(opening, levels)
+    if counts:
+        inventory.set_levels(counts, note="Catalog import")
+    levels = {id: level for id, level in levels.items() if id not in opening}
+    if levels:
+        inventory.set_reorder_levels(levels)
+    return inserted, len(by_id) + len(by_barcode) - inserted
+
+
+def write_customers(rows, categories=None):
+    ids = {v['id'] for _, v in rows if v['id']}
+    emails = {v['email'] for _, v in rows if v.get('email')}
+    existing = db.session.execute(
+        select(Customer.id, Customer.email)
+        .where(or_(Customer.id.in_(ids), Customer.email.in_(emails)))).all()
+    known = {id for id, _ in existing}
+    owner = {email: id for id, email in existing if email}
+
+    by_id, by_email, new = [], [], []
+    inserted = 0
+    rows = _last_wins(rows, lambda v: v['id'] or v.get('email'))
+    for line, v in rows:
+        if v['id'] and v['id'] not in known:
+            raise RowError(line, f"No customer with id {v['id']}")
+        if v['id'] and v.get('email') and owner.get(v['email'], v['id']) != v['id']:
+            raise RowError(line, f"Email {v['email']} belongs to customer {owner[v['email']]}")
+        values = dict(v)
+        if v['id']:
+            by_id.append(values)
+            continue
+        del values['id']
+        if v.get('email'):
+            by_email.append(values)
+            inserted += v['email'] not in owner
+        else:
+            new.append(values)
+            inserted += 1
+    _write(Customer, by_id, by_email, 'email', new)
+    return inserted, len(rows) - inserted
+
+
+IMPORTERS = {
+    "products": (_product, write_products),
+    "customers": (_customer, write_customers),
+}
+
+
+# ----------------------------------------
+# Import
+# ----------------------------------------
+
+class ImportResult:
+    def __init__(self):
+        self.rows = self.inserted = self.updated = self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        return {"rows": self.rows, "inserted": self.inserted, "updated": self.updated,
+                "rejected": self.rejected, "errors": sorted(self.errors, key=lambda e: e['line'])}
+
+
+def _message(e):
+    return str(getattr(e, 'orig', None) or e).splitlines()[0]
+
+
+def _flush(batch, write, categories, result):
+    try:
+        inserted, updated = write(batch, categories)
+        db.session.commit()
+    except (RowError, IntegrityError, DataError, InventoryError) as e:
+        db.session.rollback()
+        if len(batch) == 1:
+            result.reject(getattr(e, 'line', batch[0][0]), _message(e))
+            return
+        # Find the offending rows: retry the batch one row at a time
+        for row in batch:
+            _flush([row], write, categories, result)
+        return
+    result.inserted += inserted
+    result.updated += updated
+
+
+def import_rows(kind, stream, fmt, batch_size=BATCH_SIZE):
+    """Import products or customers from a text stream of CSV or JSON lines.
+
+    Returns an ImportResult; valid rows are committed batch by batch even
+    when others are rejected.
+    """
+    validate, write = IMPORTERS[kind]
+    categories = Categories() if kind == 'products' else None
+    result = ImportResult()
+    batch = []
+    rows = read_rows(stream, fmt)
+    while True:
+        try:
+            line, row, error = next(rows)
+        except StopIteration:
+            break
+        except (csv.Error, UnicodeDecodeError) as e:
+            result.reject(result.rows + 1, f"Unreadable input: {e}")
+            break
+        result.rows += 1
+        if error is None:
+            try:
+                batch.append((line, validate(row)))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            result.reject(line, error)
+        if len(batch) >= batch_size:
+            _flush(batch, write, categories, result)
+            batch = []
+    if batch:
+        _flush(batch, write, categories, result)
+    return result
+
+
+def text_stream(binary):
+    """Decode an uploaded byte stream for import (UTF-8, BOM optional)."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+# ----------------------------------------
+# Export
+# ----------------------------------------
+
+def _stream(query, chunk_size):
+    return db.session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+
+
+def export_products(chunk_size=EXPORT_CHUNK):
+    """Yield product rows in PRODUCT_FIELDS order, in id order."""
+    query = select(Product.id, Product.barcode, Product.name, Product.price,
+                   StockLevel.quantity, StockLevel.reorder_level, Category.name,
+                   Product.description)\
+        .outerjoin(StockLevel, StockLevel.product_id == Product.id)\
+        .outerjoin(Category, Product.category_id == Category.id)\
+        .order_by(Product.id)
+    for id, barcode, name, price, stock, reorder, category, description in _stream(query, chunk_size):
+        yield (id, barcode or '', name, price, stock or 0, reorder or 0,
+               category or '', description or '')
+
+
+def export_customers(chunk_size=EXPORT_CHUNK):
+    query = select(Customer.id, Customer.name, Customer.email, Customer.phone)\
+        .order_by(Customer.id)
+    for id, name, email, phone in _stream(query, chunk_size):
+        yield id, name, email or '', phone or ''
+
+
+EXPORTERS = {
+    "products": (PRODUCT_FIELDS, export_products),
+    "customers": (CUSTOMER_FIELDS, export_customers),
+}
+
+
+def iter_export(kind, fmt, chunk_size=EXPORT_CHUNK):
+    """Yield the export as text, one chunk per ``chunk_size`` rows."""
+    fields, rows = EXPORTERS[kind]
+    buf = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buf)
+        writer.writerow(fields)
+        write = writer.writerow
+    elif fmt == 'jsonl':
+        def write(row):
+            buf.write(json.dumps(dict(zip(fields, row))) + '\n')
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    for n, row in enumerate(rows(chunk_size), 1):
+        write(row)
+        if n % chunk_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
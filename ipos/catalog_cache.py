@@ -0,0 +1,232 @@
+# ipos/catalog_cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import request, jsonify, Response, abort
+from sqlalchemy import select, func
+from ipos.db import db, upsert
+from ipos import serialize, replicas
+from model import CacheVersion, Sale, StockMovement
+
+STOCK_MAX_AGE = 5
+
+
+def _add_one(row, new):
+    return {"version": row.version + 1}
+
+
+class LRUBackend:
+    """Per-process entries. The versions live in the cache_version table on
+    the primary, so an invalidate() in one worker process retires the
+    entries of every other, and they all hand out the same ETags."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def version(self, name):
+        with db.engine.connect() as conn:
+            return conn.execute(select(CacheVersion.version)
+                                .where(CacheVersion.name == name)).scalar() or 0
+
+    def bump(self, name):
+        with db.engine.begin() as conn:
+            conn.execute(upsert(CacheVersion, ['name'], _add_one), {"name": name, "version": 1})
+
+
+class RedisBackend:
+    """Cache shared by every worker process, through Redis."""
+
+    def __init__(self, url, prefix='pos:catalog:', ttl=3600):
+        import redis  # optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self._redis.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def version(self, name):
+        return int(self._redis.get(self.prefix + 'v:' + name) or 0)
+
+    def bump(self, name):
+        self._redis.incr(self.prefix + 'v:' + name)
+
+
+class CachedCollection:
+    """Serialized list and per-id entries for one table, keyed by version.
+
+    Writers call invalidate() after committing; that bumps the version, so
+    every older entry is simply never read again and ages out. A reader that
+    loaded before the bump stores under the old version, so it cannot put
+    stale data back into the cache.
+
+    ``watermark`` covers changes that are not worth a version bump, such as
+    the stock a sale takes: as in CatalogCache.cached(), an entry whose
+    watermark has moved is loaded again once it is ``max_age`` seconds old.
+    The ETag names the version and the watermark the entry was loaded at.
+    """
+
+    def __init__(self, cache, name, load_all, load_one, watermark=None):
+        self.cache = cache
+        self.name = name
+        self.load_all = load_all
+        self.load_one = load_one
+        self.watermark = watermark
+        self.max_age = 0
+
+    def version(self):
+        return self.cache.backend.version(self.name)
+
+    def state(self):
+        """(version, watermark), as read from the database now."""
+        return self.version(), self.watermark() if self.watermark else None
+
+    def invalidate(self):
+        self.cache.backend.bump(self.name)
+
+    def key(self, id, version):
+        return f"{self.name}:{'all' if id is None else id}:v{version}"
+
+    def etag(self, id, version, watermark=None):
+        etag = f"{self.name}-{'all' if id is None else id}-{version}"
+        return etag if watermark is None else f"{etag}.{watermark}"
+
+    def cached(self, id, state):
+        """(data, etag) of a usable entry for ``state``, or (None, None)."""
+        version, watermark = state
+        entry = self.cache.backend.get(self.key(id, version))
+        if entry is None or not (entry['watermark'] == watermark
+                                 or time.time() - entry['at'] < self.max_age):
+            return None, None
+        return entry['data'], self.etag(id, version, entry['watermark'])
+
+    def store(self, id, state, data):
+        """Cache ``data`` as loaded at ``state``; returns its ETag."""
+        version, watermark = state
+        self.cache.backend.set(self.key(id, version),
+                               {"data": data, "watermark": watermark, "at": time.time()})
+        return self.etag(id, version, watermark)
+
+    def get(self, id=None, state=None):
+        """(data, etag) of the list, or of one row (data None if missing)."""
+        state = self.state() if state is None else state
+        data, etag = self.cached(id, state)
+        if data is None:
+            data = self.load_all() if id is None else self.load_one(id)
+            etag = self.store(id, state, data) if data is not None else None
+        return data, etag
+
+    def response(self, id=None):
+        """JSON response with an ETag; answers 304 after reading only the
+        version and watermark."""
+        state = self.state()
+        etag = self.etag(id, *state)
+        if not request.if_none_match.contains(etag):
+            data, etag = self.get(id, state)
+            if data is None:
+                abort(404)
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = jsonify(data)
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+
+
+def _load_products():
+    return list(serialize.products())
+
+
+def _load_product(id):
+    return next(serialize.products(id), None)
+
+
+def _load_customers():
+    return list(serialize.customers())
+
+
+def _load_customer(id):
+    return next(serialize.customers(id), None)
+
+
+def sales_watermark():
+    """The newest sale id. It moves with every recorded sale, back-dated
+    ones synced from an offline till included, and is read from the same
+    database as the data it guards."""
+    return db.session.query(func.max(Sale.id)).scalar() or 0
+
+
+def stock_watermark():
+    """The newest stock movement id. Sales, restocks and counts all append
+    movements (ipos/inventory.py), so it moves whenever a stock level does."""
+    return db.session.query(func.max(StockMovement.id)).scalar() or 0
+
+
+class CatalogCache:
+    def __init__(self, backend=None):
+        self.backend = backend or LRUBackend()
+        # Stock is part of each product: it follows the ledger rather than
+        # an invalidate() per sale
+        self.products = CachedCollection(self, 'products', _load_products, _load_product,
+                                         watermark=stock_watermark)
+        self.customers = CachedCollection(self, 'customers', _load_customers, _load_customer)
+
+    def cached(self, name, key, load, watermark=None, max_age=0):
+        """``load()``, cached until invalidate(name) is next called (or for
+        REPLICA_MAX_LAG seconds, when read from a replica).
+
+        ``watermark`` is a value read cheaply from the database that moves
+        whenever the data does, such as sales_watermark(). Once it has
+        moved, the entry is loaded again, but not before it is ``max_age``
+        seconds old: a busy till then costs one reload per max_age rather
+        than one per sale.
+        """
+        full_key = f"{name}:{key}:{self.backend.version(name)}{replicas.cache_scope()}"
+        entry = self.backend.get(full_key)
+        now = time.time()
+        if entry is not None and (entry['watermark'] == watermark or now - entry['at'] < max_age):
+            return entry['data']
+        data = load()
+        self.backend.set(full_key, {"data": data, "watermark": watermark, "at": now})
+        return data
+
+    def invalidate(self, name):
+        self.backend.bump(name)
+
+    def init_app(self, app):
+        # CATALOG_CACHE_URL: unset or "lru" for entries held in each process
+        # (versions in the database), "redis://..." to share the entries
+        # across worker processes too
+        url = app.config.get('CATALOG_CACHE_URL') or 'lru'
+        if url.startswith('redis'):
+            self.backend = RedisBackend(url)
+        else:
+            self.backend = LRUBackend(app.config.get('CATALOG_CACHE_SIZE', 10000))
+        # CATALOG_STOCK_MAX_AGE: seconds the product list may lag a stock
+        # change, so a busy till costs one reload per interval, not per sale
+        self.products.max_age = float(app.config.get('CATALOG_STOCK_MAX_AGE', STOCK_MAX_AGE))
+
+
+catalog = CatalogCache()
@@ -0,0 +1,192 @@
+# ipos/checkout.py
+from datetime import datetime
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from ipos.db import db
+from ipos import rollups, inventory, live, customer_stats
+from model import Product, Sale, SaleItem, StockLevel
+
+MAX_BATCH = 200
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class StockChanged(CheckoutError):
+    def __init__(self, lines):
+        super().__init__("Stock changed, please retry")
+        self.lines = lines
+
+
+def _merge_items(items):
+    # The same SKU can appear twice in a cart; reserve it as one line
+    lines = {}
+    for item in items:
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError("Invalid item")
+        if quantity < 1:
+            raise CheckoutError("Invalid quantity")
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def _lock_products(ids):
+    # Lock stock rows in primary-key order so concurrent tills never
+    # deadlock; the product rows themselves are only read. SQLite has no row
+    # locks and drops FOR UPDATE; there the conditional UPDATE in
+    # reserve_stock() is what guarantees no oversell.
+    query = select(Product.id, Product.name, Product.price, StockLevel.quantity.label('stock'))\
+        .join(StockLevel, StockLevel.product_id == Product.id)\
+        .where(Product.id.in_(ids))\
+        .order_by(Product.id)
+    if db.session.get_bind().dialect.name != 'sqlite':
+        query = query.with_for_update(of=StockLevel)
+    return {row.id: row for row in db.session.execute(query)}
+
+
+def _check_stock(products, lines):
+    for product_id, quantity in lines.items():
+        product = products.get(product_id)
+        if not product:
+            raise CheckoutError("Product not found")
+        if product.stock < quantity:
+            raise CheckoutError(f"Only {product.stock} {product.name} in stock")
+
+
+def reserve_stock(lines):
+    """Decrement stock for every line in one statement, or not at all."""
+    return inventory.take_for_sale(lines)
+
+
+def parse_sale_date(value):
+    if not value:
+        return datetime.utcnow()
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise CheckoutError("Invalid sale date")
+
+
+def place_sale(customer_id, items, client_key=None, date=None):
+    """Record one sale in the current transaction without committing.
+
+    Raises StockChanged if another till took the stock between the read and
+    the update; the caller must then roll back, since some lines may already
+    have been decremented.
+    """
+    if not items:
+        raise CheckoutError("No items")
+    lines = _merge_items(items)
+
+    products = _lock_products(sorted(lines))
+    _check_stock(products, lines)
+    if not reserve_stock(lines):
+        raise StockChanged(lines)
+
+    total = round(sum(products[pid].price * qty for pid, qty in lines.items()), 2)
+    sale = Sale(customer_id=customer_id, total=total, client_key=client_key,
+                date=parse_sale_date(date))
+    db.session.add(sale)
+    db.session.flush()
+
+    db.session.execute(insert(SaleItem), [{
+        "sale_id": sale.id,
+        "product_id": pid,
+        "quantity": qty,
+        "price": products[pid].price
+    } for pid, qty in lines.items()])
+    inventory.record_sale(sale.id, lines)
+
+    rollups.record_sale(sale, lines, {pid: p.price for pid, p in products.items()})
+    customer_stats.record_sale(sale, lines)
+    return sale
+
+
+def find_by_client_key(client_key):
+    if not client_key:
+        return None
+    return Sale.query.filter_by(client_key=client_key).first()
+
+
+def rejection(error):
+    """What to tell the till about an IntegrityError that was not a
+    duplicate client_key, such as an unknown customer_id."""
+    return f"Rejected by the database: {error.orig}"
+
+
+def checkout(customer_id, items, client_key=None, date=None):
+    try:
+        sale = place_sale(customer_id, items, client_key, date)
+        event = live.sale_event(sale, items)
+        db.session.commit()
+    except StockChanged as e:
+        db.session.rollback()
+        _check_stock(_lock_products(sorted(e.lines)), e.lines)
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    live.publish([event])
+    return sale
+
+
+def checkout_batch(sales):
+    """Record many queued sales in one transaction, deduped by client_key.
+
+    Each sale runs in its own savepoint, so one rejected sale (for example,
+    stock sold elsewhere while the till was offline) does not stop the rest.
+    Returns one result dict per input sale, in order.
+    """
+    if not isinstance(sales, list) or not all(isinstance(s, dict) for s in sales):
+        raise CheckoutError("Sales must be a list of objects")
+    if len(sales) > MAX_BATCH:
+        raise CheckoutError(f"At most {MAX_BATCH} sales per batch")
+
+    keys = [s.get('client_key') for s in sales]
+    if not all(keys):
+        raise CheckoutError("Every sale needs a client_key")
+    existing = {key: id for key, id in db.session.query(Sale.client_key, Sale.id)
+                .filter(Sale.client_key.in_(keys))}
+
+    results, events = [], []
+    try:
+        for data, key in zip(sales, keys):
+            if key in existing:
+                results.append({"client_key": key, "status": "duplicate", "id": existing[key]})
+                continue
+            savepoint = db.session.begin_nested()
+            try:
+                sale = place_sale(data.get('customer_id'), data.get('items', []), key, data.get('date'))
+                savepoint.commit()
+            except IntegrityError as e:
+                savepoint.rollback()
+                # The same key committed by a concurrent request, or some other
+                # constraint such as an unknown customer. A locking read, since
+                # under MySQL's REPEATABLE READ a plain one would not see the
+                # concurrent commit.
+                sale_id = db.session.execute(
+                    select(Sale.id).where(Sale.client_key == key).with_for_update()).scalar()
+                if sale_id is None:
+                    results.append({"client_key": key, "status": "rejected", "error": rejection(e)})
+                else:
+                    existing[key] = sale_id
+                    results.append({"client_key": key, "status": "duplicate", "id": sale_id})
+                continue
+            except CheckoutError as e:
+                savepoint.rollback()
+                results.append({"client_key": key, "status": "rejected", "error": str(e)})
+                continue
+            existing[key] = sale.id
+            events.append(live.sale_event(sale, data['items']))
+            results.append({"client_key": key, "status": "created",
+                            "id": sale.id, "total": sale.total})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    live.publish(events)
+    return results
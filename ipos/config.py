@@ -0,0 +1,145 @@
+# ipos/config.py
+#
+# Database settings come from, in increasing priority:
+#   1. the defaults below (MySQL on localhost, as before)
+#   2. a Python config file named by POS_CONFIG (Flask from_envvar)
+#   3. POS_* environment variables, e.g. POS_DATABASE_URL, POS_PROFILE,
+#      POS_POOL_SIZE (Flask from_prefixed_env; values are JSON-parsed)
+#
+# POS_PROFILE picks tuned pool settings:
+#   production  multi-till store server on MySQL
+#   development single developer, small pool
+#   local       single-store/offline install on SQLite in WAL mode
+#
+# Each profile also sizes the server (gunicorn.conf.py, asgi.py); override
+# with POS_WORKERS / POS_THREADS. Two rules keep the pool from starving:
+#   THREADS <= POOL_SIZE + MAX_OVERFLOW    (one connection per busy thread)
+#   WORKERS * (POOL_SIZE + MAX_OVERFLOW) <= the database's max_connections
+#     (MySQL defaults to 151; leave room for admin and replication)
+#
+# REPLICA_URLS lists read replicas for reports, exports and the dashboard
+# (a JSON list or comma-separated); REPLICA_MAX_LAG is how many seconds
+# behind the primary a replica may be and still serve them (ipos/replicas.py).
+# Each replica gets a pool sized like the primary's.
+import os
+from sqlalchemy import event
+
+MYSQL_USER = os.environ.get("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "")
+MYSQL_HOST = os.environ.get("MYSQL_HOST", "localhost")
+MYSQL_PORT = int(os.environ.get("MYSQL_PORT", 3306))
+MYSQL_DB = os.environ.get("MYSQL_DB", "pos_system")
+
+MYSQL_URI = (
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
+    f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+)
+
+# Relative SQLite paths resolve inside the Flask instance folder
+LOCAL_URI = "sqlite:///pos_store.db"
+
+PROFILES = {
+    "production": {
+        "DATABASE_URL": MYSQL_URI,
+        "POOL_SIZE": 20,
+        "MAX_OVERFLOW": 10,
+        "POOL_TIMEOUT": 10,
+        "POOL_RECYCLE": 1800,  # below MySQL's default wait_timeout
+        "POOL_PRE_PING": True,
+        # 4 x 30 connections fits MySQL's default 151
+        "WORKERS": min(os.cpu_count() or 1, 4),
+        "THREADS": 16,
+    },
+    "development": {
+        "DATABASE_URL": MYSQL_URI,
+        "POOL_SIZE": 5,
+        "MAX_OVERFLOW": 5,
+        "POOL_TIMEOUT": 30,
+        "POOL_RECYCLE": 3600,
+        "POOL_PRE_PING": True,
+        "WORKERS": 2,
+        "THREADS": 4,
+    },
+    "local": {
+        "DATABASE_URL": LOCAL_URI,
+        # One writer at a time in SQLite; a small pool of readers is plenty
+        "POOL_SIZE": 5,
+        "MAX_OVERFLOW": 5,
+        "POOL_TIMEOUT": 30,
+        "POOL_RECYCLE": -1,
+        "POOL_PRE_PING": False,
+        "SQLITE_BUSY_TIMEOUT": 15,
+        # No DBA on a single-store install: apply migrations at startup
+        "AUTO_MIGRATE": True,
+        # One process: SQLite has a single writer and the catalog cache is
+        # in-process, so scale with threads
+        "WORKERS": 1,
+        "THREADS": 8,
+    },
+}
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # readers never block the writer
+    "synchronous": "NORMAL",     # durable across app crashes; fsync per checkpoint
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,        # 64MB page cache
+    "mmap_size": 268435456,      # 256MB memory-mapped reads
+}
+
+
+def load_config(app):
+    app.config.from_envvar("POS_CONFIG", silent=True)
+    app.config.from_prefixed_env("POS")
+
+    profile = app.config.get("PROFILE", "development")
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown POS_PROFILE {profile!r}; use one of {', '.join(PROFILES)}")
+    for key, value in PROFILES[profile].items():
+        app.config.setdefault(key, value)
+
+    uri = app.config["DATABASE_URL"]
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config, uri)
+
+    replicas = app.config.get("REPLICA_URLS") or []
+    if isinstance(replicas, str):
+        replicas = [url.strip() for url in replicas.split(",") if url.strip()]
+    app.config["REPLICA_URLS"] = replicas
+    app.config["SQLALCHEMY_BINDS"] = {
+        f"replica{n}": dict(engine_options(app.config, url), url=url)
+        for n, url in enumerate(replicas)}
+
+
+def server_sizing(environ=os.environ):
+    """(workers, threads) for POS_PROFILE, or POS_WORKERS / POS_THREADS."""
+    profile = PROFILES[environ.get("POS_PROFILE", "development")]
+    return (int(environ.get("POS_WORKERS", profile["WORKERS"])),
+            int(environ.get("POS_THREADS", profile["THREADS"])))
+
+
+def engine_options(config, uri):
+    if uri.startswith("sqlite") and (":memory:" in uri or uri.rstrip("/") == "sqlite:"):
+        return {}  # Flask-SQLAlchemy picks a static pool for in-memory DBs
+    options = {
+        "pool_size": config["POOL_SIZE"],
+        "max_overflow": config["MAX_OVERFLOW"],
+        "pool_timeout": config["POOL_TIMEOUT"],
+        "pool_recycle": config["POOL_RECYCLE"],
+        "pool_pre_ping": config["POOL_PRE_PING"],
+    }
+    if uri.startswith("sqlite"):
+        options["connect_args"] = {"timeout": config.get("SQLITE_BUSY_TIMEOUT", 15)}
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def configure_engine(engine):
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
@@ -6,9 +6,6 @@ from werkzeug.security import generate_password_hash
 
 # Run inside the Flask application context
 with app.app_context():
-    # Make sure all database tables exist
-    db.create_all()
-
     # Try to find existing admin user
     existing_admin = User.query.filter_by(username='admin').first()
 
@@ -0,0 +1,285 @@
+# ipos/customer_stats.py
+#
+# Per-customer purchase statistics. Checkout updates customer_stats in its
+# own transaction: order count, total spent, first and last purchase, and
+# the favourite product. The favourite comes from the units per product
+# kept in customer_product_stats. A customer's lifetime figures are then
+# one primary-key read. The customer list sorts and filters on the indexed
+# stats columns rather than aggregating the sale table. Walk-in sales are
+# not counted.
+#
+# A customer's sales page through the (customer_id, date, id) index on
+# sale, newest first, and then through any archived months.
+#
+#   flask --app app rebuild-rollups    # recomputes these with the other rollups
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, update, delete, insert, case, or_, and_, func
+from ipos.db import db, upsert
+from ipos import archive, serialize
+from ipos.pagination import keyset_query, CursorError
+from ipos.sales_search import customer_matches
+from model import Product, Customer, Sale, SaleItem, CustomerStats, CustomerProductStats
+
+SORTS = {
+    'total_spent': CustomerStats.total_spent,
+    'order_count': CustomerStats.order_count,
+    'last_purchase': CustomerStats.last_purchase,
+}
+INSERT_BATCH = 5000
+_upserts = {}  # dialect -> (stats upsert, product quantity upsert), built once
+
+
+def _combine(row, new):
+    return {
+        "order_count": row.order_count + new.order_count,
+        "total_spent": row.total_spent + new.total_spent,
+        "first_purchase": case((new.first_purchase < row.first_purchase, new.first_purchase),
+                               else_=row.first_purchase),
+        "last_purchase": case((new.last_purchase > row.last_purchase, new.last_purchase),
+                              else_=row.last_purchase),
+    }
+
+
+def _add_quantity(row, new):
+    return {"quantity": row.quantity + new.quantity}
+
+
+def _statements():
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _upserts:
+        _upserts[dialect] = (upsert(CustomerStats, ['customer_id'], _combine),
+                             upsert(CustomerProductStats, ['customer_id', 'product_id'], _add_quantity))
+    return _upserts[dialect]
+
+
+def record_sale(sale, lines):
+    """Add a sale ({product_id: quantity} lines) to its customer's stats;
+    called inside the checkout transaction."""
+    customer_id = sale.customer_id
+    if customer_id is None:
+        return
+    # Core statements on the session's connection, built once: no ORM
+    # bookkeeping or statement construction on the checkout path
+    add_sale, add_quantities = _statements()
+    conn = db.session.connection()
+    conn.execute(add_sale, [{
+        "customer_id": customer_id,
+        "order_count": 1,
+        "total_spent": sale.total,
+        "first_purchase": sale.date,
+        "last_purchase": sale.date,
+        "favourite_product_id": None,
+        "favourite_quantity": 0
+    }])
+    conn.execute(add_quantities, [{"customer_id": customer_id, "product_id": pid, "quantity": lines[pid]}
+                                  for pid in sorted(lines)])
+
+    # The favourite can only change to a product in this sale: one bought
+    # more, or as much with a lower id (the tie rule rebuild() applies)
+    products = CustomerProductStats.__table__.c
+    bought = conn.execute(
+        select(products.product_id, products.quantity)
+        .where(products.customer_id == customer_id, products.product_id.in_(lines))).all()
+    product_id, quantity = max(bought, key=lambda r: (r.quantity, -r.product_id))
+    stats = CustomerStats.__table__
+    conn.execute(
+        update(stats)
+        .where(stats.c.customer_id == customer_id,
+               or_(stats.c.favourite_quantity < quantity,
+                   stats.c.favourite_product_id == product_id,
+                   and_(stats.c.favourite_quantity == quantity,
+                        stats.c.favourite_product_id > product_id)))
+        .values(favourite_product_id=product_id, favourite_quantity=quantity))
+
+
+def forget(customer_id):
+    """Drop a deleted customer's stats."""
+    db.session.execute(delete(CustomerProductStats).where(CustomerProductStats.customer_id == customer_id))
+    db.session.execute(delete(CustomerStats).where(CustomerStats.customer_id == customer_id))
+
+
+# ----------------------------------------
+# Reading
+# ----------------------------------------
+
+COLUMNS = (Customer.id, Customer.name, Customer.email, Customer.phone,
+           CustomerStats.order_count, CustomerStats.total_spent,
+           CustomerStats.first_purchase, CustomerStats.last_purchase,
+           CustomerStats.favourite_product_id, Product.name.label('favourite_product'))
+
+
+def _stats_query():
+    return select(*COLUMNS).select_from(CustomerStats)\
+        .join(Customer, Customer.id == CustomerStats.customer_id)\
+        .outerjoin(Product, Product.id == CustomerStats.favourite_product_id)
+
+
+def row_dict(r):
+    return {
+        "id": r.id,
+        "name": r.name,
+        "email": r.email or "",
+        "phone": r.phone or "",
+        "order_count": r.order_count or 0,
+        "total_spent": round(r.total_spent or 0, 2),
+        "first_purchase": r.first_purchase.isoformat() if r.first_purchase else None,
+        "last_purchase": r.last_purchase.isoformat() if r.last_purchase else None,
+        "favourite_product_id": r.favourite_product_id,
+        "favourite_product": r.favourite_product
+    }
+
+
+def stats(customer_id):
+    """A customer with their stats (zero before the first purchase), or
+    None if there is no such customer."""
+    row = db.session.execute(
+        select(*COLUMNS).select_from(Customer)
+        .outerjoin(CustomerStats, CustomerStats.customer_id == Customer.id)
+        .outerjoin(Product, Product.id == CustomerStats.favourite_product_id)
+        .where(Customer.id == customer_id)).first()
+    return row_dict(row) if row else None
+
+
+def _encode_cursor(value, id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort):
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if sort == 'last_purchase':
+            value = datetime.fromisoformat(value)
+        return value, int(id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise CursorError("Invalid cursor")
+
+
+class CustomerFilter:
+    def __init__(self, q=None, min_spent=None, max_spent=None, min_orders=None,
+                 max_orders=None, active_since=None, inactive_since=None):
+        self.q = (q or '').strip() or None
+        self.min_spent = float(min_spent) if min_spent else None
+        self.max_spent = float(max_spent) if max_spent else None
+        self.min_orders = int(min_orders) if min_orders else None
+        self.max_orders = int(max_orders) if max_orders else None
+        # Bought on or after / not since these dates (YYYY-MM-DD)
+        self.active_since = datetime.fromisoformat(active_since) if active_since else None
+        self.inactive_since = datetime.fromisoformat(inactive_since) if inactive_since else None
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.get('q'), args.get('min_spent'), args.get('max_spent'),
+                   args.get('min_orders'), args.get('max_orders'),
+                   args.get('active_since'), args.get('inactive_since'))
+
+    def apply(self, query):
+        if self.q:
+            query = query.where(CustomerStats.customer_id.in_(customer_matches(self.q)))
+        if self.min_spent is not None:
+            query = query.where(CustomerStats.total_spent >= self.min_spent)
+        if self.max_spent is not None:
+            query = query.where(CustomerStats.total_spent <= self.max_spent)
+        if self.min_orders is not None:
+            query = query.where(CustomerStats.order_count >= self.min_orders)
+        if self.max_orders is not None:
+            query = query.where(CustomerStats.order_count <= self.max_orders)
+        if self.active_since:
+            query = query.where(CustomerStats.last_purchase >= self.active_since)
+        if self.inactive_since:
+            query = query.where(CustomerStats.last_purchase < self.inactive_since)
+        return query
+
+
+def ranked(f, sort='total_spent', descending=True, cursor=None, limit=50):
+    """A page of customers with stats, ordered by ``sort`` then id through
+    the matching (stat, customer_id) index; returns (rows, next_cursor)."""
+    if sort not in SORTS:
+        raise ValueError("sort must be one of " + ", ".join(SORTS))
+    col, id_col = SORTS[sort], CustomerStats.customer_id
+    query = f.apply(_stats_query())
+    if cursor:
+        value, id = _decode_cursor(cursor, sort)
+        if descending:
+            query = query.where(or_(col < value, and_(col == value, id_col < id)))
+        else:
+            query = query.where(or_(col > value, and_(col == value, id_col > id)))
+    order = (col.desc(), id_col.desc()) if descending else (col.asc(), id_col.asc())
+    rows = db.session.execute(query.order_by(*order).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(getattr(rows[-1], col.key), rows[-1].id)
+    return [row_dict(r) for r in rows], next_cursor
+
+
+def sales(customer_id, cursor=None, limit=50):
+    """A page of a customer's sales, newest first, items included (for
+    live months); returns (sales, next_cursor)."""
+    query = serialize.sale_query().filter(Sale.customer_id == customer_id)
+    rows = keyset_query(query, Sale.date, Sale.id, cursor, limit).all()
+    archived = archive.sales_page(archive.archive_dir(), cursor=cursor, limit=limit,
+                                  customer_id=customer_id)
+    rows, next_cursor = archive.merged_page(rows, archived, limit)
+    return serialize.sale_rows(rows), next_cursor
+
+
+# ----------------------------------------
+# Rebuild
+# ----------------------------------------
+
+def rebuild():
+    """Recompute both tables from the sale tables and the archived months;
+    returns the number of customers with stats."""
+    totals = {cid: [count, spent or 0, first, last] for cid, count, spent, first, last in db.session.execute(
+        select(Sale.customer_id, func.count(Sale.id), func.sum(Sale.total),
+               func.min(Sale.date), func.max(Sale.date))
+        .where(Sale.customer_id.isnot(None)).group_by(Sale.customer_id))}
+    quantities = {(cid, pid): int(qty) for cid, pid, qty in db.session.execute(
+        select(Sale.customer_id, SaleItem.product_id, func.sum(SaleItem.quantity))
+        .join(Sale, SaleItem.sale_id == Sale.id)
+        .where(Sale.customer_id.isnot(None))
+        .group_by(Sale.customer_id, SaleItem.product_id))}
+
+    archived_totals, archived_quantities = archive.customer_totals(archive.archive_dir())
+    for cid, (count, spent, first, last) in archived_totals.items():
+        if cid not in totals:
+            totals[cid] = [count, spent, first, last]
+            continue
+        t = totals[cid]
+        t[0] += count
+        t[1] += spent
+        t[2], t[3] = min(t[2], first), max(t[3], last)
+    for key, qty in archived_quantities.items():
+        quantities[key] = quantities.get(key, 0) + qty
+
+    # Archived sales may name customers deleted since
+    existing = set(db.session.execute(select(Customer.id)).scalars())
+    favourites = {}
+    for (cid, pid), qty in quantities.items():
+        best = favourites.get(cid)
+        if best is None or (qty, -pid) > (best[1], -best[0]):
+            favourites[cid] = (pid, qty)
+    stats_rows = [{
+        "customer_id": cid,
+        "order_count": count,
+        "total_spent": round(spent, 2),
+        "first_purchase": first,
+        "last_purchase": last,
+        "favourite_product_id": favourites.get(cid, (None, 0))[0],
+        "favourite_quantity": favourites.get(cid, (None, 0))[1]
+    } for cid, (count, spent, first, last) in sorted(totals.items()) if cid in existing]
+    product_rows = [{"customer_id": cid, "product_id": pid, "quantity": qty}
+                    for (cid, pid), qty in sorted(quantities.items()) if cid in existing]
+
+    db.session.execute(delete(CustomerProductStats))
+    db.session.execute(delete(CustomerStats))
+    conn = db.session.connection()
+    for rows, model in ((stats_rows, CustomerStats), (product_rows, CustomerProductStats)):
+        for start in range(0, len(rows), INSERT_BATCH):
+            conn.execute(insert(model), rows[start:start + INSERT_BATCH])
+    db.session.commit()
+    return len(stats_rows)
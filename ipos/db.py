@@ -1,26 +1,56 @@
 # ipos/db.py
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from ipos.config import load_config, configure_engine
+from ipos import migrations
 
-# MySQL config
-MYSQL_USER = "root"
-MYSQL_PASSWORD = ""  # ← CHANGE IF YOU HAVE A PASSWORD
-MYSQL_HOST = "localhost"
-MYSQL_PORT = 3306
-MYSQL_DB = "pos_system"
 
-SQLALCHEMY_DATABASE_URI = (
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
-    f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
-)
+class RoutingSession(Session):
+    """Reads go to the replica engine a read-only route pinned in
+    ``info['replica']`` (see ipos/replicas.py); flushes and INSERT, UPDATE
+    and DELETE statements always go to the primary."""
 
-db = SQLAlchemy()
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing \
+                and not getattr(clause, 'is_dml', False):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 def init_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
+    load_config(app)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SECRET_KEY"] = "super-secret-pos-key-2025"
+    app.config.setdefault("SECRET_KEY", "super-secret-pos-key-2025")
     app.config["UPLOAD_FOLDER"] = "static/uploads"
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB
     db.init_app(app)
     with app.app_context():
-        db.create_all()
\ No newline at end of file
+        for engine in db.engines.values():
+            configure_engine(engine)
+        migrations.verify(app, db.engine)
+
+
+def upsert(model, keys, set_):
+    """INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE for the bound dialect.
+
+    ``set_(row, new)`` returns the column -> expression map applied to an
+    existing row, where ``row`` is the table's columns and ``new`` the
+    incoming values.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(model)
+        return stmt.on_duplicate_key_update(**set_(model.__table__.c, stmt.inserted))
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"upsert not supported on {dialect}")
+    stmt = insert(model)
+    return stmt.on_conflict_do_update(index_elements=keys,
+                                      set_=set_(model.__table__.c, stmt.excluded))
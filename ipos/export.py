@@ -0,0 +1,107 @@
+# ipos/export.py
+import csv
+import heapq
+import io
+import os
+import tempfile
+import xlsxwriter
+from sqlalchemy import select
+from ipos.db import db
+from ipos import archive
+from model import Product, Customer, Sale, SaleItem
+
+HEADERS = ['Date', 'Product', 'Customer', 'Quantity', 'Total']
+CHUNK_SIZE = 2000
+
+
+def export_rows(from_date=None, to_date=None, product_id=None, chunk_size=CHUNK_SIZE):
+    """Yield (date, product, customer, quantity, total) one line item at a time.
+
+    Rows are plain column tuples fetched ``chunk_size`` at a time through a
+    server-side cursor, so no ORM objects or full result lists are built.
+    Archived months are merged in from their Parquet files, newest first.
+    """
+    query = select(
+        Sale.date,
+        Sale.id,
+        Product.name,
+        Customer.name,
+        SaleItem.quantity,
+        SaleItem.price
+    ).select_from(SaleItem)\
+        .join(Sale, SaleItem.sale_id == Sale.id)\
+        .join(Product, SaleItem.product_id == Product.id)\
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+    if from_date:
+        query = query.where(Sale.date >= from_date)
+    if to_date:
+        query = query.where(Sale.date <= to_date + " 23:59:59")
+    if product_id:
+        query = query.where(Sale.items.any(SaleItem.product_id == int(product_id)))
+    query = query.order_by(Sale.date.desc(), Sale.id.desc())\
+        .execution_options(stream_results=True, yield_per=chunk_size)
+
+    live = db.session.execute(query)
+    archived = archive.export_rows(archive.archive_dir(), from_date, to_date, product_id, chunk_size)
+    for date, _, product, customer, quantity, price in heapq.merge(
+            live, archived, key=lambda r: (r[0], r[1]), reverse=True):
+        yield (date.strftime('%Y-%m-%d'), product, customer or 'Walk-in',
+               quantity, quantity * price)
+
+
+def write_xlsx(rows, path=None):
+    """Write rows to an .xlsx file at ``path`` (default: a temporary file)
+    and return its path.
+
+    constant_memory mode flushes each row to disk as it is written, so the
+    workbook never holds more than one row in memory.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Sales Report')
+
+    bold = workbook.add_format({'bold': True, 'bg_color': '#E0F7FA'})
+    money = workbook.add_format({'num_format': '$#,##0.00'})
+
+    for col, h in enumerate(HEADERS):
+        worksheet.write(0, col, h, bold)
+
+    r = 0
+    total_income = 0
+    for r, (date, product, customer, quantity, total) in enumerate(rows, start=1):
+        worksheet.write(r, 0, date)
+        worksheet.write(r, 1, product)
+        worksheet.write(r, 2, customer)
+        worksheet.write(r, 3, quantity)
+        worksheet.write(r, 4, total, money)
+        total_income += total
+
+    worksheet.write(r + 2, 3, 'Total Income:', bold)
+    worksheet.write(r + 2, 4, total_income, money)
+    workbook.close()
+    return path
+
+
+def iter_csv(rows):
+    """Yield the report as CSV text, one small chunk per row."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush():
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return data
+
+    writer.writerow(HEADERS)
+    yield flush()
+    total_income = 0
+    for date, product, customer, quantity, total in rows:
+        writer.writerow([date, product, customer, quantity, f"{total:.2f}"])
+        total_income += total
+        yield flush()
+    writer.writerow([])
+    writer.writerow(['', '', '', 'Total Income:', f"{total_income:.2f}"])
+    yield flush()
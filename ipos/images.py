@@ -0,0 +1,144 @@
+# ipos/images.py
+#
+# Product image pipeline. The request thread only hashes the upload and
+# writes it under its content hash (identical uploads share one file and the
+# URL never changes meaning); resizing to thumbnails and WebP runs in a small
+# worker pool. Pillow is needed for the variants; without it originals are
+# served as they are.
+import hashlib
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, send_from_directory, abort
+from werkzeug.utils import secure_filename
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+THUMB_WIDTHS = (256, 640)
+THUMB_DIR = 'thumbs'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Content-addressed names are 32 hex chars of SHA-256 plus the extension
+HASHED_STEM = re.compile(r'[0-9a-f]{32}')
+
+log = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='images')
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def allowed_file(filename):
+    return _extension(filename) in ALLOWED_EXTENSIONS
+
+
+def thumb_name(image, width):
+    return f"{image.rsplit('.', 1)[0]}_{width}.webp"
+
+
+def thumb_url(image, width=THUMB_WIDTHS[0]):
+    return f"/media/thumbs/{thumb_name(image, width)}"
+
+
+def image_url(image):
+    return f"/media/{image}"
+
+
+def _tmp_path(path):
+    # Unique per writer: two tills may upload the same picture at once
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def store_upload(file, folder):
+    """Save an upload under its content hash and queue its variants."""
+    data = file.read()
+    # From the raw name allowed_file() checked: secure_filename() drops a
+    # non-ASCII stem and its dot ("фото.jpg" -> "jpg"), and the stored name
+    # is the content hash anyway
+    ext = _extension(file.filename)
+    name = f"{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        tmp = _tmp_path(path)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    _executor.submit(make_variants, folder, name)
+    return name
+
+
+def make_variants(folder, name):
+    try:
+        from PIL import Image
+    except ImportError:
+        log.warning("Pillow not installed; serving original product images")
+        return
+    out_dir = os.path.join(folder, THUMB_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        with Image.open(os.path.join(folder, name)) as img:
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            for width in THUMB_WIDTHS:
+                out = os.path.join(out_dir, thumb_name(name, width))
+                if os.path.exists(out):
+                    continue
+                variant = img.copy()
+                variant.thumbnail((width, width * 4))
+                tmp = _tmp_path(out)
+                variant.save(tmp, 'WEBP', quality=80, method=4)
+                os.replace(tmp, out)
+    except Exception:
+        log.exception("Could not build variants for %s", name)
+
+
+def release(name, folder, still_used):
+    """Delete an image and its variants once no product refers to it."""
+    if not name or still_used:
+        return
+    paths = [os.path.join(folder, name)] + \
+        [os.path.join(folder, THUMB_DIR, thumb_name(name, w)) for w in THUMB_WIDTHS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def backfill(folder, names):
+    """Queue variants for existing images; returns the number queued."""
+    futures = [_executor.submit(make_variants, folder, n) for n in names
+               if os.path.exists(os.path.join(folder, n))]
+    for f in futures:
+        f.result()
+    return len(futures)
+
+
+def serve_original(name):
+    folder = current_app.config['UPLOAD_FOLDER']
+    resp = send_from_directory(os.path.abspath(folder), name)
+    if HASHED_STEM.fullmatch(name.rsplit('.', 1)[0]):
+        resp.headers['Cache-Control'] = IMMUTABLE
+    return resp
+
+
+def serve_thumb(name):
+    folder = current_app.config['UPLOAD_FOLDER']
+    thumbs = os.path.abspath(os.path.join(folder, THUMB_DIR))
+    match = re.fullmatch(r'(.+)_\d+\.webp', name)
+    if not match:
+        abort(404)
+    stem = match.group(1)
+    if os.path.exists(os.path.join(thumbs, secure_filename(name))):
+        resp = send_from_directory(thumbs, name)
+        if HASHED_STEM.fullmatch(stem):
+            resp.headers['Cache-Control'] = IMMUTABLE
+        return resp
+
+    # Variant not built yet (or no Pillow): fall back to the original, but
+    # don't let clients cache it under the thumbnail's URL
+    for ext in ALLOWED_EXTENSIONS:
+        if os.path.exists(os.path.join(folder, f"{stem}.{ext}")):
+            resp = send_from_directory(os.path.abspath(folder), f"{stem}.{ext}")
+            resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+    abort(404)
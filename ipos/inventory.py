@@ -0,0 +1,246 @@
+# ipos/inventory.py
+#
+# Stock is an append-only ledger (stock_movement: sale, restock, adjustment,
+# return) plus the current level per product in the narrow stock_level
+# table. Every change appends movements and applies the same deltas to
+# stock_level in one UPDATE, in the caller's transaction; the product row
+# itself is never written for stock. Snapshots (stock-snapshot) record each
+# product's level at a point in the ledger, so a level can be rebuilt from
+# the latest snapshot plus the movements after it (stock-check).
+#
+# stock_level.shortfall (reorder_level - quantity) is indexed, so the
+# reorder list is a range scan however large the catalog.
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, delete, func, case, and_, bindparam
+from ipos.db import db
+from model import Product, StockLevel, StockMovement, StockSnapshot
+
+KINDS = ('sale', 'restock', 'adjustment', 'return')
+# Movements this recent may belong to transactions that have not committed
+# yet, so a snapshot stops short of them
+SNAPSHOT_LAG = timedelta(minutes=1)
+
+
+class InventoryError(Exception):
+    pass
+
+
+def _apply(deltas, allow_negative=False):
+    """Add ``deltas`` ({product_id: change}) to stock_level in one statement.
+
+    Unless ``allow_negative``, no level may drop below zero; returns False
+    (with nothing changed) if one would.
+    """
+    delta = case(deltas, value=StockLevel.product_id)
+    stmt = update(StockLevel).where(StockLevel.product_id.in_(deltas))
+    if not allow_negative:
+        stmt = stmt.where(StockLevel.quantity + delta >= 0)
+    result = db.session.execute(
+        stmt.values(quantity=StockLevel.quantity + delta,
+                    shortfall=StockLevel.shortfall - delta)
+        .execution_options(synchronize_session=False))
+    return result.rowcount == len(deltas)
+
+
+def _append(movements):
+    now = datetime.utcnow()
+    db.session.connection().execute(insert(StockMovement), [dict(m, created_at=now) for m in movements])
+
+
+def take_for_sale(lines):
+    """Decrement stock for a sale's lines ({product_id: quantity}), all or none."""
+    return _apply({pid: -qty for pid, qty in lines.items()})
+
+
+def record_sale(sale_id, lines):
+    """Ledger entries for a sale whose stock take_for_sale() already took."""
+    _append([{"product_id": pid, "kind": "sale", "quantity": -qty, "sale_id": sale_id}
+             for pid, qty in sorted(lines.items())])
+
+
+def record(product_id, kind, quantity, note=None, sale_id=None):
+    """Append one restock, adjustment or return and apply it."""
+    if kind not in KINDS or kind == 'sale':
+        raise InventoryError("Kind must be restock, adjustment or return")
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        raise InventoryError("Invalid quantity")
+    if quantity == 0 or (kind != 'adjustment' and quantity < 0):
+        raise InventoryError("Invalid quantity")
+    if db.session.get(StockLevel, product_id) is None:
+        raise InventoryError("Product not found")
+    if not _apply({product_id: quantity}):
+        raise InventoryError("Stock cannot go below zero")
+    _append([{"product_id": product_id, "kind": kind, "quantity": quantity,
+              "sale_id": sale_id, "note": note}])
+
+
+def open_stock(levels, reorder_levels=None):
+    """Create stock_level rows for new products ({product_id: quantity}),
+    each with an opening-balance adjustment in the ledger."""
+    reorder_levels = reorder_levels or {}
+    db.session.connection().execute(insert(StockLevel), [{
+        "product_id": pid,
+        "quantity": qty,
+        "reorder_level": reorder_levels.get(pid, 0),
+        "shortfall": reorder_levels.get(pid, 0) - qty
+    } for pid, qty in levels.items()])
+    _append([{"product_id": pid, "kind": "adjustment", "quantity": qty,
+              "note": "Opening balance"} for pid, qty in levels.items()])
+
+
+def _lock_levels(product_ids):
+    query = select(StockLevel.product_id, StockLevel.quantity)\
+        .where(StockLevel.product_id.in_(product_ids)).order_by(StockLevel.product_id)
+    if db.session.get_bind().dialect.name != 'sqlite':
+        query = query.with_for_update()
+    return dict(db.session.execute(query).all())
+
+
+def set_levels(levels, note="Stock count"):
+    """Record stock counts ({product_id: quantity}): one adjustment for each
+    product whose level differs. Unknown products are skipped."""
+    current = _lock_levels(list(levels))
+    deltas = {pid: int(qty) - current[pid] for pid, qty in levels.items()
+              if pid in current and int(qty) != current[pid]}
+    if not deltas:
+        return
+    if not _apply(deltas):
+        raise InventoryError("Stock cannot go below zero")
+    _append([{"product_id": pid, "kind": "adjustment", "quantity": delta, "note": note}
+             for pid, delta in sorted(deltas.items())])
+
+
+def set_level(product_id, quantity, note="Stock count"):
+    """Record a stock count: an adjustment for the difference, if any."""
+    quantity = int(quantity)
+    if quantity < 0:
+        raise InventoryError("Invalid quantity")
+    if db.session.get(StockLevel, product_id) is None:
+        raise InventoryError("Product not found")
+    set_levels({product_id: quantity}, note)
+
+
+def set_reorder_levels(levels):
+    """Set reorder levels for many products ({product_id: level}) in one
+    executemany."""
+    table = StockLevel.__table__
+    db.session.execute(
+        update(table).where(table.c.product_id == bindparam('b_product_id'))
+        .values(reorder_level=bindparam('b_level'),
+                shortfall=bindparam('b_level') - table.c.quantity),
+        [{"b_product_id": pid, "b_level": level} for pid, level in sorted(levels.items())])
+
+
+def set_reorder_level(product_id, level):
+    level = int(level)
+    if level < 0:
+        raise InventoryError("Invalid reorder level")
+    set_reorder_levels({product_id: level})
+
+
+def level(product_id):
+    return db.session.execute(
+        select(StockLevel.quantity).where(StockLevel.product_id == product_id)).scalar()
+
+
+def low_stock(limit=50):
+    """Products at or below their reorder level, largest shortfall first."""
+    return db.session.execute(
+        select(Product.id, Product.name, StockLevel.quantity,
+               StockLevel.reorder_level, StockLevel.shortfall)
+        .join(Product, Product.id == StockLevel.product_id)
+        .where(StockLevel.shortfall >= 0)
+        .order_by(StockLevel.shortfall.desc())
+        .limit(limit)).all()
+
+
+def movements(product_id, before=None, limit=50):
+    """A product's ledger, newest first, ``limit`` entries before id ``before``."""
+    query = StockMovement.query.filter(StockMovement.product_id == product_id)
+    if before:
+        query = query.filter(StockMovement.id < before)
+    return query.order_by(StockMovement.id.desc()).limit(limit).all()
+
+
+def forget(product_id):
+    """Move a deleted product's ledger under the negated id. SQLite may give
+    the id to the next new product, which must not inherit the history; the
+    rows are kept rather than deleted so movement ids are never reused."""
+    db.session.execute(
+        update(StockMovement).where(StockMovement.product_id == product_id)
+        .values(product_id=-product_id).execution_options(synchronize_session=False))
+    db.session.execute(delete(StockSnapshot).where(StockSnapshot.product_id == product_id))
+
+
+# ----------------------------------------
+# Snapshots and reconciliation
+# ----------------------------------------
+
+def _latest_snapshots():
+    """Subquery: each product's latest snapshot."""
+    latest = select(StockSnapshot.product_id, func.max(StockSnapshot.movement_id).label('movement_id'))\
+        .group_by(StockSnapshot.product_id).subquery()
+    return select(StockSnapshot.product_id, StockSnapshot.movement_id, StockSnapshot.quantity)\
+        .join(latest, and_(StockSnapshot.product_id == latest.c.product_id,
+                           StockSnapshot.movement_id == latest.c.movement_id)).subquery()
+
+
+def _ledger_levels(upto=None):
+    """{product_id: (level, moved)} from each product's latest snapshot plus
+    the movements after it, up to movement ``upto``; ``moved`` is whether
+    there were any such movements."""
+    snap = _latest_snapshots()
+    levels = {pid: (qty, False) for pid, _, qty in db.session.execute(select(snap))}
+    query = select(StockMovement.product_id, func.sum(StockMovement.quantity))\
+        .outerjoin(snap, snap.c.product_id == StockMovement.product_id)\
+        .where(StockMovement.id > func.coalesce(snap.c.movement_id, 0))
+    if upto is not None:
+        query = query.where(StockMovement.id <= upto)
+    for pid, total in db.session.execute(query.group_by(StockMovement.product_id)):
+        levels[pid] = (levels.get(pid, (0, False))[0] + int(total), True)
+    return levels
+
+
+def level_from_ledger(product_id):
+    """One product's stock, rebuilt from its latest snapshot and the
+    movements after it through the (product_id, id) index."""
+    latest = db.session.execute(
+        select(StockSnapshot.movement_id, StockSnapshot.quantity)
+        .where(StockSnapshot.product_id == product_id)
+        .order_by(StockSnapshot.movement_id.desc()).limit(1)).first()
+    movement_id, quantity = latest or (0, 0)
+    return quantity + db.session.execute(
+        select(func.coalesce(func.sum(StockMovement.quantity), 0))
+        .where(StockMovement.product_id == product_id, StockMovement.id > movement_id)).scalar()
+
+
+def snapshot():
+    """Snapshot every product whose stock moved since its last snapshot;
+    returns the number of snapshot rows written."""
+    upto = db.session.execute(
+        select(func.max(StockMovement.id))
+        .where(StockMovement.created_at <= datetime.utcnow() - SNAPSHOT_LAG)).scalar()
+    if upto is None:
+        return 0
+    now = datetime.utcnow()
+    rows = [{"product_id": pid, "movement_id": upto, "quantity": level, "taken_at": now}
+            for pid, (level, moved) in sorted(_ledger_levels(upto).items()) if moved]
+    if rows:
+        db.session.execute(insert(StockSnapshot), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def check(fix=False):
+    """[(product_id, stock_level, ledger)] for every product whose level
+    disagrees with the ledger; with ``fix``, reset those levels."""
+    ledger = {pid: level for pid, (level, _) in _ledger_levels().items()}
+    current = dict(db.session.execute(select(StockLevel.product_id, StockLevel.quantity)).all())
+    drift = [(pid, current[pid], ledger.get(pid, 0))
+             for pid in sorted(current) if current[pid] != ledger.get(pid, 0)]
+    if fix and drift:
+        _apply({pid: expected - level for pid, level, expected in drift}, allow_negative=True)
+        db.session.commit()
+    return drift
@@ -0,0 +1,362 @@
+# ipos/jobs.py
+#
+# Heavy reports and exports run as background jobs instead of inside the
+# request. POST /api/jobs/<kind> queues one in the job table and answers at
+# once with its id. GET /api/jobs/<id> reports its status and progress, and
+# GET /api/jobs/<id>/result downloads the artifact once it is done.
+#
+# Workers: JOB_WORKERS threads (default 2) in every web worker process,
+# started by its first request as the replica heartbeat is, or a dedicated
+# process with `flask --app app jobs-worker` (set JOB_WORKERS=0 for the web
+# workers then). A worker claims the oldest queued job with a conditional
+# UPDATE, so any number of processes can share the table. Reads run on a
+# replica when one is fresh enough, as the report routes do.
+#
+# Coalescing: while a job is queued or running, its active_key (a hash of
+# its kind and parameters) is unique. Submitting the same request again
+# returns the job already in flight, so ten managers exporting this month
+# cause one computation.
+#
+# Artifacts are written under JOB_DIR (default instance/jobs) and deleted,
+# with their job rows, JOB_TTL seconds (default a day) after finishing. A job
+# whose worker died, seen by its heartbeat stopping for STALE_AFTER seconds,
+# is queued again, up to MAX_ATTEMPTS runs.
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from ipos.db import db
+from ipos import export, replicas
+from ipos.reports import ReportFilter, build_report, report_json
+from ipos.pagination import parse_limit, CursorError
+from model import Sale, SaleItem, Job
+
+DEFAULT_WORKERS = 2
+DEFAULT_TTL = 24 * 3600    # seconds an artifact is kept
+POLL_INTERVAL = 2.0        # seconds an idle worker waits before looking again
+PROGRESS_INTERVAL = 1.0    # progress is written at most this often
+SWEEP_INTERVAL = 10.0
+STALE_AFTER = 60.0         # seconds without a heartbeat before a job is requeued
+MAX_ATTEMPTS = 3
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+log = logging.getLogger(__name__)
+job = Job.__table__
+_wake = threading.Event()  # set on submit, so this process's workers start at once
+_running = set()           # ids of the jobs this process is running
+_started = set()           # apps whose worker pool is running
+_lock = threading.Lock()
+
+
+class JobError(Exception):
+    pass
+
+
+def job_dir():
+    return current_app.config.get('JOB_DIR') or os.path.join(current_app.instance_path, 'jobs')
+
+
+def ttl():
+    return float(current_app.config.get('JOB_TTL') or DEFAULT_TTL)
+
+
+# ----------------------------------------
+# Kinds
+# ----------------------------------------
+
+def _filter_params(args):
+    try:
+        f = ReportFilter.from_args(args)
+    except ValueError:
+        raise JobError("Invalid report filter")
+    return {"from_date": f.from_date, "to_date": f.to_date, "product_id": f.product_id}
+
+
+def _report_params(args):
+    try:
+        limit = parse_limit(args.get('limit'))
+    except CursorError as e:
+        raise JobError(str(e))
+    return dict(_filter_params(args), limit=limit)
+
+
+def _export_params(args):
+    fmt = args.get('format') or 'xlsx'
+    if fmt not in ('xlsx', 'csv'):
+        raise JobError("Format must be xlsx or csv")
+    return dict(_filter_params(args), format=fmt)
+
+
+def _run_report(job_id, params, progress):
+    f = ReportFilter(params['from_date'], params['to_date'], params['product_id'])
+    data = report_json(build_report(f, None, params['limit']))
+    path = os.path.join(job_dir(), f"{job_id}.json")
+    with open(path, 'w') as out:
+        json.dump(data, out)
+    return path, f"sales_report_{datetime.now():%Y%m%d}.json"
+
+
+def _export_size(params):
+    # Live line items only; archived months make the estimate low, which
+    # only holds progress at 99% a little longer
+    query = select(func.count(SaleItem.id)).join(Sale, SaleItem.sale_id == Sale.id)
+    start, end = ReportFilter(params['from_date'], params['to_date']).bounds
+    if start:
+        query = query.where(Sale.date >= start)
+    if end:
+        query = query.where(Sale.date <= end)
+    if params['product_id']:
+        query = query.where(Sale.items.any(SaleItem.product_id == params['product_id']))
+    return db.session.execute(query).scalar() or 0
+
+
+def _run_export(job_id, params, progress):
+    total = _export_size(params)
+
+    def counted(rows):
+        for n, row in enumerate(rows, 1):
+            if n % 1000 == 0:
+                progress(min(0.99, n / total) if total else 0.99)
+            yield row
+
+    rows = counted(export.export_rows(params['from_date'], params['to_date'], params['product_id']))
+    fmt = params['format']
+    path = os.path.join(job_dir(), f"{job_id}.{fmt}")
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as out:
+            out.writelines(export.iter_csv(rows))
+    else:
+        export.write_xlsx(rows, path)
+    return path, f"sales_report_{datetime.now():%Y%m%d}.{fmt}"
+
+
+# kind -> (parse request args into params, run(job_id, params, progress))
+KINDS = {
+    'report': (_report_params, _run_report),
+    'export': (_export_params, _run_export),
+}
+
+
+# ----------------------------------------
+# Submitting and polling
+# ----------------------------------------
+
+def _active_key(kind, params):
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def submit(kind, args):
+    """Queue a job, or find the identical one already in flight; returns
+    its status()."""
+    if kind not in KINDS:
+        raise JobError("Unknown job kind")
+    params = KINDS[kind][0](args)
+    key = _active_key(kind, params)
+    for _ in range(3):
+        with db.engine.begin() as conn:
+            existing = conn.execute(select(job.c.id).where(job.c.active_key == key)).scalar()
+        if existing is not None:
+            return status(existing)
+        job_id = uuid.uuid4().hex
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(job).values(
+                    id=job_id, kind=kind, params=json.dumps(params), active_key=key,
+                    status='queued', progress=0.0, attempts=0, created_at=datetime.utcnow()))
+        except IntegrityError:
+            continue  # queued by a concurrent request just now; join that one
+        _wake.set()
+        return status(job_id)
+    raise JobError("Could not queue the job, please retry")
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def status(job_id):
+    """The job as the API shows it, or None."""
+    with db.engine.connect() as conn:
+        row = conn.execute(select(job).where(job.c.id == job_id)).first()
+    if row is None:
+        return None
+    return {
+        "id": row.id,
+        "kind": row.kind,
+        "params": json.loads(row.params),
+        "status": row.status,
+        "progress": round(row.progress, 3),
+        "error": row.error,
+        "filename": row.filename,
+        "created_at": _iso(row.created_at),
+        "started_at": _iso(row.started_at),
+        "finished_at": _iso(row.finished_at),
+        "expires_at": _iso(row.expires_at),
+    }
+
+
+def artifact(job_id):
+    """(path, download name, mimetype) of a finished job's file, or None."""
+    with db.engine.connect() as conn:
+        row = conn.execute(select(job.c.artifact, job.c.filename)
+                           .where(job.c.id == job_id, job.c.status == 'done')).first()
+    if row is None or not row.artifact:
+        return None
+    path = os.path.join(job_dir(), row.artifact)
+    if not os.path.exists(path):
+        return None
+    return path, row.filename, MIMETYPES[row.artifact.rsplit('.', 1)[1]]
+
+
+# ----------------------------------------
+# Workers
+# ----------------------------------------
+
+def claim():
+    """Take the oldest queued job for this process; returns (id, kind,
+    params) or None. The conditional UPDATE lets only one worker win."""
+    while True:
+        with db.engine.begin() as conn:
+            row = conn.execute(select(job.c.id, job.c.kind, job.c.params)
+                               .where(job.c.status == 'queued')
+                               .order_by(job.c.created_at).limit(1)).first()
+            if row is None:
+                return None
+            now = datetime.utcnow()
+            won = conn.execute(
+                update(job).where(job.c.id == row.id, job.c.status == 'queued')
+                .values(status='running', started_at=now, heartbeat_at=now,
+                        attempts=job.c.attempts + 1)).rowcount
+        if won:
+            with _lock:
+                _running.add(row.id)
+            return row.id, row.kind, json.loads(row.params)
+
+
+def _finish(job_id, **values):
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(update(job).where(job.c.id == job_id).values(
+            active_key=None, finished_at=now, expires_at=now + timedelta(seconds=ttl()), **values))
+
+
+def run(job_id, kind, params):
+    """Run a claimed job to completion in the current app context."""
+    last = [0.0]
+
+    def progress(fraction):
+        now = time.monotonic()
+        if now - last[0] >= PROGRESS_INTERVAL:
+            last[0] = now
+            with db.engine.begin() as conn:
+                conn.execute(update(job).where(job.c.id == job_id).values(
+                    progress=fraction, heartbeat_at=datetime.utcnow()))
+
+    try:
+        os.makedirs(job_dir(), exist_ok=True)
+        if current_app.config.get('REPLICA_URLS'):
+            replicas.use_replica()
+        path, filename = KINDS[kind][1](job_id, params, progress)
+        _finish(job_id, status='done', progress=1.0,
+                artifact=os.path.basename(path), filename=filename)
+    except Exception as e:
+        log.exception("Job %s (%s) failed", job_id, kind)
+        for ext in MIMETYPES:  # a partly written artifact
+            try:
+                os.remove(os.path.join(job_dir(), f"{job_id}.{ext}"))
+            except FileNotFoundError:
+                pass
+        _finish(job_id, status='failed', error=str(e)[:255] or type(e).__name__)
+    finally:
+        db.session.remove()
+        with _lock:
+            _running.discard(job_id)
+
+
+def sweep():
+    """Heartbeat this process's running jobs, requeue those whose worker
+    died, and delete expired jobs with their files."""
+    now = datetime.utcnow()
+    with _lock:
+        running = list(_running)
+    with db.engine.begin() as conn:
+        if running:
+            conn.execute(update(job).where(job.c.id.in_(running)).values(heartbeat_at=now))
+        stale = job.c.heartbeat_at < now - timedelta(seconds=STALE_AFTER)
+        conn.execute(update(job).where(job.c.status == 'running', stale,
+                                       job.c.attempts < MAX_ATTEMPTS)
+                     .values(status='queued', progress=0.0))
+        conn.execute(update(job).where(job.c.status == 'running', stale)
+                     .values(status='failed', error="Worker stopped", active_key=None,
+                             finished_at=now, expires_at=now + timedelta(seconds=ttl())))
+        expired = conn.execute(select(job.c.id, job.c.artifact).where(job.c.expires_at < now)).all()
+        if expired:
+            conn.execute(delete(job).where(job.c.id.in_([row.id for row in expired])))
+    folder = job_dir()
+    for row in expired:
+        if row.artifact:
+            try:
+                os.remove(os.path.join(folder, row.artifact))
+            except FileNotFoundError:
+                pass
+    return len(expired)
+
+
+def _work(app):
+    while True:
+        try:
+            with app.app_context():
+                claimed = claim()
+                if claimed:
+                    run(*claimed)
+                    continue
+        except Exception:
+            log.exception("Job worker error")
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+
+
+def _sweeper(app):
+    while True:
+        try:
+            with app.app_context():
+                sweep()
+        except Exception as e:
+            log.warning("Could not sweep the job table: %s", e)
+        time.sleep(SWEEP_INTERVAL)
+
+
+def start(app, workers):
+    """Start ``workers`` worker threads and the sweeper, once per process."""
+    with _lock:
+        if app in _started:
+            return
+        _started.add(app)
+    threading.Thread(target=_sweeper, args=(app,), daemon=True, name='jobs-sweeper').start()
+    for n in range(workers):
+        threading.Thread(target=_work, args=(app,), daemon=True, name=f'jobs-worker-{n}').start()
+
+
+def init_app(app):
+    workers = app.config.get('JOB_WORKERS')
+    workers = DEFAULT_WORKERS if workers is None else int(workers)
+    if workers <= 0:
+        return
+
+    @app.before_request
+    def start_workers():
+        # Started by the first request, so they run in every worker process
+        # rather than in a parent that forks them
+        start(app, workers)
@@ -0,0 +1,335 @@
+# ipos/live.py
+#
+# Live dashboard. Once a checkout commits, it publishes a "sale" event (id,
+# total, items, day) to the in-process hub below. If the sale moved a
+# different product to the top of product_sales_summary, it also publishes a
+# "top_product" event. Every open dashboard subscribes through
+# GET /api/dashboard/stream (server-sent events). It receives the full
+# figures once, as a "snapshot" event, and then applies the deltas itself.
+# Each event is encoded once and handed to every subscriber's queue, so any
+# number of viewers costs one fan-out per sale. Before, each viewer re-ran
+# every aggregate on every reload. With nobody watching, checkout skips the
+# events entirely.
+#
+# The hub is per process. With several worker processes, a dashboard only
+# hears about sales committed by its own worker. Every LIVE_POLL_INTERVAL
+# seconds (default 5) each stream therefore reads the newest sale id, one
+# index lookup, and sends fresh figures if another worker recorded a sale
+# since. A full snapshot also goes out every LIVE_RESYNC_INTERVAL seconds.
+#
+# Under asgi.py, ipos/aio.py serves the stream, so an open dashboard does
+# not tie up a request thread. Under gunicorn each open stream holds one of
+# the worker's THREADS. Past LIVE_MAX_STREAMS per worker (default a quarter
+# of THREADS), a viewer gets one snapshot with an SSE "retry" field, and
+# the browser reconnects for a new one every LIVE_POLL_INTERVAL seconds, so
+# dashboards never starve the tills.
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func
+from ipos.db import db
+from ipos import serialize
+from model import Product, Customer, Sale, DailySalesSummary, ProductSalesSummary
+
+QUEUE_SIZE = 100           # frames a viewer may fall behind before a resync
+KEEPALIVE = 15.0           # seconds between comments on an idle stream
+DEFAULT_RESYNC = 300.0     # seconds between full snapshots per viewer
+DEFAULT_POLL = 5.0         # seconds between checks for other workers' sales
+
+
+def encode(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + serialize.dumps(data) + b"\n\n"
+
+
+PING = b": ping\n\n"
+
+
+class Subscriber:
+    """One viewer's queue of (sale_id, frame). A viewer that falls
+    QUEUE_SIZE frames behind is marked stale and sent a snapshot instead."""
+
+    def __init__(self):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.stale = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.stale = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        while self.get(0) is not None:
+            pass
+        self.stale = False
+
+
+class Hub:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._top = None   # (product_id, quantity) of the top seller, while watched
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._top = None  # not tracked while nobody watches
+
+    def publish(self, event, data, sale_id=None):
+        message = (sale_id, encode(event, data))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def set_top(self, top):
+        with self._lock:
+            self._top = top
+
+    def offer_top(self, quantities):
+        """Take the current quantities sold of some products; returns the
+        new top product id if one of them overtook the known top, else
+        None."""
+        with self._lock:
+            if self._top is None:
+                return None
+            top_id, top_qty = self._top
+            best = max(quantities.items(), key=lambda item: (item[1], -item[0]), default=None)
+            if top_id in quantities:
+                top_qty = quantities[top_id]
+            if best is None or best[0] == top_id or best[1] <= top_qty:
+                self._top = (top_id, top_qty)
+                return None
+            self._top = best
+            return best[0]
+
+
+hub = Hub()
+
+
+def resync_interval():
+    return float(current_app.config.get('LIVE_RESYNC_INTERVAL') or DEFAULT_RESYNC)
+
+
+def poll_interval():
+    return float(current_app.config.get('LIVE_POLL_INTERVAL') or DEFAULT_POLL)
+
+
+def max_streams():
+    """Open streams a WSGI worker serves before falling back to polling."""
+    limit = current_app.config.get('LIVE_MAX_STREAMS')
+    if limit is None:
+        limit = max(1, int(current_app.config.get('THREADS') or 8) // 4)
+    return int(limit)
+
+
+# ----------------------------------------
+# Figures and deltas
+# ----------------------------------------
+
+def _top_seller():
+    return db.session.execute(
+        select(ProductSalesSummary.product_id, ProductSalesSummary.quantity, Product.name)
+        .join(Product, Product.id == ProductSalesSummary.product_id)
+        .order_by(ProductSalesSummary.quantity.desc(), ProductSalesSummary.product_id)
+        .limit(1)).first()
+
+
+def newest_sale_id():
+    return db.session.query(func.max(Sale.id)).scalar() or 0
+
+
+def figures():
+    """The dashboard's figures. Totals come from the daily/product rollups
+    maintained at checkout, so this reads O(days) rows rather than scanning
+    every sale."""
+    last_sale_id = db.session.query(func.max(Sale.id)).scalar() or 0
+    total_sales, products_sold = db.session.query(
+        func.coalesce(func.sum(DailySalesSummary.revenue), 0),
+        func.coalesce(func.sum(DailySalesSummary.items_sold), 0)
+    ).one()
+    total_customers = Customer.query.count()
+
+    today = datetime.utcnow().date()
+    this_month = today.replace(day=1)
+    revenue_month = db.session.query(func.sum(DailySalesSummary.revenue))\
+        .filter(DailySalesSummary.day >= this_month).scalar() or 0
+
+    top = _top_seller()
+    if len(hub):
+        hub.set_top((top.product_id, top.quantity) if top else (None, 0))
+
+    this_week_start = today - timedelta(days=today.weekday())
+    last_week_start = this_week_start - timedelta(days=7)
+
+    sales_last_week = db.session.query(func.sum(DailySalesSummary.revenue))\
+        .filter(DailySalesSummary.day >= last_week_start,
+                DailySalesSummary.day < this_week_start).scalar() or 0
+    sales_this_week = db.session.query(func.sum(DailySalesSummary.revenue))\
+        .filter(DailySalesSummary.day >= this_week_start).scalar() or 0
+
+    growth = 0
+    if sales_last_week > 0:
+        growth = round(((sales_this_week - sales_last_week) / sales_last_week) * 100, 1)
+
+    week_start = datetime.combine(this_week_start, datetime.min.time())
+    new_customers = db.session.query(func.count(func.distinct(Sale.customer_id)))\
+        .filter(Sale.date >= week_start).scalar() or 0
+
+    return {
+        "total_sales": total_sales,
+        "total_customers": total_customers,
+        "products_sold": int(products_sold),
+        "revenue_month": revenue_month,
+        "top_product_name": top.name if top else "N/A",
+        "growth": growth,
+        "new_customers": new_customers,
+        # What a viewer needs to apply "sale" events to the figures above
+        "month": this_month.isoformat()[:7],
+        "week_start": this_week_start.isoformat(),
+        "sales_this_week": sales_this_week,
+        "sales_last_week": sales_last_week,
+        "last_sale_id": last_sale_id,
+    }
+
+
+def sale_event(sale, items):
+    """A "sale" event for a placed sale, or None with nobody watching. Take
+    it before committing; the commit expires the sale's attributes."""
+    if not len(hub):
+        return None
+    return {
+        "id": sale.id,
+        "total": sale.total,
+        "items": sum(int(item['quantity']) for item in items),
+        "day": sale.date.date().isoformat(),
+        "products": sorted({int(item['product_id']) for item in items}),
+    }
+
+
+def publish(events):
+    """Fan committed sales' events out to every viewer. If one of the sold
+    products overtook the top seller, a "top_product" event follows."""
+    events = [e for e in events if e is not None]
+    if not events or not len(hub):
+        return
+    sold = set()
+    for event in events:
+        sold.update(event.pop('products'))
+        hub.publish('sale', event, sale_id=event['id'])
+    quantities = dict(db.session.execute(
+        select(ProductSalesSummary.product_id, ProductSalesSummary.quantity)
+        .where(ProductSalesSummary.product_id.in_(sold))).all())
+    product_id = hub.offer_top(quantities)
+    if product_id is not None:
+        name = db.session.get(Product, product_id).name
+        hub.publish('top_product', {"id": product_id, "name": name,
+                                    "quantity": quantities[product_id]})
+
+
+# ----------------------------------------
+# Stream
+# ----------------------------------------
+
+class Viewer:
+    """One stream's bookkeeping, shared by stream() and ipos/aio.py: when
+    the next snapshot, poll and keepalive are due, and which sales the
+    viewer has seen."""
+
+    def __init__(self, resync, poll):
+        self.resync = resync
+        self.poll = poll
+        self.since = 0   # last sale in the snapshot
+        self.seen = 0    # last sale in the snapshot or sent since
+        self.next_sync = self.next_poll = self.next_ping = 0.0
+
+    def snapshot_due(self, subscriber, now):
+        return subscriber.stale or now >= self.next_sync
+
+    def poll_due(self, now):
+        return now >= self.next_poll
+
+    def polled(self, newest, now):
+        self.next_poll = now + self.poll
+        if newest > self.seen:  # recorded by another worker process
+            self.next_sync = now
+
+    def snapshot(self, data, now):
+        self.since = self.seen = data['last_sale_id']
+        self.next_sync, self.next_poll = now + self.resync, now + self.poll
+        self.sent(now)
+
+    def sent(self, now):
+        self.next_ping = now + KEEPALIVE
+
+    def timeout(self, now):
+        return max(0.0, min(self.next_sync, self.next_poll, self.next_ping) - now)
+
+    def accept(self, sale_id):
+        """Whether a frame from the hub is news to this viewer."""
+        if sale_id is None:
+            return True
+        if sale_id <= self.since:
+            return False  # already in the snapshot
+        self.seen = max(self.seen, sale_id)
+        return True
+
+
+def stream(resync, poll):
+    """Server-sent event frames for one viewer, as bytes: a snapshot, then
+    deltas, with a fresh snapshot every ``resync`` seconds, whenever the
+    viewer fell behind, and when a poll finds sales from another worker.
+    Run inside the request's app context."""
+    subscriber = hub.subscribe(Subscriber())
+    viewer = Viewer(resync, poll)
+    try:
+        while True:
+            now = time.monotonic()
+            if not viewer.snapshot_due(subscriber, now) and viewer.poll_due(now):
+                viewer.polled(newest_sale_id(), now)
+                db.session.close()
+            if viewer.snapshot_due(subscriber, now):
+                subscriber.drain()
+                data = figures()
+                db.session.close()  # no transaction held open between snapshots
+                viewer.snapshot(data, now)
+                yield encode('snapshot', data)
+                continue
+            message = subscriber.get(viewer.timeout(now))
+            now = time.monotonic()
+            if message is None:
+                if now >= viewer.next_ping:
+                    viewer.sent(now)
+                    yield PING
+                continue
+            sale_id, frame = message
+            if viewer.accept(sale_id):
+                viewer.sent(now)
+                yield frame
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def snapshot_once(retry):
+    """One snapshot for a viewer over the stream limit. The "retry" field
+    makes EventSource reconnect ``retry`` seconds after the response ends."""
+    data = figures()
+    db.session.close()
+    yield f"retry: {int(retry * 1000)}\n\n".encode() + encode('snapshot', data)
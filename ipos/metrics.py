@@ -0,0 +1,199 @@
+# ipos/metrics.py
+#
+# Per-request instrumentation: latency histograms per endpoint, SQL query
+# count and time per request (SQLAlchemy cursor events), a warning for
+# requests that run more than METRICS_MAX_QUERIES statements (the usual sign
+# of an N+1 such as Product.to_dict() loading each category), and a
+# Prometheus text endpoint at /metrics.
+#
+# Counters live in the worker process. With several worker processes each
+# one exposes its own /metrics, so scrape them per worker (or run one).
+#
+# Settings (POS_* env vars or the POS_CONFIG file):
+#   METRICS_MAX_QUERIES    per-request query budget, default 20
+#   METRICS_SLOW_QUERY_MS  log statements slower than this, default 200
+#   PROFILER               allow ?_profile=1 on any request, default off
+#   PROFILE_DIR            where profiles are written, default instance/profiles
+import cProfile
+import logging
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from ipos.db import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels.items())
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}        # (endpoint, method) -> Histogram
+        self.queries = {}        # endpoint -> Histogram of queries per request
+        self.requests = {}       # (endpoint, method, status) -> count
+        self.query_seconds = {}  # endpoint -> total SQL time
+        self.over_budget = {}    # endpoint -> requests over METRICS_MAX_QUERIES
+
+    def init_app(self, app):
+        self.max_queries = app.config.get('METRICS_MAX_QUERIES', 20)
+        self.slow_query = app.config.get('METRICS_SLOW_QUERY_MS', 200) / 1000
+        self.profiler = app.config.get('PROFILER', False)
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+        with app.app_context():
+            # The primary and every read replica (ipos/replicas.py)
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+    # -- SQL --------------------------------------------------------------
+
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if elapsed > self.slow_query:
+            log.warning("Slow query (%.0f ms): %s", elapsed * 1000, statement)
+        if has_request_context() and 'query_count' in g:
+            g.query_count += 1
+            g.query_time += elapsed
+
+    # -- requests ---------------------------------------------------------
+
+    def _start(self):
+        g.request_start = time.perf_counter()
+        g.query_count = 0
+        g.query_time = 0.0
+        if self.profiler and request.args.get('_profile'):
+            g.profile = cProfile.Profile()
+            try:
+                g.profile.enable()
+            except ValueError:  # another request on this process is profiling
+                g.pop('profile')
+
+    def _finish(self, response):
+        if 'request_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'static':
+            return response
+
+        if 'profile' in g:
+            profile = g.pop('profile')
+            profile.disable()
+            response.headers['X-Profile'] = self._dump_profile(profile, endpoint)
+
+        self.observe(endpoint, request.method, response.status_code, elapsed,
+                     g.query_count, g.query_time)
+        if g.query_count > self.max_queries:
+            log.warning("%s %s ran %d queries (budget %d); check for N+1 loading",
+                        request.method, request.path, g.query_count, self.max_queries)
+        response.headers['X-Query-Count'] = str(g.query_count)
+        response.headers['Server-Timing'] = (f"db;desc=\"{g.query_count} queries\";"
+                                             f"dur={g.query_time * 1000:.1f}, "
+                                             f"app;dur={elapsed * 1000:.1f}")
+        return response
+
+    def _teardown(self, exc):
+        # A view that raised may never reach _finish; the profiler must not
+        # stay enabled on this thread
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+
+    def observe(self, endpoint, method, status, elapsed, queries=None, query_time=0.0):
+        """Record one request; ``queries`` is None when they were not counted."""
+        with self._lock:
+            self.latency.setdefault((endpoint, method),
+                                    Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if queries is None:
+                return
+            self.queries.setdefault(endpoint, Histogram(QUERY_BUCKETS)).observe(queries)
+            self.query_seconds[endpoint] = self.query_seconds.get(endpoint, 0) + query_time
+            if queries > self.max_queries:
+                self.over_budget[endpoint] = self.over_budget.get(endpoint, 0) + 1
+
+    def _dump_profile(self, profile, endpoint):
+        """Write a .prof file (for snakeviz/pstats) and a text summary."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}"
+        path = os.path.join(self.profile_dir, name)
+        profile.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w') as f:
+            pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(40)
+        return name + '.prof'
+
+    # -- export -----------------------------------------------------------
+
+    def export(self):
+        lines = []
+
+        def histogram(name, help, series, buckets):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        def counter(name, help, series):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        with self._lock:
+            histogram('pos_request_duration_seconds', 'Request latency by endpoint.',
+                      [(_labels(endpoint=e, method=m), h) for (e, m), h in sorted(self.latency.items())],
+                      LATENCY_BUCKETS)
+            counter('pos_requests_total', 'Requests by endpoint and status.',
+                    [(_labels(endpoint=e, method=m, status=s), n)
+                     for (e, m, s), n in sorted(self.requests.items())])
+            histogram('pos_request_queries', 'SQL statements per request.',
+                      [(_labels(endpoint=e), h) for e, h in sorted(self.queries.items())],
+                      QUERY_BUCKETS)
+            counter('pos_request_query_seconds_total', 'Time spent in SQL by endpoint.',
+                    [(_labels(endpoint=e), t) for e, t in sorted(self.query_seconds.items())])
+            counter('pos_request_query_budget_exceeded_total',
+                    'Requests that ran more than METRICS_MAX_QUERIES statements.',
+                    [(_labels(endpoint=e), n) for e, n in sorted(self.over_budget.items())])
+
+        return Response('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics = Metrics()
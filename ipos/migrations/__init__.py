@@ -0,0 +1,105 @@
+# ipos/migrations/__init__.py
+#
+# Versioned schema migrations. Each module vNNNN_<name>.py defines
+# upgrade(conn) and is applied once, in order, inside its own transaction;
+# the applied versions are recorded in the schema_version table.
+#
+# App startup only reads MAX(version) from that table (see verify()), so
+# workers and CLI scripts no longer reflect the whole schema on boot. Apply
+# pending migrations with:
+#
+#   flask --app app db-upgrade
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+from flask import jsonify
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, func, insert
+from sqlalchemy.exc import DBAPIError
+
+SCHEMA_TABLE = 'schema_version'
+
+_meta = MetaData()
+schema_version = Table(
+    SCHEMA_TABLE, _meta,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+def available():
+    """[(version, name, module)] for every migration script, in order."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = re.fullmatch(r'v(\d{4})_(\w+)', info.name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), info.name))
+    return sorted(found)
+
+
+def head():
+    migrations = available()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(conn):
+    # One round trip; a missing table means nothing has been applied yet
+    try:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except DBAPIError:
+        conn.rollback()
+        return 0
+
+
+def upgrade(engine, target=None, echo=print):
+    """Apply every pending migration up to ``target`` (default: head)."""
+    with engine.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+    with engine.connect() as conn:
+        current = current_version(conn)
+
+    applied = []
+    for version, name, module in available():
+        if version <= current or (target is not None and version > target):
+            continue
+        echo(f"Applying {version:04d} {name}")
+        mod = importlib.import_module(f"{__name__}.{module}")
+        with engine.begin() as conn:
+            mod.upgrade(conn)
+            conn.execute(insert(schema_version).values(
+                version=version, name=name, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+def verify(app, engine):
+    """Fast boot check: a single MAX() query.
+
+    With AUTO_MIGRATE (on for the local profile) pending migrations are
+    applied; otherwise every request gets a 503 until someone runs
+    db-upgrade, rather than failing later on a missing column.
+    """
+    with engine.connect() as conn:
+        current = current_version(conn)
+    expected = head()
+    if current == expected:
+        return
+    if current > expected:
+        app.logger.warning("Database schema %s is newer than this code (%s)", current, expected)
+        return
+    if app.config.get("AUTO_MIGRATE"):
+        upgrade(engine, echo=app.logger.info)
+        return
+
+    message = (f"Database schema is at version {current}, code expects {expected}; "
+               f"run 'flask --app app db-upgrade'")
+    app.logger.error(message)
+
+    @app.before_request
+    def schema_outdated():
+        return jsonify({"error": message}), 503
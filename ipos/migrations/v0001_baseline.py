@@ -0,0 +1,44 @@
+# ipos/migrations/v0001_baseline.py
+#
+# The tables as they were before migrations existed. Table definitions are
+# frozen here on purpose: later model changes must not alter what this step
+# creates. checkfirst adopts databases that db.create_all() already built.
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, Text, DateTime, ForeignKey
+
+meta = MetaData()
+
+Table('category', meta,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False, unique=True))
+
+Table('product', meta,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('price', Float, nullable=False),
+      Column('stock', Integer),
+      Column('description', Text),
+      Column('image', String(255)),
+      Column('category_id', Integer, ForeignKey('category.id')))
+
+Table('customer', meta,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('email', String(120), unique=True),
+      Column('phone', String(20)))
+
+Table('sale', meta,
+      Column('id', Integer, primary_key=True),
+      Column('customer_id', Integer, ForeignKey('customer.id')),
+      Column('date', DateTime),
+      Column('total', Float))
+
+Table('sale_item', meta,
+      Column('id', Integer, primary_key=True),
+      Column('sale_id', Integer, ForeignKey('sale.id'), nullable=False),
+      Column('product_id', Integer, ForeignKey('product.id'), nullable=False),
+      Column('quantity', Integer, nullable=False),
+      Column('price', Float, nullable=False))
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
@@ -0,0 +1,41 @@
+# ipos/migrations/v0002_sale_rollups.py
+from sqlalchemy import MetaData, Table, Column, Integer, Float, Date, ForeignKey, Index, text
+
+meta = MetaData()
+
+# Referenced only for the foreign key; it already exists, so checkfirst skips it
+Table('product', meta, Column('id', Integer, primary_key=True))
+
+Table('daily_sales_summary', meta,
+      Column('day', Date, primary_key=True),
+      Column('sales_count', Integer, nullable=False),
+      Column('items_sold', Integer, nullable=False),
+      Column('revenue', Float, nullable=False))
+
+product_sales_summary = Table(
+    'product_sales_summary', meta,
+    Column('product_id', Integer, ForeignKey('product.id'), primary_key=True, autoincrement=False),
+    Column('quantity', Integer, nullable=False),
+    Column('revenue', Float, nullable=False))
+
+Index('ix_product_sales_summary_quantity', product_sales_summary.c.quantity)
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    conn.execute(text("DELETE FROM daily_sales_summary"))
+    conn.execute(text("DELETE FROM product_sales_summary"))
+    conn.execute(text("""
+        INSERT INTO daily_sales_summary (day, sales_count, items_sold, revenue)
+        SELECT d.day, d.cnt, COALESCE(i.qty, 0), d.revenue
+        FROM (SELECT DATE(date) AS day, COUNT(*) AS cnt, COALESCE(SUM(total), 0) AS revenue
+              FROM sale WHERE date IS NOT NULL GROUP BY DATE(date)) d
+        LEFT JOIN (SELECT DATE(s.date) AS day, SUM(si.quantity) AS qty
+                   FROM sale_item si JOIN sale s ON s.id = si.sale_id
+                   WHERE s.date IS NOT NULL GROUP BY DATE(s.date)) i ON i.day = d.day
+    """))
+    conn.execute(text("""
+        INSERT INTO product_sales_summary (product_id, quantity, revenue)
+        SELECT product_id, SUM(quantity), SUM(quantity * price)
+        FROM sale_item GROUP BY product_id
+    """))
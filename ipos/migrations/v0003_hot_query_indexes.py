@@ -0,0 +1,22 @@
+# ipos/migrations/v0003_hot_query_indexes.py
+#
+# Indexes behind the dashboard, sales history, reports and joins:
+# sale by date and by customer (both with id for keyset paging), and the
+# foreign keys that every item/product join walks.
+from sqlalchemy import MetaData, Table, Index
+
+INDEXES = [
+    ('ix_sale_date_id', 'sale', ['date', 'id']),
+    ('ix_sale_customer_date_id', 'sale', ['customer_id', 'date', 'id']),
+    ('ix_sale_item_sale_id', 'sale_item', ['sale_id']),
+    ('ix_sale_item_product_id', 'sale_item', ['product_id']),
+    ('ix_product_category_id', 'product', ['category_id']),
+    ('ix_product_name', 'product', ['name']),
+]
+
+
+def upgrade(conn):
+    meta = MetaData()
+    for name, table, columns in INDEXES:
+        t = Table(table, meta, autoload_with=conn)
+        Index(name, *[t.c[c] for c in columns]).create(conn, checkfirst=True)
@@ -0,0 +1,29 @@
+# ipos/migrations/v0004_product_barcode_search.py
+from sqlalchemy import text
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "name, content='product', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE INDEX IF NOT EXISTS ix_product_name_nocase ON product (name COLLATE NOCASE)",
+]
+
+MYSQL_DDL = [
+    "ALTER TABLE product ADD FULLTEXT INDEX ft_product_name (name) WITH PARSER ngram",
+]
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE product ADD COLUMN barcode VARCHAR(64)"))
+    conn.execute(text("CREATE UNIQUE INDEX ux_product_barcode ON product (barcode)"))
+    dialect = conn.dialect.name
+    for stmt in SQLITE_DDL if dialect == 'sqlite' else MYSQL_DDL if dialect == 'mysql' else []:
+        conn.execute(text(stmt))
+    if dialect == 'sqlite':
+        conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
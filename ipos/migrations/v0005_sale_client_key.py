@@ -0,0 +1,7 @@
+# ipos/migrations/v0005_sale_client_key.py
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE sale ADD COLUMN client_key VARCHAR(64)"))
+    conn.execute(text("CREATE UNIQUE INDEX ux_sale_client_key ON sale (client_key)"))
@@ -0,0 +1,30 @@
+# ipos/migrations/v0006_sales_search.py
+from sqlalchemy import text
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts USING fts5("
+    "name, content='customer', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_ai AFTER INSERT ON customer BEGIN "
+    "INSERT INTO customer_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_ad AFTER DELETE ON customer BEGIN "
+    "INSERT INTO customer_fts(customer_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_au AFTER UPDATE OF name ON customer BEGIN "
+    "INSERT INTO customer_fts(customer_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO customer_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE INDEX IF NOT EXISTS ix_customer_name_nocase ON customer (name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_email_nocase ON customer (email COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_phone_nocase ON customer (phone COLLATE NOCASE)",
+]
+
+MYSQL_DDL = [
+    "ALTER TABLE customer ADD FULLTEXT INDEX ft_customer_name (name) WITH PARSER ngram",
+    "CREATE INDEX ix_customer_phone ON customer (phone)",
+]
+
+
+def upgrade(conn):
+    dialect = conn.dialect.name
+    for stmt in SQLITE_DDL if dialect == 'sqlite' else MYSQL_DDL if dialect == 'mysql' else []:
+        conn.execute(text(stmt))
+    if dialect == 'sqlite':
+        conn.execute(text("INSERT INTO customer_fts(customer_fts) VALUES ('rebuild')"))
@@ -0,0 +1,50 @@
+# ipos/migrations/v0007_inventory_ledger.py
+#
+# Stock moves from product.stock to the stock_level table, fed by the
+# stock_movement ledger. Every product gets an opening-balance adjustment
+# for its current stock. product.stock is left in place but no longer
+# written.
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, ForeignKey, Index, text
+
+meta = MetaData()
+
+Table('product', meta, Column('id', Integer, primary_key=True))
+
+stock_level = Table(
+    'stock_level', meta,
+    Column('product_id', Integer, ForeignKey('product.id'), primary_key=True, autoincrement=False),
+    Column('quantity', Integer, nullable=False),
+    Column('reorder_level', Integer, nullable=False),
+    Column('shortfall', Integer, nullable=False))
+
+stock_movement = Table(
+    'stock_movement', meta,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, nullable=False),
+    Column('kind', String(16), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('sale_id', Integer),
+    Column('note', String(255)),
+    Column('created_at', DateTime, nullable=False))
+
+Table('stock_snapshot', meta,
+      Column('product_id', Integer, primary_key=True, autoincrement=False),
+      Column('movement_id', Integer, primary_key=True, autoincrement=False),
+      Column('quantity', Integer, nullable=False),
+      Column('taken_at', DateTime, nullable=False))
+
+Index('ix_stock_level_shortfall', stock_level.c.shortfall)
+Index('ix_stock_movement_product_id_id', stock_movement.c.product_id, stock_movement.c.id)
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    conn.execute(text("""
+        INSERT INTO stock_level (product_id, quantity, reorder_level, shortfall)
+        SELECT id, COALESCE(stock, 0), 0, -COALESCE(stock, 0) FROM product
+    """))
+    conn.execute(text("""
+        INSERT INTO stock_movement (product_id, kind, quantity, note, created_at)
+        SELECT id, 'adjustment', COALESCE(stock, 0), 'Opening balance', CURRENT_TIMESTAMP
+        FROM product ORDER BY id
+    """))
@@ -0,0 +1,18 @@
+# ipos/migrations/v0008_replica_heartbeat.py
+#
+# The heartbeat row read replicas are measured against (ipos/replicas.py).
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, select, insert
+
+meta = MetaData()
+
+replica_heartbeat = Table(
+    'replica_heartbeat', meta,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('beat_at', DateTime, nullable=False))
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    if conn.execute(select(replica_heartbeat.c.id)).first() is None:
+        conn.execute(insert(replica_heartbeat).values(id=1, beat_at=datetime.utcnow()))
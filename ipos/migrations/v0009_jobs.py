@@ -0,0 +1,31 @@
+# ipos/migrations/v0009_jobs.py
+#
+# The background job queue for reports and exports (ipos/jobs.py).
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, Float, DateTime, Index
+
+meta = MetaData()
+
+job = Table(
+    'job', meta,
+    Column('id', String(32), primary_key=True),
+    Column('kind', String(16), nullable=False),
+    Column('params', Text, nullable=False),
+    Column('active_key', String(64), unique=True),
+    Column('status', String(16), nullable=False),
+    Column('progress', Float, nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('error', String(255)),
+    Column('artifact', String(64)),
+    Column('filename', String(255)),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime),
+    Column('heartbeat_at', DateTime),
+    Column('finished_at', DateTime),
+    Column('expires_at', DateTime))
+
+Index('ix_job_status_created_at', job.c.status, job.c.created_at)
+Index('ix_job_expires_at', job.c.expires_at)
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
@@ -0,0 +1,75 @@
+# ipos/migrations/v0010_customer_stats.py
+#
+# Per-customer purchase statistics (ipos/customer_stats.py), filled from
+# the live sale tables. Stores with archived months should run
+# `flask --app app rebuild-rollups` afterwards to count those too.
+from sqlalchemy import MetaData, Table, Column, Integer, Float, DateTime, ForeignKey, Index, \
+    select, insert, update, func, literal
+
+meta = MetaData()
+
+Table('customer', meta, Column('id', Integer, primary_key=True))
+
+sale = Table(
+    'sale', meta,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer),
+    Column('date', DateTime),
+    Column('total', Float))
+
+sale_item = Table(
+    'sale_item', meta,
+    Column('id', Integer, primary_key=True),
+    Column('sale_id', Integer),
+    Column('product_id', Integer),
+    Column('quantity', Integer))
+
+customer_stats = Table(
+    'customer_stats', meta,
+    Column('customer_id', Integer, ForeignKey('customer.id'), primary_key=True, autoincrement=False),
+    Column('order_count', Integer, nullable=False),
+    Column('total_spent', Float, nullable=False),
+    Column('first_purchase', DateTime, nullable=False),
+    Column('last_purchase', DateTime, nullable=False),
+    Column('favourite_product_id', Integer),
+    Column('favourite_quantity', Integer, nullable=False))
+
+customer_product_stats = Table(
+    'customer_product_stats', meta,
+    Column('customer_id', Integer, ForeignKey('customer.id'), primary_key=True, autoincrement=False),
+    Column('product_id', Integer, primary_key=True, autoincrement=False),
+    Column('quantity', Integer, nullable=False))
+
+Index('ix_customer_stats_total_spent', customer_stats.c.total_spent, customer_stats.c.customer_id)
+Index('ix_customer_stats_order_count', customer_stats.c.order_count, customer_stats.c.customer_id)
+Index('ix_customer_stats_last_purchase', customer_stats.c.last_purchase, customer_stats.c.customer_id)
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    if conn.execute(select(customer_stats.c.customer_id).limit(1)).first() is not None:
+        return
+
+    cps = customer_product_stats
+    conn.execute(insert(cps).from_select(
+        ['customer_id', 'product_id', 'quantity'],
+        select(sale.c.customer_id, sale_item.c.product_id, func.sum(sale_item.c.quantity))
+        .join(sale, sale_item.c.sale_id == sale.c.id)
+        .where(sale.c.customer_id.isnot(None))
+        .group_by(sale.c.customer_id, sale_item.c.product_id)))
+    conn.execute(insert(customer_stats).from_select(
+        ['customer_id', 'order_count', 'total_spent', 'first_purchase', 'last_purchase',
+         'favourite_quantity'],
+        select(sale.c.customer_id, func.count(sale.c.id),
+               func.round(func.coalesce(func.sum(sale.c.total), 0), 2),
+               func.min(sale.c.date), func.max(sale.c.date), literal(0))
+        .where(sale.c.customer_id.isnot(None))
+        .group_by(sale.c.customer_id)))
+
+    # Favourite: most units bought, the lowest product id on a tie
+    favourite = select(cps.c.product_id).where(cps.c.customer_id == customer_stats.c.customer_id)\
+        .order_by(cps.c.quantity.desc(), cps.c.product_id).limit(1).scalar_subquery()
+    most = select(func.max(cps.c.quantity)).where(cps.c.customer_id == customer_stats.c.customer_id)\
+        .scalar_subquery()
+    conn.execute(update(customer_stats).values(favourite_product_id=favourite,
+                                               favourite_quantity=func.coalesce(most, 0)))
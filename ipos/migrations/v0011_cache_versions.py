@@ -0,0 +1,16 @@
+# ipos/migrations/v0011_cache_versions.py
+#
+# Catalog cache versions kept in the database, so every worker process
+# agrees on them (ipos/catalog_cache.py).
+from sqlalchemy import MetaData, Table, Column, Integer, String
+
+meta = MetaData()
+
+cache_version = Table(
+    'cache_version', meta,
+    Column('name', String(32), primary_key=True),
+    Column('version', Integer, nullable=False))
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
@@ -0,0 +1,23 @@
+# ipos/migrations/v0012_database_identity.py
+#
+# A random token naming this database, for files kept outside it: receipts
+# are stored under it, so a rebuilt or different database never serves
+# another sale's receipt (ipos/receipts.py).
+import uuid
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert
+
+meta = MetaData()
+
+database_identity = Table(
+    'database_identity', meta,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('token', String(32), nullable=False),
+    Column('created_at', DateTime, nullable=False))
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    if conn.execute(select(database_identity.c.id)).first() is None:
+        conn.execute(insert(database_identity).values(
+            id=1, token=uuid.uuid4().hex, created_at=datetime.utcnow()))
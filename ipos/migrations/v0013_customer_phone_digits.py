@@ -0,0 +1,16 @@
+# ipos/migrations/v0013_customer_phone_digits.py
+#
+# Customer phones are stored as typed ("555-1234", "+44 20 7946 0000"); the
+# sales search looks them up by their digits alone, through phone_digits.
+import re
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE customer ADD COLUMN phone_digits VARCHAR(20)"))
+    rows = [{"id": id, "digits": re.sub(r'\D', '', phone) or None}
+            for id, phone in conn.execute(text(
+                "SELECT id, phone FROM customer WHERE phone IS NOT NULL")).all()]
+    if rows:
+        conn.execute(text("UPDATE customer SET phone_digits = :digits WHERE id = :id"), rows)
+    conn.execute(text("CREATE INDEX ix_customer_phone_digits ON customer (phone_digits)"))
@@ -0,0 +1,62 @@
+# ipos/pagination.py
+import base64
+from datetime import datetime
+from sqlalchemy import or_, and_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class CursorError(ValueError):
+    pass
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        raise CursorError("Invalid limit")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(date, id):
+    raw = f"{date.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, id = raw.split('|')
+        return datetime.fromisoformat(date), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError("Invalid cursor")
+
+
+def keyset_query(query, date_col, id_col, cursor, limit):
+    """``query`` (a Query or a select()) narrowed to the page after ``cursor``,
+    with one extra row so split_page() can tell whether another page follows."""
+    if cursor:
+        date, id = decode_cursor(cursor)
+        query = query.filter(or_(date_col < date, and_(date_col == date, id_col < id)))
+    return query.order_by(date_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def split_page(rows, date_col, id_col, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, date_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
+
+
+def keyset_page(query, date_col, id_col, cursor, limit):
+    """Newest-first page of ``query`` strictly after ``cursor``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    Ordering on (date, id) lets the composite indexes serve both the filter
+    and the sort, so the cost of a page does not grow with table size.
+    """
+    rows = keyset_query(query, date_col, id_col, cursor, limit).all()
+    return split_page(rows, date_col, id_col, limit)
@@ -0,0 +1,222 @@
+# ipos/receipts.py
+#
+# Receipts are rendered once, right after checkout, and kept on disk per
+# sale id: the receipt data (JSON), the HTML page, plain text and ESC/POS
+# bytes for till printers. The PDF is built from the same text lines by a
+# background thread. A sale never changes after it is recorded, so reprints
+# are served from the files (304 when the client has them) and never touch
+# the database. Sales recorded before this existed are rendered on their
+# first view.
+#
+# Sale ids repeat across databases, so the files live under the database's
+# identity token (RECEIPT_DIR/<token>/), and clients revalidate rather than
+# keep a receipt URL forever: a rebuilt or different database behind the
+# same address never serves another sale's receipt.
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app, render_template, send_file, abort
+from sqlalchemy import select
+from ipos.db import db
+from ipos import archive
+from model import Product, Customer, Sale, SaleItem, DatabaseIdentity
+
+HEADER = ("P_Control", "123 Business Street, City", "Phone: (+885) 665 097 93")
+FOOTER = ("Thank you for shopping with us!", "Items are non-refundable")
+WIDTH = 42  # characters per line on an 80mm printer (font A)
+CACHE_CONTROL = 'private, no-cache'
+
+# send_file() adds the charset to text types itself
+MIMETYPES = {
+    'html': 'text/html',
+    'txt': 'text/plain',
+    'escpos': 'application/octet-stream',
+    'pdf': 'application/pdf',
+}
+
+log = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipts')
+_queued = set()
+_lock = threading.Lock()
+_tokens = {}  # database URL -> its identity token, read once per process
+
+
+def database_token():
+    url = str(db.engine.url)
+    if url not in _tokens:
+        with db.engine.connect() as conn:
+            _tokens[url] = conn.execute(select(DatabaseIdentity.token)).scalar_one()
+    return _tokens[url]
+
+
+def receipt_dir():
+    base = current_app.config.get('RECEIPT_DIR') or \
+        os.path.join(current_app.instance_path, 'receipts')
+    return os.path.join(base, database_token())
+
+
+def receipt_path(folder, sale_id, ext):
+    # A thousand receipts per directory keeps listings small
+    return os.path.join(folder, str(sale_id // 1000), f"{sale_id}.{ext}")
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def receipt_data(sale_id):
+    """The sale as Sale.to_dict() shapes it, from two tuple queries, or from
+    the archive once its month has left the live tables."""
+    sale = db.session.execute(
+        select(Sale.id, Sale.date, Sale.total, Sale.customer_id, Customer.name)
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+        .where(Sale.id == sale_id)).first()
+    if sale is None:
+        return archive.receipt(archive.archive_dir(), sale_id)
+    items = db.session.execute(
+        select(Product.name, SaleItem.quantity, SaleItem.price)
+        .join(Product, SaleItem.product_id == Product.id)
+        .where(SaleItem.sale_id == sale_id)
+        .order_by(SaleItem.id))
+    return {
+        "id": sale.id,
+        "date": sale.date,
+        "total": sale.total,
+        "customer_id": sale.customer_id,
+        "customer_name": sale.name or "Walk-in",
+        "items": [{"product_name": name, "quantity": qty, "price": price,
+                   "subtotal": round(qty * price, 2)} for name, qty, price in items]
+    }
+
+
+def text_lines(sale, width=WIDTH):
+    def row(left, right):
+        return f"{left[:width - len(right) - 1]:<{width - len(right)}}{right}"
+
+    rule = '-' * width
+    lines = [line.center(width).rstrip() for line in HEADER] + [rule]
+    lines += [row("Receipt #:", f"#{sale['id']:04d}"),
+              row("Date:", sale['date'].strftime('%d/%m/%Y %I:%M %p')),
+              row("Customer:", sale['customer_name']), rule]
+    for item in sale['items']:
+        lines.append(item['product_name'][:width])
+        lines.append(row(f"  {item['quantity']} x ${item['price']:.2f}", f"${item['subtotal']:.2f}"))
+    lines += [rule, row("TOTAL:", f"$ {sale['total']:.2f}"), ""]
+    lines += [line.center(width).rstrip() for line in FOOTER]
+    return lines
+
+
+def escpos(lines):
+    """ESC/POS bytes: initialise, print, feed and cut."""
+    body = '\n'.join(lines).encode('cp437', errors='replace')
+    return b'\x1b@' + body + b'\n\n\n' + b'\x1dV\x42\x03'
+
+
+def pdf(lines, font_size=8):
+    """A single-page 80mm-wide PDF in Courier, without extra dependencies."""
+    leading = font_size + 2
+    width, height = 226, 40 + leading * len(lines)
+
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    text = ''.join(f"({escape(line)}) Tj T* " for line in lines)
+    stream = f"BT /F1 {font_size} Tf {leading} TL 12 {height - 20} Td {text}ET".encode('latin-1', 'replace')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+        f"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+        f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream",
+    ]
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += ''.join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def _render_pdf(folder, sale_id, lines):
+    try:
+        _write(receipt_path(folder, sale_id, 'pdf'), pdf(lines))
+    except Exception:
+        log.exception("Could not render PDF receipt %s", sale_id)
+    finally:
+        with _lock:
+            _queued.discard(sale_id)
+
+
+def queue_pdf(folder, sale_id, lines):
+    with _lock:
+        if sale_id in _queued:
+            return
+        _queued.add(sale_id)
+    _executor.submit(_render_pdf, folder, sale_id, lines)
+
+
+def store(sale_id):
+    """Render and save every variant of a receipt; returns its data."""
+    sale = receipt_data(sale_id)
+    if sale is None:
+        return None
+    folder = receipt_dir()
+    lines = text_lines(sale)
+    html = render_template('receipt.html', sale=sale, header=HEADER, footer=FOOTER)
+    _write(receipt_path(folder, sale_id, 'html'), html.encode())
+    _write(receipt_path(folder, sale_id, 'txt'), '\n'.join(lines).encode())
+    _write(receipt_path(folder, sale_id, 'escpos'), escpos(lines))
+    # JSON last: its presence marks the receipt as rendered
+    _write(receipt_path(folder, sale_id, 'json'),
+           json.dumps(dict(sale, date=sale['date'].isoformat())).encode())
+    queue_pdf(folder, sale_id, lines)
+    return sale
+
+
+def store_after_checkout(sale_ids):
+    """Called once sales are committed; a failure here must not fail the sale,
+    the receipt is then rendered on first view instead."""
+    for sale_id in sale_ids:
+        try:
+            store(sale_id)
+        except Exception:
+            log.exception("Could not pre-render receipt %s", sale_id)
+
+
+def load(sale_id):
+    """Receipt data from disk, rendering the receipt first if needed."""
+    path = receipt_path(receipt_dir(), sale_id, 'json')
+    if not os.path.exists(path):
+        return store(sale_id)
+    with open(path) as f:
+        sale = json.load(f)
+    sale['date'] = datetime.fromisoformat(sale['date'])
+    return sale
+
+
+def serve(sale_id, ext):
+    folder = receipt_dir()
+    path = receipt_path(folder, sale_id, ext)
+    if not os.path.exists(path):
+        if ext == 'pdf' and os.path.exists(receipt_path(folder, sale_id, 'json')):
+            # Rendering in the background; tell the client when to come back
+            queue_pdf(folder, sale_id, text_lines(load(sale_id)))
+            return '', 202, {'Retry-After': '1'}
+        if load(sale_id) is None:
+            abort(404)
+        if not os.path.exists(path):
+            return '', 202, {'Retry-After': '1'}
+    resp = send_file(os.path.abspath(path), mimetype=MIMETYPES[ext], conditional=True, etag=True)
+    resp.headers['Cache-Control'] = CACHE_CONTROL
+    return resp
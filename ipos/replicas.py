@@ -0,0 +1,179 @@
+# ipos/replicas.py
+#
+# The dashboard, reports, analytics and exports only read, so they can run
+# on replicas of the primary database (REPLICA_URLS) instead of competing
+# with checkouts for it. Those routes are marked @read_only: their session
+# then reads through a replica engine (RoutingSession in ipos/db.py), while
+# any flush or INSERT/UPDATE/DELETE still goes to the primary. Every other
+# route, checkout included, stays on the primary.
+#
+# Staleness: while replicas are configured, each worker stamps the
+# replica_heartbeat row on the primary every HEARTBEAT_INTERVAL seconds, and
+# the age of the stamp a replica holds is its lag. A replica more than
+# REPLICA_MAX_LAG seconds behind, or unreachable, is skipped; with none
+# left, the route reads from the primary. Results cached from a replica are
+# reused for at most REPLICA_MAX_LAG seconds, so a report that missed a
+# sale still on its way to the replica is not served past the tolerance.
+#
+# Locally, two SQLite files make a primary and a replica, kept in step by
+# copying one into the other:
+#
+#   POS_REPLICA_URLS='["sqlite:////tmp/replica.db"]' flask --app app replica-sync --every 2
+import functools
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import DBAPIError
+from ipos.db import db
+from model import ReplicaHeartbeat
+
+DEFAULT_MAX_LAG = 5.0      # seconds
+HEARTBEAT_INTERVAL = 1.0
+LAG_CHECK_INTERVAL = 1.0   # a replica's lag is read at most this often
+
+log = logging.getLogger(__name__)
+_lags = {}                 # engine -> (monotonic time checked, lag or None)
+_beating = set()           # apps whose heartbeat thread is running
+_lock = threading.Lock()
+
+
+def engines():
+    binds = current_app.config.get('SQLALCHEMY_BINDS') or {}
+    return [db.engines[key] for key in sorted(binds) if key.startswith('replica')]
+
+
+def max_lag():
+    return float(current_app.config.get('REPLICA_MAX_LAG') or DEFAULT_MAX_LAG)
+
+
+def measure(engine):
+    """Seconds the replica is behind the primary, from the heartbeat it
+    holds; None if it cannot be read."""
+    try:
+        with engine.connect() as conn:
+            beat_at = conn.execute(select(ReplicaHeartbeat.beat_at)).scalar()
+    except DBAPIError as e:
+        log.warning("Replica %s unavailable: %s", engine.url, e)
+        return None
+    if beat_at is None:
+        return None
+    return max(0.0, (datetime.utcnow() - beat_at).total_seconds())
+
+
+def lag(engine):
+    now = time.monotonic()
+    with _lock:
+        checked = _lags.get(engine)
+    if checked is None or now - checked[0] >= LAG_CHECK_INTERVAL:
+        checked = (now, measure(engine))
+        with _lock:
+            _lags[engine] = checked
+    return checked[1]
+
+
+def choose():
+    """A replica engine no more than REPLICA_MAX_LAG behind, or None."""
+    limit = max_lag()
+    fresh = []
+    for engine in engines():
+        behind = lag(engine)
+        if behind is not None and behind <= limit:
+            fresh.append(engine)
+    return random.choice(fresh) if fresh else None
+
+
+def use_replica():
+    """Send this app context's reads to a replica; returns the engine, or
+    None when they stay on the primary."""
+    engine = choose()
+    if engine is not None:
+        db.session.info['replica'] = engine
+    return engine
+
+
+def read_only(view):
+    """Route decorator: the view reads from a replica when one is fresh
+    enough. Streamed responses keep it, as the session lives as long as the
+    app context."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.config.get('REPLICA_URLS'):
+            use_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def cache_scope():
+    """Cache key suffix for results read from a replica, which changes every
+    REPLICA_MAX_LAG seconds; empty on the primary."""
+    if not has_app_context() or db.session.info.get('replica') is None:
+        return ''
+    return f":replica{int(time.time() // max_lag())}"
+
+
+# ----------------------------------------
+# Heartbeat
+# ----------------------------------------
+
+def beat():
+    """Stamp the heartbeat row on the primary."""
+    table = ReplicaHeartbeat.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        if conn.execute(update(table).where(table.c.id == 1).values(beat_at=now)).rowcount == 0:
+            conn.execute(insert(table).values(id=1, beat_at=now))
+
+
+def _heartbeat(app):
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            with app.app_context():
+                beat()
+        except Exception as e:
+            log.warning("Could not write the replica heartbeat: %s", e)
+
+
+def init_app(app):
+    if not app.config.get('REPLICA_URLS'):
+        return
+
+    @app.before_request
+    def start_heartbeat():
+        # Started by the first request, so it runs in every worker process
+        # rather than in a parent that forks them
+        with _lock:
+            if app in _beating:
+                return
+            _beating.add(app)
+        threading.Thread(target=_heartbeat, args=(app,), daemon=True,
+                         name='replica-heartbeat').start()
+
+
+def status():
+    """[(url, lag or None)] for every replica, measured now."""
+    return [(engine.url, measure(engine)) for engine in engines()]
+
+
+def sync_sqlite():
+    """Copy the primary into every replica with SQLite's backup API, after a
+    fresh heartbeat: a stand-in for replication when both are SQLite files."""
+    targets = engines()
+    if db.engine.dialect.name != 'sqlite' or any(e.dialect.name != 'sqlite' for e in targets):
+        raise RuntimeError("replica-sync copies SQLite files; use database replication otherwise")
+    beat()
+    source = db.engine.raw_connection()
+    try:
+        for engine in targets:
+            target = engine.raw_connection()
+            try:
+                source.driver_connection.backup(target.driver_connection)
+            finally:
+                target.close()
+    finally:
+        source.close()
+    return len(targets)
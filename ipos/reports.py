@@ -0,0 +1,187 @@
+# ipos/reports.py
+from sqlalchemy import func, select
+from ipos.db import db
+from ipos import archive
+from ipos.pagination import keyset_query, split_page
+from model import Product, Customer, Sale, SaleItem
+
+
+class ReportFilter:
+    def __init__(self, from_date=None, to_date=None, product_id=None):
+        self.from_date = from_date or None
+        self.to_date = to_date or None
+        self.product_id = int(product_id) if product_id else None
+        self.bounds = archive.date_bounds(self.from_date, self.to_date)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.get('from_date'), args.get('to_date'), args.get('product_id'))
+
+    def apply_dates(self, query):
+        if self.from_date:
+            query = query.filter(Sale.date >= self.from_date)
+        if self.to_date:
+            query = query.filter(Sale.date <= self.to_date + " 23:59:59")
+        return query
+
+
+# Each report part is a select() plus a function shaping its rows, so the
+# same statements run on the Flask session and on the async engine
+# (ipos/aio.py).
+
+def totals_stmt(f):
+    return f.apply_dates(select(func.count(Sale.id), func.coalesce(func.sum(Sale.total), 0)))
+
+
+def _totals(rows):
+    count, income = rows[0]
+    return count, round(float(income), 2)
+
+
+def product_sales_stmt(f):
+    query = select(
+        Product.id,
+        Product.name,
+        func.coalesce(func.sum(SaleItem.quantity), 0).label('qty'),
+        func.coalesce(func.sum(SaleItem.quantity * SaleItem.price), 0).label('revenue')
+    ).join(SaleItem, SaleItem.product_id == Product.id)\
+        .join(Sale, SaleItem.sale_id == Sale.id)
+    query = f.apply_dates(query)
+    if f.product_id:
+        query = query.filter(Product.id == f.product_id)
+    return query.group_by(Product.id, Product.name)
+
+
+def _product_sales(rows):
+    return [(name, int(qty), round(float(revenue), 2)) for _, name, qty, revenue in rows]
+
+
+def daily_series_stmt(f):
+    day = func.date(Sale.date).label('day')
+    query = f.apply_dates(select(day, func.count(Sale.id), func.sum(Sale.total)))
+    return query.group_by(day).order_by(day)
+
+
+def _daily_series(rows):
+    return [(str(d), count, round(float(revenue or 0), 2)) for d, count, revenue in rows]
+
+
+def sales_page_stmt(f, cursor=None, limit=50):
+    query = select(
+        Sale.id,
+        Sale.date,
+        Sale.total,
+        Sale.customer_id,
+        Customer.name.label('customer_name')
+    ).outerjoin(Customer, Sale.customer_id == Customer.id)
+    return keyset_query(f.apply_dates(query), Sale.date, Sale.id, cursor, limit)
+
+
+def product_options_stmt():
+    return select(Product.id, Product.name).order_by(Product.name)
+
+
+def _run(stmt):
+    return db.session.execute(stmt).all()
+
+
+def totals(f):
+    return _totals(_run(totals_stmt(f)))
+
+
+def product_sales(f):
+    return _product_sales(_run(product_sales_stmt(f)))
+
+
+def daily_series(f):
+    return _daily_series(_run(daily_series_stmt(f)))
+
+
+def sales_page(f, cursor=None, limit=50):
+    return split_page(_run(sales_page_stmt(f, cursor, limit)), Sale.date, Sale.id, limit)
+
+
+def product_options():
+    return _run(product_options_stmt())
+
+
+def report_statements(f, cursor=None, limit=50):
+    return {
+        "totals": totals_stmt(f),
+        "sales": sales_page_stmt(f, cursor, limit),
+        "product_sales": product_sales_stmt(f),
+        "daily": daily_series_stmt(f),
+        "products": product_options_stmt(),
+    }
+
+
+def _with_archived(rows, archived, limit):
+    """Live rows plus the archived months' (archive.report), merged per part."""
+    (count, income), = rows["totals"]
+    (old_count, old_income), = archived["totals"]
+
+    names = {p.id: p.name for p in rows["products"]}
+    products = {}
+    for pid, name, qty, revenue in [*rows["product_sales"], *archived["product_sales"]]:
+        old = products.get(pid, (None, None, 0, 0))
+        products[pid] = (pid, names.get(pid, name), old[2] + qty, old[3] + revenue)
+
+    days = {}
+    for day, n, revenue in [*rows["daily"], *archived["daily"]]:
+        old = days.get(str(day), (None, 0, 0))
+        days[str(day)] = (str(day), old[1] + n, old[2] + (revenue or 0))
+
+    return dict(rows,
+                totals=[(count + old_count, income + old_income)],
+                sales=sorted([*rows["sales"], *archived["sales"]],
+                             key=lambda r: (r.date, r.id), reverse=True)[:limit + 1],
+                product_sales=list(products.values()),
+                daily=[days[d] for d in sorted(days)])
+
+
+def assemble(rows, limit=50, archived=None):
+    """The report dict from each statement's rows (see report_statements),
+    and from the archived months in range when there are any."""
+    if archived:
+        rows = _with_archived(rows, archived, limit)
+    sale_count, total_income = _totals(rows["totals"])
+    sales, next_cursor = split_page(rows["sales"], Sale.date, Sale.id, limit)
+    return {
+        "sale_count": sale_count,
+        "total_income": total_income,
+        "sales": sales,
+        "next_cursor": next_cursor,
+        "product_sales": _product_sales(rows["product_sales"]),
+        "daily": _daily_series(rows["daily"]),
+        "products": rows["products"]
+    }
+
+
+def build_report(f, cursor=None, limit=50):
+    """Everything /reports and /api/reports show, as SQL aggregates and tuples.
+
+    Cost depends on the number of products, days and the page size, not on
+    how many sales fall inside the range. Archived months come from their
+    Parquet files (ipos/archive.py).
+    """
+    statements = report_statements(f, cursor, limit)
+    return assemble({name: _run(stmt) for name, stmt in statements.items()}, limit,
+                    archive.report(archive.archive_dir(), f, cursor, limit))
+
+
+def report_json(report):
+    return {
+        "sales": [{
+            "id": s.id,
+            "date": s.date.strftime("%Y-%m-%d") if s.date else "No Date",
+            "customer_name": s.customer_name or "Walk-in",
+            "total": float(s.total),
+            "customer_id": s.customer_id
+        } for s in report['sales']],
+        "next_cursor": report['next_cursor'],
+        "sale_count": report['sale_count'],
+        "total_income": report['total_income'],
+        "product_sales": [list(ps) for ps in report['product_sales']],
+        "daily": [list(d) for d in report['daily']],
+        "products": [{"id": p.id, "name": p.name} for p in report['products']]
+    }
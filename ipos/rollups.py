@@ -0,0 +1,81 @@
+# ipos/rollups.py
+from datetime import date
+from sqlalchemy import func, delete, insert
+from ipos.db import db, upsert
+from ipos import archive
+from model import Product, Sale, SaleItem, DailySalesSummary, ProductSalesSummary
+
+
+def _add(*columns):
+    return lambda row, new: {c: row[c] + new[c] for c in columns}
+
+
+def record_sale(sale, lines, prices):
+    # Called inside the checkout transaction, so rollups commit or roll
+    # back together with the sale itself
+    db.session.execute(
+        upsert(DailySalesSummary, ['day'], _add('sales_count', 'items_sold', 'revenue')),
+        [{
+            "day": sale.date.date(),
+            "sales_count": 1,
+            "items_sold": sum(lines.values()),
+            "revenue": sale.total
+        }]
+    )
+    db.session.execute(
+        upsert(ProductSalesSummary, ['product_id'], _add('quantity', 'revenue')),
+        [{
+            "product_id": pid,
+            "quantity": lines[pid],
+            "revenue": round(prices[pid] * lines[pid], 2)
+        } for pid in sorted(lines)]
+    )
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild():
+    """Recompute both rollup tables from the sale and sale_item tables and
+    the archived months."""
+    day = func.date(Sale.date)
+    days = {}
+    for d, count, revenue in db.session.query(day, func.count(Sale.id), func.sum(Sale.total))\
+            .group_by(day):
+        days[_as_date(d)] = {"day": _as_date(d), "sales_count": count,
+                             "items_sold": 0, "revenue": round(revenue or 0, 2)}
+    for d, qty in db.session.query(day, func.sum(SaleItem.quantity))\
+            .join(Sale, SaleItem.sale_id == Sale.id)\
+            .group_by(day):
+        days[_as_date(d)]["items_sold"] = int(qty or 0)
+
+    products = {pid: (int(qty or 0), revenue or 0) for pid, qty, revenue in db.session.query(
+        SaleItem.product_id,
+        func.sum(SaleItem.quantity),
+        func.sum(SaleItem.quantity * SaleItem.price)
+    ).group_by(SaleItem.product_id)}
+
+    archived_days, archived_products = archive.rollup_totals(archive.archive_dir())
+    for d, (count, items, revenue) in archived_days.items():
+        day = days.setdefault(d, {"day": d, "sales_count": 0, "items_sold": 0, "revenue": 0})
+        day["sales_count"] += count
+        day["items_sold"] += items
+        day["revenue"] = round(day["revenue"] + revenue, 2)
+    # Archived sales may name products deleted since
+    existing = {pid for (pid,) in db.session.query(Product.id)}
+    for pid, (qty, revenue) in archived_products.items():
+        if pid in existing:
+            old_qty, old_revenue = products.get(pid, (0, 0))
+            products[pid] = (old_qty + qty, old_revenue + revenue)
+    products = [{"product_id": pid, "quantity": qty, "revenue": round(revenue, 2)}
+                for pid, (qty, revenue) in products.items()]
+
+    db.session.execute(delete(DailySalesSummary))
+    db.session.execute(delete(ProductSalesSummary))
+    if days:
+        db.session.execute(insert(DailySalesSummary), list(days.values()))
+    if products:
+        db.session.execute(insert(ProductSalesSummary), products)
+    db.session.commit()
+    return len(days), len(products)
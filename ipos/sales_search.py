@@ -0,0 +1,179 @@
+# ipos/sales_search.py
+#
+# Receipt lookup for the /sales page. Every filter resolves through an
+# index: customer names through the trigram/FULLTEXT index (ipos/search.py),
+# email and phone by prefix, product names through the product index, and
+# the result is paged newest-first on (date, id). The count and income of
+# the filtered set are cached until the next sale is recorded, as seen by
+# the newest sale id. Archived months (ipos/archive.py) are searched with
+# the same filters: customers and products are resolved through the same
+# indexes, and archived names also match as recorded at archiving time.
+import re
+from sqlalchemy import func, select, text, or_, column
+from ipos.db import db
+from ipos import archive
+from ipos.catalog_cache import catalog, sales_watermark
+from ipos.pagination import keyset_query
+from ipos.search import like_escape
+from model import Product, Customer, Sale, SaleItem, DailySalesSummary, phone_digits
+
+PAGE_SIZE = 50
+PHONE = re.compile(r'\+?[\d\s()-]{4,}')
+
+
+def _prefix(col, term):
+    return col.like(like_escape(term) + '%', escape='\\')
+
+
+def _name_matches(table, name_col, term):
+    """Subquery of ids in ``table`` whose name contains ``term``."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite' and len(term) >= 3:
+        return text(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :q")\
+            .bindparams(q='"' + term.replace('"', '""') + '"').columns(column('rowid'))
+    if dialect == 'mysql':
+        return text(f"SELECT id FROM {table} WHERE MATCH(name) AGAINST (:q IN BOOLEAN MODE)")\
+            .bindparams(q='"' + term.replace('"', '') + '"').columns(column('id'))
+    # Too short for trigrams: names starting with the term
+    return select(name_col.table.c.id).where(_prefix(name_col, term))
+
+
+def customer_matches(term):
+    """Subquery of customer ids matching a name, email or phone fragment."""
+    if '@' in term:
+        return select(Customer.id).where(_prefix(Customer.email, term.lower()))
+    digits = phone_digits(term)
+    if PHONE.fullmatch(term) and digits:
+        # Digits sort below ':', so this range is a prefix match that any
+        # index can seek, unlike LIKE on SQLite
+        return select(Customer.id).where(Customer.phone_digits >= digits,
+                                         Customer.phone_digits < digits + ':')
+    return _name_matches('customer', Customer.name, term)
+
+
+class SalesFilter:
+    def __init__(self, q=None, start_date=None, end_date=None,
+                 min_total=None, max_total=None, product=None):
+        self.q = (q or '').strip() or None
+        self.start_date = start_date or None
+        self.end_date = end_date or None
+        self.min_total = float(min_total) if min_total else None
+        self.max_total = float(max_total) if max_total else None
+        self.product = (product or '').strip() or None
+        self.bounds = archive.date_bounds(self.start_date, self.end_date)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.get('q'), args.get('start_date'), args.get('end_date'),
+                   args.get('min_total'), args.get('max_total'), args.get('product'))
+
+    def key(self):
+        return repr((self.q, self.start_date, self.end_date,
+                     self.min_total, self.max_total, self.product))
+
+    def dates_only(self):
+        return not (self.q or self.product or self.min_total is not None
+                    or self.max_total is not None)
+
+    def apply(self, query):
+        if self.q:
+            order_id = self.q.lstrip('#')
+            if order_id.isdigit() and (self.q.startswith('#') or len(order_id) < 4):
+                query = query.filter(Sale.id == int(order_id))
+            elif order_id.isdigit():
+                # Long numbers are order ids or phone numbers
+                query = query.filter(or_(Sale.id == int(order_id),
+                                         Sale.customer_id.in_(customer_matches(self.q))))
+            else:
+                query = query.filter(Sale.customer_id.in_(customer_matches(self.q)))
+        if self.product:
+            query = query.filter(Sale.id.in_(
+                select(SaleItem.sale_id).where(SaleItem.product_id.in_(
+                    _name_matches('product', Product.name, self.product)))))
+        if self.min_total is not None:
+            query = query.filter(Sale.total >= self.min_total)
+        if self.max_total is not None:
+            query = query.filter(Sale.total <= self.max_total)
+        if self.start_date:
+            query = query.filter(Sale.date >= self.start_date)
+        if self.end_date:
+            query = query.filter(Sale.date <= self.end_date + " 23:59:59")
+        return query
+
+    def archive_match(self):
+        """``match`` for archive.sales_page(): apply() over archived months,
+        or None when only dates are set (sales_page() bounds those)."""
+        if self.dates_only():
+            return None
+        terms = {"min_total": self.min_total, "max_total": self.max_total}
+        if self.q:
+            order_id = self.q.lstrip('#')
+            if order_id.isdigit():
+                terms["sale_id"] = int(order_id)
+            if not (order_id.isdigit() and (self.q.startswith('#') or len(order_id) < 4)):
+                terms["customer_ids"] = _ids(customer_matches(self.q))
+                if '@' not in self.q and not PHONE.fullmatch(self.q):
+                    terms["customer_name"] = self.q
+        if self.product:
+            terms["product_ids"] = _ids(_name_matches('product', Product.name, self.product))
+            terms["product_name"] = self.product
+        return lambda month, sales: archive.filter_sales(archive.archive_dir(), month, sales, **terms)
+
+
+def _ids(subquery):
+    return db.session.execute(subquery).scalars().all()
+
+
+def _archived(f):
+    """(folder, months, match) for the archived part of a search."""
+    folder = archive.archive_dir()
+    found = archive.months(folder, *f.bounds)
+    return folder, found, f.archive_match() if found else None
+
+
+def search_page(f, cursor=None, limit=PAGE_SIZE):
+    query = db.session.query(
+        Sale.id, Sale.date, Sale.total, Sale.customer_id,
+        Customer.name.label('customer_name')
+    ).outerjoin(Customer, Sale.customer_id == Customer.id)
+    rows = keyset_query(f.apply(query), Sale.date, Sale.id, cursor, limit).all()
+    start, end = f.bounds
+    folder, found, match = _archived(f)
+    return archive.merged_page(
+        rows, archive.sales_page(folder, start, end, cursor, limit, found, match=match), limit)
+
+
+def _totals(f):
+    if f.dates_only():
+        # Whole days only: the daily rollup has the answer already
+        query = db.session.query(func.coalesce(func.sum(DailySalesSummary.sales_count), 0),
+                                 func.coalesce(func.sum(DailySalesSummary.revenue), 0))
+        if f.start_date:
+            query = query.filter(DailySalesSummary.day >= f.start_date)
+        if f.end_date:
+            query = query.filter(DailySalesSummary.day <= f.end_date)
+    else:
+        query = f.apply(db.session.query(func.count(Sale.id),
+                                         func.coalesce(func.sum(Sale.total), 0)))
+    count, income = query.one()
+    if not f.dates_only():
+        folder, found, match = _archived(f)
+        archived_count, archived_income = archive.sales_totals(folder, found, *f.bounds, match=match)
+        count, income = count + archived_count, float(income) + archived_income
+    return {"sale_count": int(count), "total_income": round(float(income), 2)}
+
+
+def totals(f):
+    """Count and income of the whole filtered set, cached per filter."""
+    return catalog.cached('sales', 'totals:' + f.key(), lambda: _totals(f),
+                          watermark=sales_watermark())
+
+
+def sale_row(s):
+    return {
+        "id": s.id,
+        "date": s.date.strftime("%Y-%m-%d %H:%M:%S"),
+        "total": float(s.total),
+        "customer_id": s.customer_id,
+        "customer_name": s.customer_name or "Walk-in"
+    }
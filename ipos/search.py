@@ -0,0 +1,101 @@
+# ipos/search.py
+from sqlalchemy import event, text, DDL
+from sqlalchemy.orm import joinedload
+from ipos.db import db
+from ipos.migrations.v0004_product_barcode_search import SQLITE_DDL, MYSQL_DDL
+from ipos.migrations.v0006_sales_search import SQLITE_DDL as CUSTOMER_SQLITE_DDL, \
+    MYSQL_DDL as CUSTOMER_MYSQL_DDL
+from model import Product, Customer
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# The search indexes are defined once, in the migrations that added them,
+# and also created here for a fresh database:
+#   SQLite: an FTS5 trigram index kept in sync with product by triggers
+#     gives substring search for terms of 3+ characters; NOCASE indexes let
+#     case-insensitive LIKE 'term%' use an index seek.
+#   MySQL: InnoDB FULLTEXT with the ngram parser matches inside words too.
+# The same for customer names (used by the sales search), with NOCASE
+# indexes on email and phone for prefix lookups. Phone lookups now go
+# through customer.phone_digits instead (v0013).
+for _table, _sqlite, _mysql in ((Product.__table__, SQLITE_DDL, MYSQL_DDL),
+                                (Customer.__table__, CUSTOMER_SQLITE_DDL, CUSTOMER_MYSQL_DDL)):
+    for _stmt in _sqlite:
+        event.listen(_table, 'after_create', DDL(_stmt).execute_if(dialect='sqlite'))
+    for _stmt in _mysql:
+        event.listen(_table, 'after_create', DDL(_stmt).execute_if(dialect='mysql'))
+
+
+def rebuild_index():
+    """Create the search indexes on an existing database and refill them."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for stmt in SQLITE_DDL + CUSTOMER_SQLITE_DDL:
+            db.session.execute(text(stmt))
+        db.session.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        db.session.execute(text("INSERT INTO customer_fts(customer_fts) VALUES ('rebuild')"))
+    elif dialect == 'mysql':
+        for table, index, stmt in (('product', 'ft_product_name', MYSQL_DDL[0]),
+                                   ('customer', 'ft_customer_name', CUSTOMER_MYSQL_DDL[0]),
+                                   ('customer', 'ix_customer_phone', CUSTOMER_MYSQL_DDL[1])):
+            exists = db.session.execute(text(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = :t "
+                "AND index_name = :i"), {"t": table, "i": index}).scalar()
+            if not exists:
+                db.session.execute(text(stmt))
+    db.session.commit()
+
+
+def parse_limit(value):
+    try:
+        limit = int(value) if value else DEFAULT_LIMIT
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def like_escape(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _substring_ids(term, exclude, limit):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite' and len(term) >= 3:
+        phrase = '"' + term.replace('"', '""') + '"'
+        rows = db.session.execute(text(
+            "SELECT rowid FROM product_fts WHERE product_fts MATCH :q ORDER BY rank LIMIT :n"),
+            {"q": phrase, "n": limit + len(exclude)})
+    elif dialect == 'mysql':
+        rows = db.session.execute(text(
+            "SELECT id FROM product WHERE MATCH(name) AGAINST (:q IN BOOLEAN MODE) LIMIT :n"),
+            {"q": '"' + term.replace('"', '') + '"', "n": limit + len(exclude)})
+    else:
+        # Terms too short for trigrams: a bounded scan that stops at `limit`
+        rows = db.session.query(Product.id)\
+            .filter(Product.name.ilike('%' + like_escape(term) + '%', escape='\\'))\
+            .limit(limit + len(exclude))
+    return [r[0] for r in rows if r[0] not in exclude][:limit]
+
+
+def search_products(term, limit=DEFAULT_LIMIT):
+    """Prefix matches first (index seek on name), then substring matches."""
+    term = (term or '').strip()
+    query = Product.query.options(joinedload(Product.category))
+    if not term:
+        return query.order_by(Product.name).limit(limit).all()
+
+    results = query.filter(Product.name.like(like_escape(term) + '%', escape='\\'))\
+        .order_by(Product.name).limit(limit).all()
+    if len(results) < limit:
+        ids = _substring_ids(term, {p.id for p in results}, limit - len(results))
+        if ids:
+            found = {p.id: p for p in query.filter(Product.id.in_(ids))}
+            results += [found[i] for i in ids if i in found]
+    return results
+
+
+def find_by_barcode(code):
+    return Product.query.options(joinedload(Product.category))\
+        .filter(Product.barcode == code.strip()).first()
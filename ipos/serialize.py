@@ -0,0 +1,155 @@
+# ipos/serialize.py
+#
+# Fast path for list endpoints. Rows are selected as plain tuples with only
+# the columns the API returns (no ORM instances, identity map or lazy loads)
+# and encoded with orjson when it is installed. The dict shapes match the
+# models' to_dict() so clients see the same JSON.
+import json
+from itertools import islice
+from flask import Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+from ipos.db import db
+from ipos import images
+from model import Category, Product, Customer, Sale, SaleItem
+
+try:
+    import orjson  # optional: 3-10x faster than the stdlib encoder
+except ImportError:
+    orjson = None
+
+STREAM_CHUNK = 1000
+NO_IMAGE = "/static/no-image.png"
+
+
+def dumps(obj):
+    """Compact JSON as bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(obj, default=DefaultJSONProvider.default, separators=(",", ":")).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through dumps() above. Dates and other non-JSON types still
+    go through Flask's default(), so output only differs in key order."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def stream_array(rows, chunk_size=STREAM_CHUNK):
+    """JSON array response written ``chunk_size`` elements at a time."""
+    def generate():
+        it = iter(rows)
+        sep = b"["
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+            yield sep + dumps(chunk)[1:-1]
+            sep = b","
+        yield b"]" if sep == b"," else b"[]"
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def _stream(query, chunk_size=STREAM_CHUNK):
+    if chunk_size is None:
+        return db.session.execute(query)
+    return db.session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+
+
+# ---- products -----------------------------------------------------------
+
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.barcode, Product.price, Product.stock,
+                   Product.description, Product.image, Product.category_id, Category.name)
+
+
+def product_row(r):
+    id, name, barcode, price, stock, description, image, category_id, category = r
+    return {
+        "id": id,
+        "name": name,
+        "barcode": barcode or "",
+        "price": price,
+        "stock": stock,
+        "description": description or "",
+        "image": image,
+        "image_url": images.image_url(image) if image else NO_IMAGE,
+        "thumb_url": images.thumb_url(image) if image else NO_IMAGE,
+        "category_id": category_id,
+        "category_name": category if category is not None else "None"
+    }
+
+
+def product_stmt(id=None):
+    query = select(*PRODUCT_COLUMNS).outerjoin(Category, Product.category_id == Category.id)
+    if id is not None:
+        query = query.where(Product.id == id)
+    return query.order_by(Product.id)
+
+
+def products(id=None, chunk_size=None):
+    """Product dicts, as Product.to_dict() would give; lazy when streamed."""
+    return (product_row(r) for r in _stream(product_stmt(id), chunk_size))
+
+
+# ---- customers ----------------------------------------------------------
+
+def customers(id=None, chunk_size=None):
+    query = select(Customer.id, Customer.name, Customer.email, Customer.phone)
+    if id is not None:
+        query = query.where(Customer.id == id)
+    return ({"id": id, "name": name, "email": email or "", "phone": phone or ""}
+            for id, name, email, phone in _stream(query.order_by(Customer.id), chunk_size))
+
+
+# ---- sales --------------------------------------------------------------
+
+def sale_query():
+    """Tuple query for sale list rows; page it with keyset_page()."""
+    return db.session.query(
+        Sale.id, Sale.date, Sale.total, Sale.customer_id,
+        Customer.name.label('customer_name')
+    ).outerjoin(Customer, Sale.customer_id == Customer.id)
+
+
+def sale_items(sale_ids):
+    """{sale_id: [item dict, ...]} for a page of sales, in one query."""
+    items = {}
+    if not sale_ids:
+        return items
+    rows = db.session.execute(
+        select(SaleItem.sale_id, Product.name, SaleItem.quantity, SaleItem.price)
+        .join(Product, SaleItem.product_id == Product.id)
+        .where(SaleItem.sale_id.in_(sale_ids))
+        .order_by(SaleItem.sale_id, SaleItem.id))
+    for sale_id, name, quantity, price in rows:
+        items.setdefault(sale_id, []).append({
+            "product_name": name,
+            "quantity": quantity,
+            "price": float(price),
+            "subtotal": round(quantity * price, 2)
+        })
+    return items
+
+
+def sale_rows(sales):
+    """API dicts for tuples from sale_query(), items included."""
+    items = sale_items([s.id for s in sales])
+    return [{
+        "id": s.id,
+        "date": s.date.strftime("%Y-%m-%d %H:%M:%S"),
+        "total": float(s.total),
+        "customer_id": s.customer_id,
+        "customer_name": s.customer_name or "Walk-in",
+        "items": items.get(s.id, [])
+    } for s in sales]
@@ -1,6 +1,9 @@
 # model.py
+import re
 from ipos.db import db
+from ipos import images
 from datetime import datetime
+from sqlalchemy import select, func
 
 
 class Category(db.Model):
@@ -14,36 +17,54 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'product'
+    __table_args__ = (
+        db.Index('ux_product_barcode', 'barcode', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    barcode = db.Column(db.String(64))  # EAN/UPC or store SKU
     price = db.Column(db.Float, nullable=False)
-    stock = db.Column(db.Integer, default=0)
+    # stock: read-only, from stock_level (defined below); change it through
+    # ipos.inventory so every change lands in the ledger
     description = db.Column(db.Text)
     image = db.Column(db.String(255))  # filename only
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
     category = db.relationship('Category', backref='products')
 
     def to_dict(self):
         return {
             "id": self.id,
             "name": self.name,
+            "barcode": self.barcode or "",
             "price": self.price,
             "stock": self.stock,
             "description": self.description or "",
             "image": self.image,
-            "image_url": f"/static/uploads/{self.image}"
+            "image_url": images.image_url(self.image)
+                         if self.image else "/static/no-image.png",
+            "thumb_url": images.thumb_url(self.image)
                          if self.image else "/static/no-image.png",
             "category_id": self.category_id,
             "category_name": self.category.name if self.category else "None"
         }
 
 
+def phone_digits(phone):
+    """Customer.phone_digits for a phone number: its digits, or None."""
+    return re.sub(r'\D', '', phone or '') or None
+
+
 class Customer(db.Model):
     __tablename__ = 'customer'
+    __table_args__ = (
+        db.Index('ix_customer_phone_digits', 'phone_digits'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True)
     phone = db.Column(db.String(20))
+    # Digits of phone only, for lookups however the number was typed
+    phone_digits = db.Column(db.String(20))
 
     def to_dict(self):
         return {
@@ -56,10 +77,16 @@ class Customer(db.Model):
 
 class Sale(db.Model):
     __tablename__ = 'sale'
+    __table_args__ = (
+        db.Index('ix_sale_date_id', 'date', 'id'),
+        db.Index('ix_sale_customer_date_id', 'customer_id', 'date', 'id'),
+        db.Index('ux_sale_client_key', 'client_key', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))
     date = db.Column(db.DateTime, default=datetime.utcnow)
     total = db.Column(db.Float, default=0.0)
+    client_key = db.Column(db.String(64))  # till-generated idempotency key
     customer = db.relationship('Customer', backref='sales')
     items = db.relationship('SaleItem', backref='sale', lazy=True)
 
@@ -79,8 +106,8 @@ class Sale(db.Model):
 class SaleItem(db.Model):
     __tablename__ = 'sale_item'
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
 
@@ -95,4 +122,151 @@ class SaleItem(db.Model):
         }
 
     def __repr__(self):
-        return f"<SaleItem {self.product.name} x{self.quantity}>"
\ No newline at end of file
+        return f"<SaleItem {self.product.name} x{self.quantity}>"
+
+
+class DailySalesSummary(db.Model):
+    __tablename__ = 'daily_sales_summary'
+    day = db.Column(db.Date, primary_key=True)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ProductSalesSummary(db.Model):
+    __tablename__ = 'product_sales_summary'
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0, index=True)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    product = db.relationship('Product')
+
+
+
+class StockLevel(db.Model):
+    """Current stock per product, kept in step with the stock_movement ledger."""
+    __tablename__ = 'stock_level'
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    reorder_level = db.Column(db.Integer, nullable=False, default=0)
+    # reorder_level - quantity, updated with every movement; >= 0 means at or
+    # below the reorder level, so low stock is an index range scan
+    shortfall = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movement'
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_id_id', 'product_id', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign keys: the ledger outlives deleted products and archived sales
+    product_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # sale, restock, adjustment, return
+    quantity = db.Column(db.Integer, nullable=False)  # signed change in stock
+    sale_id = db.Column(db.Integer)
+    note = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "product_id": self.product_id,
+            "kind": self.kind,
+            "quantity": self.quantity,
+            "sale_id": self.sale_id,
+            "note": self.note or "",
+            "created_at": self.created_at.isoformat()
+        }
+
+
+class StockSnapshot(db.Model):
+    """A product's stock as of ledger entry ``movement_id`` (inclusive)."""
+    __tablename__ = 'stock_snapshot'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    movement_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ReplicaHeartbeat(db.Model):
+    """One row the primary stamps every second while read replicas are
+    configured; its age on a replica is that replica's lag."""
+    __tablename__ = 'replica_heartbeat'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+
+class Job(db.Model):
+    """A report or export run by the background workers (ipos/jobs.py)."""
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # report, export
+    params = db.Column(db.Text, nullable=False)  # JSON
+    # Hash of kind and params while queued or running, NULL once finished:
+    # the unique index keeps one identical job in flight at a time
+    active_key = db.Column(db.String(64), unique=True)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(255))
+    artifact = db.Column(db.String(64))  # file name under JOB_DIR
+    filename = db.Column(db.String(255))  # download name
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+
+
+class CustomerStats(db.Model):
+    """A customer's lifetime purchases, kept by checkout (ipos/customer_stats.py);
+    there is a row once the customer has bought anything."""
+    __tablename__ = 'customer_stats'
+    __table_args__ = (
+        db.Index('ix_customer_stats_total_spent', 'total_spent', 'customer_id'),
+        db.Index('ix_customer_stats_order_count', 'order_count', 'customer_id'),
+        db.Index('ix_customer_stats_last_purchase', 'last_purchase', 'customer_id'),
+    )
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True, autoincrement=False)
+    order_count = db.Column(db.Integer, nullable=False)
+    total_spent = db.Column(db.Float, nullable=False)
+    first_purchase = db.Column(db.DateTime, nullable=False)
+    last_purchase = db.Column(db.DateTime, nullable=False)
+    # No foreign key: archived sales may name products deleted since
+    favourite_product_id = db.Column(db.Integer)
+    favourite_quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CustomerProductStats(db.Model):
+    """Units of each product a customer has bought; picks the favourite."""
+    __tablename__ = 'customer_product_stats'
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True, autoincrement=False)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+
+class CacheVersion(db.Model):
+    """Version of a cached collection (ipos/catalog_cache.py), shared by
+    every worker process; bumped whenever its data changes."""
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DatabaseIdentity(db.Model):
+    """One row: a random token made with this database, naming the files
+    kept outside it (receipts) so another database never reads them."""
+    __tablename__ = 'database_identity'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    token = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+Product.stock = db.column_property(func.coalesce(
+    select(StockLevel.quantity).where(StockLevel.product_id == Product.id)
+    .correlate_except(StockLevel).scalar_subquery(), 0))
+Product.level = db.relationship(StockLevel, uselist=False, cascade='all, delete-orphan')
@@ -0,0 +1,7 @@
+# wsgi.py
+#
+# WSGI entry point for a multi-worker server; sizing comes from POS_PROFILE
+# (see ipos/config.py and gunicorn.conf.py):
+#
+#   POS_PROFILE=production gunicorn -c gunicorn.conf.py wsgi:app
+from app import app